@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks of the pure-Python hot paths around LibreOffice.
+
+They run without soffice, `fakeoffice` stands in for the `uno` module, so the
+numbers are the cost of our own code: JSON-RPC parsing, base64, the spool,
+the preflight, the Cleaner and a whole `convert` against an instant office.
+
+    python bench/bench_hotpaths.py [--size-mb 8] [--repeat 5] [--only base64_decode] [--output bench_output.txt]
+
+Each result is one JSON line with the benchmark name, its parameters, the
+min/mean/max seconds of the runs and the throughput in MB/s.
+"""
+import argparse
+import base64
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+from time import perf_counter
+
+BENCH_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIRECTORY)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIRECTORY), 'src'))
+
+import fakeoffice  # noqa: E402
+from documents import make_document  # noqa: E402
+
+fakeoffice.install()
+
+MB = 1024 * 1024
+UPLOAD_CHUNK = 1024 * 1024  # characters of base64 per upload call
+
+benchmarks = {}
+
+
+def benchmark(name: str):
+    """ Register a benchmark: a function of the options returning (callable, bytes processed, parameters). """
+    def decorator(function):
+        benchmarks[name] = function
+        return function
+    return decorator
+
+
+def make_services(spool_directory: str):
+    from AerooServices import AerooServices
+    from OfficePool import OfficePool
+    return AerooServices(spool_directory=spool_directory, office_pool=OfficePool(1))
+
+
+@benchmark('base64_decode')
+def bench_base64_decode(options, workdir):
+    encoded = base64.b64encode(os.urandom(options.size_mb * MB))
+    return (lambda: base64.b64decode(encoded)), options.size_mb * MB, {'size_mb': options.size_mb}
+
+
+@benchmark('base64_encode')
+def bench_base64_encode(options, workdir):
+    data = os.urandom(options.size_mb * MB)
+    return (lambda: base64.b64encode(data).decode('utf8')), options.size_mb * MB, {'size_mb': options.size_mb}
+
+
+@benchmark('jsonrpc_call')
+def bench_jsonrpc_call(options, workdir):
+    from ExtendedJsonRpcApplication import ExtendedJsonRpcApplication
+    payload = base64.b64encode(os.urandom(options.size_mb * MB)).decode('utf8')
+    # The method answers a payload of the same size, like convert does
+    app = ExtendedJsonRpcApplication(rpcs={'echo': lambda data, client_id: data})
+    body = json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'echo', 'params': {'data': payload}}).encode('utf-8')
+
+    def run():
+        environ = {
+            'REQUEST_METHOD': 'POST',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(body)),
+            'REMOTE_ADDR': '127.0.0.1',
+            'wsgi.input': io.BytesIO(body),
+        }
+        return b''.join(item if isinstance(item, bytes) else item.encode('utf-8')
+                        for item in app(environ, lambda status, headers: None))
+    return run, len(body), {'size_mb': options.size_mb}
+
+
+@benchmark('upload_append')
+def bench_upload_append(options, workdir):
+    services = make_services(workdir)
+    encoded = base64.b64encode(os.urandom(options.size_mb * MB)).decode('utf8')
+    chunks = [encoded[position:position + UPLOAD_CHUNK] for position in range(0, len(encoded), UPLOAD_CHUNK)]
+
+    def run():
+        identifier = ''
+        for index, chunk in enumerate(chunks):
+            identifier = services.upload(chunk, index == len(chunks) - 1, identifier)['identifier']
+        return identifier
+    return run, options.size_mb * MB, {'size_mb': options.size_mb, 'chunks': len(chunks)}
+
+
+@benchmark('preflight')
+def bench_preflight(options, workdir):
+    from Preflight import estimate_cost
+    document = make_document(options.size_mb * MB, images=options.images)
+    return (lambda: estimate_cost(document)), len(document), {'size_mb': options.size_mb, 'images': options.images}
+
+
+@benchmark('read_files_join')
+def bench_read_files_join(options, workdir):
+    services = make_services(workdir)
+    part = base64.b64encode(os.urandom(options.size_mb * MB // options.parts)).decode('utf8')
+    names = [services.spool.name(services.upload(part, True)['identifier']) for _ in range(options.parts)]
+    return (lambda: sum(len(data) for data in services._readFiles(names))), options.size_mb * MB, \
+        {'size_mb': options.size_mb, 'parts': options.parts}
+
+
+@benchmark('cleaner_scan')
+def bench_cleaner_scan(options, workdir):
+    from Cleaner import Cleaner
+    for index in range(options.files):
+        with open(os.path.join(workdir, '_%032x' % index), 'w') as chunk:
+            chunk.write('x')
+    cleaner = Cleaner(spool_directory=workdir)
+    cleaner.resync()
+    return cleaner.clean, 0, {'files': options.files}
+
+
+@benchmark('cleaner_resync')
+def bench_cleaner_resync(options, workdir):
+    from Cleaner import Cleaner
+    for index in range(options.files):
+        with open(os.path.join(workdir, '_%032x' % index), 'w') as chunk:
+            chunk.write('x')
+    return Cleaner(spool_directory=workdir).resync, 0, {'files': options.files}
+
+
+@benchmark('convert_fake_office')
+def bench_convert_fake_office(options, workdir):
+    services = make_services(workdir)
+    encoded = base64.b64encode(make_document(options.size_mb * MB, images=options.images)).decode('utf8')
+    return (lambda: services.convert(encoded, in_mime='odt', out_mime='pdf')), len(encoded) * 3 // 4, \
+        {'size_mb': options.size_mb, 'images': options.images}
+
+
+def measure(name: str, options) -> dict:
+    workdir = tempfile.mkdtemp(prefix='aeroo-bench-')
+    try:
+        try:
+            run, size, parameters = benchmarks[name](options, workdir)
+        except ImportError as e:
+            return {'name': name, 'skipped': str(e)}
+        run()  # warm up
+        times = []
+        for _ in range(options.repeat):
+            start = perf_counter()
+            run()
+            times.append(perf_counter() - start)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    result = {
+        'name': name,
+        'parameters': parameters,
+        'repeat': options.repeat,
+        'min': round(min(times), 6),
+        'mean': round(sum(times) / len(times), 6),
+        'max': round(max(times), 6),
+    }
+    if size:
+        result['mb_per_s'] = round(size / MB / min(times), 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=8, help='Size of the documents (default 8)')
+    parser.add_argument('--images', type=int, default=200, help='Images in the generated documents (default 200)')
+    parser.add_argument('--parts', type=int, default=50, help='Documents of a join (default 50)')
+    parser.add_argument('--files', type=int, default=20000, help='Files in the spool for the Cleaner (default 20000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Measured runs of each benchmark (default 5)')
+    parser.add_argument('--only', action='append', choices=sorted(benchmarks), help='Run only these benchmarks')
+    parser.add_argument('--output', help='Also append the results to this file')
+    options = parser.parse_args()
+
+    logging.getLogger('main').setLevel(logging.INFO)
+    output = open(options.output, 'a') if options.output else None
+    try:
+        for name in options.only or benchmarks:
+            line = json.dumps(measure(name, options))
+            print(line, flush=True)
+            if output:
+                output.write(line + '\n')
+    finally:
+        if output:
+            output.close()
+
+
+if __name__ == '__main__':
+    main()
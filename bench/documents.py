@@ -0,0 +1,54 @@
+"""
+Generated OpenDocument text files for the benchmarks and the load generator.
+
+The documents are valid for LibreOffice, so the same files work against the
+fake office and against a real pool.
+"""
+import io
+import os
+import zipfile
+
+ROW = '<table:table-row><table:table-cell><text:p>%08d</text:p></table:table-cell></table:table-row>'
+ROW_SIZE = len(ROW % 0)
+
+CONTENT = ('<?xml version="1.0" encoding="UTF-8"?>'
+           '<office:document-content xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"'
+           ' xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0"'
+           ' xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" office:version="1.2">'
+           '<office:body><office:text><table:table table:name="t"><table:table-column/>%s</table:table>'
+           '</office:text></office:body></office:document-content>')
+
+META = ('<?xml version="1.0" encoding="UTF-8"?>'
+        '<office:document-meta xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"'
+        ' xmlns:meta="urn:oasis:names:tc:opendocument:xmlns:meta:1.0" office:version="1.2">'
+        '<office:meta><meta:document-statistic meta:page-count="%s"/></office:meta></office:document-meta>')
+
+MANIFEST = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0"'
+            ' manifest:version="1.2">'
+            '<manifest:file-entry manifest:full-path="/"'
+            ' manifest:media-type="application/vnd.oasis.opendocument.text"/>'
+            '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+            '<manifest:file-entry manifest:full-path="meta.xml" manifest:media-type="text/xml"/>'
+            '%s</manifest:manifest>')
+
+IMAGE_ENTRY = '<manifest:file-entry manifest:full-path="Pictures/image%s.png" manifest:media-type="image/png"/>'
+IMAGE_SIZE = 2048
+
+
+def make_document(size: int, images: int = 0) -> bytes:
+    """ An odt of about size bytes of uncompressed content: one table and, optionally, images.
+
+    The rows are numbered so the content does not compress to nothing, the
+    images are random bytes listed in the manifest but not shown.
+    """
+    rows = max((size - images * IMAGE_SIZE) // ROW_SIZE, 1)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as outzip:
+        outzip.writestr('mimetype', 'application/vnd.oasis.opendocument.text', zipfile.ZIP_STORED)
+        outzip.writestr('content.xml', CONTENT % ''.join(ROW % index for index in range(rows)))
+        outzip.writestr('meta.xml', META % max(rows // 40, 1))
+        outzip.writestr('META-INF/manifest.xml', MANIFEST % ''.join(IMAGE_ENTRY % index for index in range(images)))
+        for index in range(images):
+            outzip.writestr('Pictures/image%s.png' % index, os.urandom(IMAGE_SIZE), zipfile.ZIP_STORED)
+    return buffer.getvalue()
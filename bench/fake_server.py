@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+"""
+Run the service on :8989 against the fake office, for load tests without LibreOffice.
+
+    FAKE_LOAD_DELAY=0.2 FAKE_EXPORT_DELAY=0.3 OFFICE_INSTANCES=4 python bench/fake_server.py
+
+FAKE_LOAD_DELAY and FAKE_EXPORT_DELAY are the seconds each document spends
+being loaded and exported, FAKE_DELAY_PER_MB adds seconds per MB of input. The
+other variables are the ones of the real service (see the README).
+"""
+import os
+import sys
+
+BENCH_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIRECTORY)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIRECTORY), 'src'))
+
+import fakeoffice  # noqa: E402
+
+fakeoffice.install()
+
+import main  # noqa: E402
+
+if __name__ == '__main__':
+    fakeoffice.settings.load_delay = float(os.environ.get('FAKE_LOAD_DELAY', 0))
+    fakeoffice.settings.export_delay = float(os.environ.get('FAKE_EXPORT_DELAY', 0))
+    fakeoffice.settings.delay_per_mb = float(os.environ.get('FAKE_DELAY_PER_MB', 0))
+    # Restarts have no office to launch
+    main.OfficeSupervisor = fakeoffice.FakeSupervisor
+    main.main()
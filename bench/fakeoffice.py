@@ -0,0 +1,285 @@
+"""
+Stand-in for the `uno` module and the LibreOffice UNO API.
+
+`install()` registers fake `uno`, `unohelper` and `com.sun.star.*` modules, so
+`StarOfficeClient` and everything above it run without soffice. The fake office
+answers every document with a "converted" copy of it and can simulate the time
+LibreOffice spends loading and exporting.
+"""
+import sys
+import time
+import types
+
+CHUNK_SIZE = 64 * 1024  # LibreOffice writes its output in blocks
+
+
+class FakeOfficeSettings():
+    load_delay = 0.0  # seconds per document loaded
+    export_delay = 0.0  # seconds per document exported
+    delay_per_mb = 0.0  # extra seconds per MB of input
+
+
+settings = FakeOfficeSettings()
+
+
+class _UnoException(Exception):
+    pass
+
+
+class ByteSequence():
+
+    def __init__(self, value):
+        self.value = bytes(value)
+
+    def __len__(self):
+        return len(self.value)
+
+
+class PropertyValue():
+    Name = None
+    Value = None
+
+
+def _properties(props) -> dict:
+    return {prop.Name: prop.Value for prop in props}
+
+
+def _readStream(stream) -> bytes:
+    if hasattr(stream, 'data'):
+        return stream.data
+    # XInputStream implemented in Python, read it like LibreOffice does
+    chunks = []
+    while True:
+        read, sequence = stream.readBytes(None, CHUNK_SIZE)
+        if not read:
+            break
+        chunks.append(sequence.value)
+    return b''.join(chunks)
+
+
+def _sleep(delay: float, data: bytes):
+    delay += settings.delay_per_mb * len(data) / (1024 * 1024)
+    if delay:
+        time.sleep(delay)
+
+
+class _SequenceInputStream():
+
+    def initialize(self, args):
+        self.data = args[0].value
+
+    def closeInput(self):
+        pass
+
+
+class _ElementNames():
+
+    def getElementNames(self):
+        return ('Default',)
+
+
+class _StyleFamilies():
+
+    def getByName(self, name):
+        return _ElementNames()
+
+
+class _TextCursor():
+    PageDescName = None
+    TextSection = None
+    PageNumberOffset = 1
+
+    def __getattr__(self, name):
+        # gotoStart, gotoEnd, gotoStartOfParagraph...
+        return lambda *args: None
+
+
+class _TextRange():
+
+    def __init__(self, document):
+        self.document = document
+
+    def insertDocumentFromURL(self, url, props):
+        data = _readStream(_properties(props)['InputStream'])
+        _sleep(settings.load_delay, data)
+        self.document.data += data
+
+
+class _Text():
+
+    def __init__(self, document):
+        self.document = document
+
+    def createTextCursor(self):
+        return _TextCursor()
+
+    def insertControlCharacter(self, *args):
+        pass
+
+    def insertTextContentAfter(self, *args):
+        pass
+
+    def getEnd(self):
+        return _TextRange(self.document)
+
+
+class _Indexes():
+
+    def getCount(self):
+        return 0
+
+
+class _Document():
+    StyleFamilies = _StyleFamilies()
+
+    def __init__(self, data: bytes):
+        self.data = data
+        self.Text = _Text(self)
+
+    def storeToURL(self, url, props):
+        properties = _properties(props)
+        _sleep(settings.export_delay, self.data)
+        output = properties['OutputStream']
+        result = b'%PDF-1.4\n' + self.data
+        for position in range(0, len(result), CHUNK_SIZE):
+            output.writeBytes(ByteSequence(result[position:position + CHUNK_SIZE]))
+        output.closeOutput()
+
+    def updateLinks(self):
+        pass
+
+    def refresh(self):
+        pass
+
+    def getDocumentIndexes(self):
+        return _Indexes()
+
+    def createInstance(self, name):
+        return object()
+
+    def close(self, deliver):
+        pass
+
+
+class _Desktop():
+
+    def getCurrentComponent(self):
+        return None
+
+    def terminate(self):
+        return True
+
+    def loadComponentFromURL(self, url, frame, flags, props):
+        stream = _properties(props).get('InputStream')
+        if stream is None:
+            return _Document(b'')
+        data = _readStream(stream)
+        _sleep(settings.load_delay, data)
+        return _Document(data)
+
+
+class _ServiceManager():
+
+    def createInstanceWithContext(self, name, context):
+        if name == 'com.sun.star.bridge.UnoUrlResolver':
+            return _Resolver()
+        if name == 'com.sun.star.io.SequenceInputStream':
+            return _SequenceInputStream()
+        if name == 'com.sun.star.frame.Desktop':
+            return _Desktop()
+        raise _UnoException('Unknown service %s' % name)
+
+
+class _ComponentContext():
+    ServiceManager = _ServiceManager()
+
+
+class _Resolver():
+
+    def resolve(self, url):
+        return _ComponentContext()
+
+
+class FakeSupervisor():
+    """ Stand-in for OfficeSupervisor, the fake office has no process and is always ready. """
+
+    def __init__(self, binary: str = '', template: str = '', start_timeout: float = 60.0, policy=None):
+        self.start_timeout = start_timeout
+        self.policy = policy
+        self._running = set()
+        self._conversions = {}
+
+    def start(self, office):
+        self._running.add(office.process)
+        self._conversions[office.process] = 0
+        return office.process
+
+    def stop(self, office):
+        self._running.discard(office.process)
+
+    def stop_all(self):
+        self._running.clear()
+
+    def pid(self, office):
+        return None
+
+    def running(self, office) -> bool:
+        return office.process in self._running
+
+    def probe(self, office) -> bool:
+        return self.running(office)
+
+    def wait_ready(self, office, timeout=None) -> bool:
+        return self.running(office)
+
+    def wait_exit(self, office, timeout: float) -> bool:
+        self.stop(office)
+        return True
+
+    def record_conversion(self, office):
+        self._conversions[office.process] = self._conversions.get(office.process, 0) + 1
+
+    def recycle_reason(self, office):
+        if self.policy is None:
+            return None
+        return self.policy.reason(self._conversions.get(office.process, 0), None)
+
+    def stats(self, office) -> dict:
+        return {'pid': None, 'conversions': self._conversions.get(office.process, 0)}
+
+
+def _module(name: str, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+
+def install():
+    """ Register the fake UNO modules, must run before importing StarOfficeClient. """
+    _module('uno',
+            ByteSequence=ByteSequence,
+            Any=lambda type_name, value: value,
+            getComponentContext=lambda: _ComponentContext(),
+            systemPathToFileUrl=lambda path: 'file://' + path)
+    _module('unohelper', Base=type('Base', (), {}))
+    for name in ('com', 'com.sun', 'com.sun.star'):
+        _module(name)
+    _module('com.sun.star.text', ControlCharacter=types.SimpleNamespace(APPEND_PARAGRAPH=5))
+    _module('com.sun.star.document',
+            MacroExecMode=types.SimpleNamespace(NEVER_EXECUTE=0),
+            UpdateDocMode=types.SimpleNamespace(QUIET_UPDATE=1))
+    _module('com.sun.star.io',
+            XOutputStream=type('XOutputStream', (), {}),
+            XInputStream=type('XInputStream', (), {}),
+            XSeekable=type('XSeekable', (), {}))
+    _module('com.sun.star.lang',
+            IllegalArgumentException=type('IllegalArgumentException', (_UnoException,), {}),
+            DisposedException=type('DisposedException', (_UnoException,), {}))
+    _module('com.sun.star.beans',
+            UnknownPropertyException=type('UnknownPropertyException', (_UnoException,), {}),
+            PropertyValue=PropertyValue)
+    _module('com.sun.star.connection',
+            NoConnectException=type('NoConnectException', (_UnoException,), {}),
+            ConnectionSetupException=type('ConnectionSetupException', (_UnoException,), {}))
+    _module('com.sun.star.uno', RuntimeException=type('RuntimeException', (_UnoException,), {}))
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+"""
+Load generator for the JSON-RPC server, against real LibreOffice or bench/fake_server.py.
+
+Synthetic load, 20 requests/s arriving as a Poisson process for one minute:
+
+    python bench/loadgen.py --rate 20 --duration 60 --concurrency 32 --mix convert=6,join=1,upload=3
+
+Closed loop, each of the 8 workers sends its next request as soon as the previous one answers:
+
+    python bench/loadgen.py --concurrency 8 --requests 500
+
+Replay of a trace, twice as fast as recorded:
+
+    python bench/loadgen.py --trace production.jsonl --speed 2
+
+A trace has one JSON request per line, every key but `t` is optional:
+
+    {"t": 0.25, "method": "join", "size": 180000, "parts": 12, "in_mime": "odt", "out_mime": "pdf", "client_id": "db1"}
+
+`t` is the second the request started, from the start of the trace. `--save-trace`
+writes the requests of a synthetic run in that format, to replay the same load.
+
+Latencies are measured from the time a request was due, not from the time a
+worker picked it, so a saturated server shows up in the percentiles instead of
+silently lowering the arrival rate.
+"""
+import argparse
+import base64
+import itertools
+import json
+import math
+import os
+import queue
+import random
+import sys
+import threading
+import urllib.error
+import urllib.request
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from documents import make_document  # noqa: E402
+
+# The generated documents are ODF text, the pairs only vary the export filter
+DEFAULT_MIMES = 'odt:pdf,odt:pdf,odt:pdf,odt:doc,odt:odt'
+UPLOAD_CHUNK = 512 * 1024  # characters of base64 per upload call, like the Odoo module
+
+
+class Request():
+    """ One load test request, synthetic or read from a trace. """
+
+    def __init__(self, t: float, method: str = 'convert', size: int = 50000, parts: int = 1,
+                 in_mime: str = 'odt', out_mime: str = 'pdf', client_id: str = 'loadgen'):
+        self.t = t
+        self.method = method
+        self.size = size
+        self.parts = parts
+        self.in_mime = in_mime
+        self.out_mime = out_mime
+        self.client_id = client_id
+
+    def as_dict(self) -> dict:
+        return dict(self.__dict__, t=round(self.t, 6))
+
+
+class Result():
+
+    def __init__(self, method: str, latency: float, status: str, size: int, error: str = '', value=None):
+        self.method = method
+        self.latency = latency
+        self.status = status  # ok, error or timeout
+        self.size = size
+        self.error = error
+        self.value = value  # answer of the call, the identifier of an upload
+
+
+class RpcError(Exception):
+    pass
+
+
+class Client():
+    """ JSON-RPC calls over urllib, one HTTP request each. """
+
+    def __init__(self, url: str, timeout: float):
+        self.url = url
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+
+    def call(self, method: str, **params):
+        body = json.dumps({'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params})
+        http_request = urllib.request.Request(self.url, data=body.encode('utf-8'),
+                                              headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+                answer = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            answer = json.loads(e.read() or b'{}')
+            if 'error' not in answer:
+                raise RpcError('HTTP %s' % e.code)
+        if 'error' in answer:
+            error = answer['error']
+            raise RpcError(str(error.get('data') or error.get('message')))
+        return answer.get('result')
+
+    def upload(self, document: bytes, client_id: str) -> str:
+        data = base64.b64encode(document).decode('utf8')
+        identifier = ''
+        for position in range(0, len(data), UPLOAD_CHUNK):
+            result = self.call('upload', data=data[position:position + UPLOAD_CHUNK],
+                               is_last=position + UPLOAD_CHUNK >= len(data),
+                               identifier=identifier, client_id=client_id)
+            identifier = result['identifier']
+        return identifier
+
+
+class Documents():
+    """ Generated documents by size, rounded so a long run reuses them. """
+
+    def __init__(self):
+        self._documents: dict[int, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, size: int) -> bytes:
+        size = int(2 ** round(math.log2(max(size, 1024)), 1))
+        with self._lock:
+            if size not in self._documents:
+                self._documents[size] = make_document(size)
+            return self._documents[size]
+
+
+def run_request(client: Client, documents: Documents, request: Request) -> list[Result]:
+    """ Send one request, a join first uploads its parts, and return the timed calls. """
+    results = []
+    document = documents.get(request.size)
+    if request.method in ('upload', 'join'):
+        idents = []
+        for _ in range(request.parts if request.method == 'join' else 1):
+            results.append(timed(client.upload, 'upload', len(document), document, request.client_id))
+            if results[-1].status != 'ok':
+                return results
+            idents.append(results[-1].value)
+        if request.method == 'join':
+            results.append(timed(client.call, 'join', len(document) * len(idents), 'join', idents=idents,
+                                 in_mime=request.in_mime, out_mime=request.out_mime,
+                                 client_id=request.client_id))
+    else:
+        data = base64.b64encode(document).decode('utf8')
+        results.append(timed(client.call, 'convert', len(document), 'convert', data=data,
+                             in_mime=request.in_mime, out_mime=request.out_mime, client_id=request.client_id))
+    return results
+
+
+def timed(function, method: str, size: int, *args, **kwargs) -> Result:
+    start = perf_counter()
+    try:
+        value = function(*args, **kwargs)
+        result = Result(method, perf_counter() - start, 'ok', size, value=value)
+    except (RpcError, OSError) as e:
+        # Socket timeouts and TimeoutExeption of the server both count as timeouts
+        status = 'timeout' if 'timed out' in str(e).lower() or 'timeout' in str(e).lower() else 'error'
+        result = Result(method, perf_counter() - start, status, size, str(e)[:200])
+    return result
+
+
+def synthetic(options) -> list[Request]:
+    """ Requests of a synthetic run, due at Poisson arrivals of options.rate per second. """
+    rng = random.Random(options.seed)
+    mix = [(method, float(weight)) for method, weight in
+           (item.split('=') for item in options.mix.split(','))]
+    mimes = [item.split(':') for item in options.mimes.split(',')]
+    count = options.requests or (int(options.duration * options.rate) if options.rate else 0)
+    requests = []
+    t = 0.0
+    for _ in range(count):
+        method = rng.choices([method for method, _ in mix], [weight for _, weight in mix])[0]
+        in_mime, out_mime = rng.choice(mimes)
+        # Report sizes are long tailed: most are small, a few are huge
+        size = int(min(rng.lognormvariate(math.log(options.size_kb * 1024), options.size_sigma),
+                       options.max_size_kb * 1024))
+        requests.append(Request(t, method, size, rng.randint(2, options.max_parts), in_mime, out_mime,
+                                'loadgen-%s' % rng.randrange(options.clients)))
+        if options.rate:
+            t += rng.expovariate(options.rate)
+    return requests
+
+
+def read_trace(path: str) -> list[Request]:
+    with open(path) as trace:
+        requests = [Request(**json.loads(line)) for line in trace if line.strip()]
+    return sorted(requests, key=lambda request: request.t)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """ Nearest-rank percentile of sorted values. """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+def summarize(results: list[Result], elapsed: float) -> dict:
+    summary = {'elapsed': round(elapsed, 3), 'methods': {}}
+    for method in sorted({result.method for result in results}):
+        selected = [result for result in results if result.method == method]
+        latencies = sorted(result.latency for result in selected if result.status == 'ok')
+        ok = len(latencies)
+        summary['methods'][method] = {
+            'count': len(selected),
+            'ok': ok,
+            'throughput': round(ok / elapsed, 3) if elapsed else 0.0,
+            'mb_per_s': round(sum(result.size for result in selected if result.status == 'ok')
+                              / 1024 / 1024 / elapsed, 3) if elapsed else 0.0,
+            'error_rate': round(sum(result.status == 'error' for result in selected) / len(selected), 4),
+            'timeout_rate': round(sum(result.status == 'timeout' for result in selected) / len(selected), 4),
+            'mean': round(sum(latencies) / ok, 4) if ok else 0.0,
+            'p50': round(percentile(latencies, 0.50), 4),
+            'p95': round(percentile(latencies, 0.95), 4),
+            'p99': round(percentile(latencies, 0.99), 4),
+            'max': round(latencies[-1], 4) if ok else 0.0,
+        }
+        errors = sorted({result.error for result in selected if result.error})
+        if errors:
+            summary['methods'][method]['errors'] = errors[:5]
+    return summary
+
+
+def print_summary(summary: dict):
+    print('%-8s %7s %7s %8s %7s %7s %8s %8s %8s %8s' % (
+        'method', 'count', 'ok', 'req/s', 'errors', 'timeout', 'p50', 'p95', 'p99', 'max'), file=sys.stderr)
+    for method, stats in summary['methods'].items():
+        print('%-8s %7s %7s %8.2f %6.2f%% %6.2f%% %8.3f %8.3f %8.3f %8.3f' % (
+            method, stats['count'], stats['ok'], stats['throughput'], stats['error_rate'] * 100,
+            stats['timeout_rate'] * 100, stats['p50'], stats['p95'], stats['p99'], stats['max']), file=sys.stderr)
+        for error in stats.get('errors', []):
+            print('         %s' % error, file=sys.stderr)
+    print('elapsed %s s' % summary['elapsed'], file=sys.stderr)
+
+
+def run(options, requests: list[Request]) -> dict:
+    client = Client(options.url, options.timeout)
+    documents = Documents()
+    for request in requests:
+        # Generate the documents before the clock starts
+        documents.get(request.size)
+    pending = queue.Queue()
+    results: list[Result] = []
+    lock = threading.Lock()
+    open_loop = bool(options.trace or options.rate)
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            request, due = item
+            start = perf_counter()
+            request_results = run_request(client, documents, request)
+            if open_loop:
+                # Add the time the request waited for a free worker
+                request_results[0].latency += max(0.0, start - due)
+            with lock:
+                results.extend(request_results)
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(options.concurrency)]
+    for thread in workers:
+        thread.start()
+    start = perf_counter()
+    for request in requests:
+        due = start + request.t / options.speed
+        if open_loop:
+            sleep(max(0.0, due - perf_counter()))
+        pending.put((request, due))
+    for _ in workers:
+        pending.put(None)
+    for thread in workers:
+        thread.join()
+    return summarize(results, perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8989/', help='JSON-RPC endpoint (default %(default)s)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at most (default 8)')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='Poisson arrivals per second, 0 for a closed loop (default 0)')
+    parser.add_argument('--duration', type=float, default=60.0, help='Seconds of synthetic load with --rate')
+    parser.add_argument('--requests', type=int, default=0, help='Number of synthetic requests, overrides --duration')
+    parser.add_argument('--mix', default='convert=6,join=1,upload=3',
+                        help='Weights of the methods (default %(default)s)')
+    parser.add_argument('--mimes', default=DEFAULT_MIMES, help='in:out mime pairs to pick from (default %(default)s)')
+    parser.add_argument('--size-kb', type=float, default=60.0, help='Median document size in KB (default 60)')
+    parser.add_argument('--size-sigma', type=float, default=1.0, help='Spread of the lognormal sizes (default 1.0)')
+    parser.add_argument('--max-size-kb', type=float, default=20480.0, help='Largest document in KB (default 20480)')
+    parser.add_argument('--max-parts', type=int, default=20, help='Most documents in a join (default 20)')
+    parser.add_argument('--clients', type=int, default=4, help='Distinct client_ids (default 4)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed, to repeat a synthetic run')
+    parser.add_argument('--trace', help='Replay this JSON lines trace instead of synthetic load')
+    parser.add_argument('--speed', type=float, default=1.0, help='Replay speed, 2 is twice as fast (default 1)')
+    parser.add_argument('--save-trace', help='Write the synthetic requests as a trace to this file')
+    parser.add_argument('--timeout', type=float, default=300.0, help='HTTP timeout in seconds (default 300)')
+    parser.add_argument('--output', help='Also append the JSON summary to this file')
+    options = parser.parse_args()
+
+    if options.trace:
+        requests = read_trace(options.trace)
+    else:
+        if not options.requests and not options.rate:
+            parser.error('a closed loop needs --requests')
+        requests = synthetic(options)
+    if options.save_trace:
+        with open(options.save_trace, 'w') as trace:
+            trace.writelines(json.dumps(request.as_dict()) + '\n' for request in requests)
+
+    summary = run(options, requests)
+    summary['options'] = {key: value for key, value in vars(options).items() if value is not None}
+    print_summary(summary)
+    line = json.dumps(summary)
+    print(line)
+    if options.output:
+        with open(options.output, 'a') as output:
+            output.write(line + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -28,26 +28,37 @@
 ################################################################################
 
 import base64
+from concurrent.futures import Future
 from datetime import datetime
-from hashlib import md5
-import io
+from hashlib import sha256
 import logging
 from pathlib import Path
 from random import randint
-import subprocess
-from time import sleep, time
-from os import path, rename
-from typing import Literal
+import threading
+from time import time
+from os import fstat
+from typing import Optional, Union
 import uuid
-import zipfile
-from CallWithTimeout import ExecutorWithTimeout, TimeoutExeption
+from CallWithTimeout import TimeoutExeption, Watchdog
+from Cleaner import Cleaner
+from ConversionCache import ConversionCache
+from Metrics import ERRORS, RECYCLES, REQUEST_SECONDS, REQUESTS, RESTARTS, TIMEOUTS, StageTimer
+from OfficePool import OfficeInstance, OfficePool
+from PdfPresets import PdfPresets, is_pdf
+from Preflight import DocumentCost, estimate_cost, estimate_join_cost
+from Spool import RESULT_PREFIX, Spool
 from StarOfficeClient import StarOfficeClient, StarOfficeClientException
 from utils import convert_size
-import threading
+import inspect
+from contextlib import nullcontext
 from functools import wraps
 
 MAXINT = 9223372036854775807
 MAX_IMAGES = 2175  # Maximum number of images allowed in a document
+CONVERT_TIMEOUT = 100  # Seconds before a conversion is cancelled and its office recycled
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # Default size of a downloaded chunk
+MAX_DOWNLOAD_CHUNK_SIZE = 16 * 1024 * 1024  # Bound of the memory used by one download call
+RECYCLE_GRACE = 10  # Seconds for a recycled office to exit by itself before it is killed
 
 filters: dict[str, str] = {
     'pdf': 'writer_pdf_Export',   # PDF - Portable Document Format
@@ -75,74 +86,130 @@ class AccessException(Exception):
     pass
 
 
-def office_locked_method(method):
-    @wraps(method)
-    def wrapper(self, *args, **kwargs):
-        with self._office_lock:
-            return method(self, *args, **kwargs)
-    return wrapper
-
+class ChecksumException(Exception):
+    pass
 
-class AerooServices():
 
-    _office_lock = threading.Lock()
+def measured_method(name: str):
+    """ Count the requests and errors of an RPC method and time it in the metrics. """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                bound = signature.bind(self, *args, **kwargs)
+                bound.apply_defaults()
+                arguments = bound.arguments
+            except TypeError:
+                arguments = {}
+            out_mime = arguments.get('out_mime') or ''
+            if isinstance(out_mime, list):
+                out_mime = ','.join(map(str, out_mime))
+            client_id = arguments.get('client_id') or ''
+            REQUESTS.inc(method=name, filter=out_mime, client_id=client_id)
+            start_time = time()
+            try:
+                return method(self, *args, **kwargs)
+            except Exception:
+                ERRORS.inc(method=name, filter=out_mime, client_id=client_id)
+                raise
+            finally:
+                REQUEST_SECONDS.observe(time() - start_time, method=name, filter=out_mime)
+        return wrapper
+    return decorator
 
-    spool_path: str = "/tmp/aeroo-docs/%s"
-    star_office_client = None
-    soffice_restart_cmd = None
 
-    def __init__(self, spool_directory: str, soffice_restart_cmd=None):
-        self.spool_path = spool_directory + "/%s"
-        self.soffice_restart_cmd = soffice_restart_cmd
+class AerooServices():
 
-    def _init_conn(self):
+    spool: Spool
+    office_pool: OfficePool
+    cache: ConversionCache
+    watchdog: Watchdog
+    pdf_presets: PdfPresets
+    last_success: float = 0.0  # Time of the last conversion or join done by an office
+
+    def __init__(self, spool_directory: str, office_pool: OfficePool, cache: Optional[ConversionCache] = None,
+                 cleaner: Optional[Cleaner] = None, pdf_presets: Optional[PdfPresets] = None):
+        self.spool = Spool(spool_directory, cleaner)
+        self.office_pool = office_pool
+        self.cache = cache or ConversionCache()
+        self.pdf_presets = pdf_presets or PdfPresets()
+        # Twice the instances: a recycled office may still be unwinding a cancelled call
+        self.watchdog = Watchdog(workers=office_pool.size * 2)
+        if office_pool.supervisor is not None:
+            # Started at once, the first requests only wait for the end of their initialization
+            for office in office_pool.instances:
+                office_pool.supervisor.start(office)
+        for spare in office_pool.spares:
+            self._respawn(spare)
+
+    def _init_conn(self, office: OfficeInstance):
+        # The office is started by the supervisor, not by the client, so a refused connection fails at once
         try:
-            return StarOfficeClient(ooo_restart_cmd=self.soffice_restart_cmd)
+            return StarOfficeClient(host=office.host, port=office.port, connection=office.connection)
         except StarOfficeClientException as e:
             logger = logging.getLogger('main')
-            logger.warning("Failed to initiate LibreOffice connection.")
+            logger.warning("Failed to initiate LibreOffice connection to %s.", office)
             return None
 
-    def _md5(self, data: str) -> str:
-        return md5(data.encode()).hexdigest()
+    def _wait_conn(self, office: OfficeInstance):
+        """ Connect to a starting office once its acceptor answers, None when it does not start. """
+        supervisor = self.office_pool.supervisor
+        if supervisor is not None and not supervisor.wait_ready(office):
+            logger = logging.getLogger('main')
+            logger.warning("%s did not accept connections.", office)
+            return None
+        return self._init_conn(office)
 
-    def _conn_healthy(self):
+    def _conn_healthy(self, office: OfficeInstance):
+        """ Return the connection kept by the office instance, reconnecting only when it is lost.
+        A process that stopped answering is replaced by a standby one when it is ready, else started again.
+        """
         logger = logging.getLogger('main')
-        attempt = 0
+        lost = office.star_office_client is not None
+        if lost:
+            if office.star_office_client.isAlive():
+                return office.star_office_client
+            office.star_office_client = None
         star_office_client = None
-        while star_office_client is None and attempt < 7:
-            attempt += 1
-            star_office_client = self._init_conn()
-            if star_office_client is not None:
-                logger.info("LibreOffice connection initialized.")
-                return star_office_client
-            sleep(10)
-
-        message = 'Failed to initiate connection to LibreOffice three times in a row.'
-        logger.warning(message)
-        raise NoOfficeConnection(message)
+        supervisor = self.office_pool.supervisor
+        if not lost and (supervisor is None or supervisor.running(office)):
+            # Never connected yet, its process may still be starting
+            star_office_client = self._wait_conn(office)
+        if star_office_client is None:
+            if self._failover(office):
+                star_office_client = office.star_office_client or self._init_conn(office)
+            elif self._start_office(office):
+                star_office_client = self._wait_conn(office)
+        if star_office_client is None:
+            message = 'Failed to initiate connection to LibreOffice on %s.' % office
+            logger.warning(message)
+            raise NoOfficeConnection(message)
+        logger.info("LibreOffice connection initialized on %s.", office)
+        office.star_office_client = star_office_client
+        return star_office_client
 
     def _chktime(self, start_time: float):
         return '%s s' % str(round(time()-start_time, 6))
 
-    def _readFile(self, ident):
-        with open(self.spool_path % self._md5(str(ident)), "rb") as tmpfile:
-            data = tmpfile.read()
-        return base64.b64decode(data)
-
-    def _readFiles(self, idents):
+    def _readFiles(self, names):
+        """ Yield the mmap of each spooled file, closed once the next one is requested. """
         logger = logging.getLogger('main')
-        for ident in idents:
+        for name in names:
             start_time = time()
-            data = self._readFile(ident)
-            logger.debug("    read next file: %s +%s" %
-                         (ident, self._chktime(start_time)))
-            yield data
-
-    @office_locked_method
-    def upload(self, data: str = "", is_last: bool = False, identifier: str = "", username: str = "", password: str = "", client_id: str = 'Unknown'):
+            with self.spool.open_buffer(name) as data:
+                logger.debug("    read next file: %s +%s",
+                             name, self._chktime(start_time))
+                yield data
+
+    @measured_method('upload')
+    def upload(self, data: str = "", is_last: bool = False, identifier: str = "", username: str = "",
+               password: str = "", client_id: str = 'Unknown', offset: Optional[int] = None, checksum: str = ""):
         """ Upload a file to the Aeroo Services spool directory.
         This method handles the upload of a file, either by creating a new identifier or using an existing one.
+        Chunks without offset are appended in order. Chunks with an offset may be sent in parallel,
+        in any order, and sent again when they failed; `upload_status` tells which ranges are missing.
         Args:
             data (str | False): The file data to upload, base64 encoded.
             is_last (bool): Indicates if this is the last chunk of the file.
@@ -150,45 +217,68 @@ class AerooServices():
             username (str): The username for authentication (not used in this context).
             password (str): The password for authentication (not used in this context).
             client_id (str): The ID of the client making the request, for logging purposes.
+            offset (int | None): Position of the chunk in the decoded file; data is then the base64 of
+                that piece alone.
+            checksum (str): The sha256 hex digest of data as sent, checked when given.
         Returns:
-            dict: A dictionary containing the identifier of the uploaded file.
+            dict: A dictionary containing the identifier of the uploaded file and whether it is complete.
         Raises:
             NoidentException: If no identifier is provided and no data is given to generate one.
             NodataException: If no data is provided for upload.
+            ChecksumException: If the chunk does not match its checksum, it should be sent again.
         """
         call_ref = str(uuid.uuid4()).replace("-", "")[:6]
         logger = logging.getLogger('main')
-        logger.debug('%s Upload identifier: %s from %s' % (call_ref, identifier, client_id))
+        logger.debug('%s Upload identifier: %s offset %s from %s', call_ref, identifier, offset, client_id)
         try:
             start_time = time()
-            # NOTE:md5 conversion on file operations to prevent path injection attack
-            if identifier and not path.isfile(self.spool_path % '_' + self._md5(str(identifier))):
-                raise NoidentException('Wrong or no identifier.')
-            elif data == "":
+            if data == "":
                 raise NodataException('No data to be converted.')
+            if checksum and sha256(data.encode()).hexdigest() != checksum.lower():
+                raise ChecksumException('Chunk checksum mismatch.')
+            if offset is not None:
+                offset = int(offset)
+                if offset < 0:
+                    raise NodataException('Wrong offset.')
+                # Decoded out of the lock, only the write is serialized
+                b_data = base64.b64decode(data)
+
+            if identifier:
+                if not self.spool.exists(self.spool.name(identifier, partial=True)):
+                    if offset is not None and self.spool.exists(self.spool.name(identifier)):
+                        # A chunk sent again after the upload completed
+                        return {'identifier': identifier, 'complete': True}
+                    raise NoidentException('Wrong or no identifier.')
 
-            fname = ''
             # generate random identifier
             while not identifier:
                 new_ident = randint(1, MAXINT)
-                fname = self._md5(str(new_ident))
-                logger.debug('%s  assigning new identifier %s' % (call_ref, new_ident))
+                logger.debug('%s  assigning new identifier %s', call_ref, new_ident)
                 # check if there is any other such files
-                identifier = str(new_ident) if not path.isfile(self.spool_path % '_'+fname) \
-                    and not path.isfile(self.spool_path % fname) else ""
-
-            fname = fname or self._md5(str(identifier))
-            with open(self.spool_path % '_'+fname, "a") as tmpfile:
-                tmpfile.write(data)
-
-            logger.debug("%s  chunk finished %s" % (call_ref, self._chktime(start_time)))
-            if is_last:
-                rename(self.spool_path % '_'+fname, self.spool_path % fname)
-                logger.debug("%s  file finished" % call_ref)
-
-            return {'identifier': identifier}
-
-        except (AccessException, NoidentException, NodataException) as e:
+                identifier = str(new_ident) if not self.spool.exists(self.spool.name(new_ident)) \
+                    and self.spool.reserve(self.spool.name(new_ident, partial=True)) else ""
+
+            partial_name = self.spool.name(identifier, partial=True)
+            name = self.spool.name(identifier)
+            with self.spool.lock(name):
+                if not self.spool.exists(partial_name):
+                    # Completed by a concurrent chunk
+                    return {'identifier': identifier, 'complete': self.spool.exists(name)}
+                if offset is None:
+                    # Stored decoded, convert and join read the file as it is
+                    self.spool.append_base64(partial_name, data)
+                    complete = is_last
+                else:
+                    complete = self.spool.write_chunk(partial_name, offset, b_data, is_last)
+
+                logger.debug("%s  chunk finished %s", call_ref, self._chktime(start_time))
+                if complete:
+                    self.spool.publish(partial_name, name)
+                    logger.debug("%s  file finished", call_ref)
+
+            return {'identifier': identifier, 'complete': complete}
+
+        except (AccessException, NoidentException, NodataException, ChecksumException) as e:
             raise e
         except:
             import sys
@@ -197,62 +287,52 @@ class AerooServices():
             traceback.print_exception(
                 exceptionType, exceptionValue, exceptionTraceback, limit=2, file=sys.stdout)
 
-    @office_locked_method
-    def convert(self, data: str = "", identifier: str = "", in_mime: str = "odt", out_mime: str = "pdf", username: str = "", password: str = "", client_id: str = 'Unknown') -> str:
-        """ Convert a file from one format to another using LibreOffice/OpenOffice.
-
-        This method provides a timeout mechanism to ensure that the conversion process does not hang indefinitely.
-
+    def upload_status(self, identifier: str = "", username: str = "", password: str = "", client_id: str = 'Unknown'):
+        """ Progress of an upload, to resume it by sending only the missing chunks.
         Args:
-            data (str | Buffer): The file data to convert, base64 encoded.
-            identifier (str): The identifier of the file to convert.
-            in_mime (str | False): The input MIME type of the file.
-            out_mime (str | False): The output MIME type to convert to.
+            identifier (str): The identifier returned by the first `upload` call.
             username (str): The username for authentication (not used in this context).
             password (str): The password for authentication (not used in this context).
             client_id (str): The ID of the client making the request, for logging purposes.
         Returns:
-            str: The base64 encoded converted file data.
+            dict: Whether the upload is complete, its size when known, the bytes received and the
+                received and missing [start, end) ranges of the decoded file.
         Raises:
-            NoidentException: If no identifier is provided or the identifier is invalid.
-            Exception: If the file conversion fails or if the file has too many images.
-        Logs:
-            Logs the process of converting the file, including start time, file reading, connection status,
-            upload, conversion, and download of the converted document.
-            Uses a unique call reference for each operation to trace logs.
-        Notes:
-            - The method reads the file data either from the provided data or from a file identified by
-              the identifier.
-            - It checks the number of images in the file to avoid processing files with too many images.
-            - It uses a StarOfficeClient to handle the connection to LibreOffice/OpenOffice for conversion.
-            - The method is decorated with `office_locked_method` to ensure thread safety when accessing
-              the office client.
+            NoidentException: If the identifier is invalid or the upload expired.
         """
-        try:
-            rta = ExecutorWithTimeout().callWithTimeout(
-                100,
-                self._convert,
-                (data, identifier, in_mime, out_mime, username, password, client_id)
-            )
-            return rta
-        except TimeoutExeption as toe:
-            self._restart_ooo()
-            raise Exception('The file cannot be processed')
-        except Exception as e:
-            raise e
+        status = self.spool.status(self.spool.name(identifier, partial=True), self.spool.name(identifier)) \
+            if identifier else None
+        if status is None:
+            raise NoidentException('Wrong or no identifier.')
+        return dict(status, identifier=identifier)
 
-    def _convert(self, data: str = "", identifier: str = "", in_mime: str = "writer8", out_mime: str = "writer8", username: str = "", password: str = "", client_id: str = 'Unknown') -> str:
+    @measured_method('convert')
+    def convert(self, data: str = "", identifier: str = "", in_mime: str = "odt",
+                out_mime: Union[str, list[str]] = "pdf", username: str = "", password: str = "",
+                client_id: str = 'Unknown', spool: bool = False,
+                pdf_preset: str = "", pdf_options: Optional[dict] = None):
         """ Convert a file from one format to another using LibreOffice/OpenOffice.
+
+        This method provides a timeout mechanism to ensure that the conversion process does not hang indefinitely.
+
         Args:
-            data (str | ReadableBuffer): The file data to convert, base64 encoded.
+            data (str | Buffer): The file data to convert, base64 encoded.
             identifier (str): The identifier of the file to convert.
             in_mime (str | False): The input MIME type of the file.
-            out_mime (str | False): The output MIME type to convert to.
+            out_mime (str | list): The output MIME type to convert to, or a list of them to get every
+                format from a single load of the document.
             username (str): The username for authentication (not used in this context).
             password (str): The password for authentication (not used in this context).
             client_id (str): The ID of the client making the request, for logging purposes.
+            spool (bool): Keep the result in the spool directory and return its identifier, to be
+                fetched in chunks with `download`.
+            pdf_preset (str): Name of a server side set of PDF export options, like "screen" or "archive".
+            pdf_options (dict): PDF export FilterData, like {"Quality": 80, "PageRange": "1-2"}, on top
+                of the preset. Both only apply to a PDF output.
         Returns:
             str: The base64 encoded converted file data.
+            dict: The result identifier and size, when spool is set.
+            dict: One of the above by output MIME type, when out_mime is a list.
         Raises:
             NoidentException: If no identifier is provided or the identifier is invalid.
             Exception: If the file conversion fails or if the file has too many images.
@@ -264,68 +344,201 @@ class AerooServices():
             - The method reads the file data either from the provided data or from a file identified by
               the identifier.
             - It checks the number of images in the file to avoid processing files with too many images.
-            - It uses a StarOfficeClient to handle the connection to LibreOffice/OpenOffice for conversion.
-            - The method is decorated with `office_locked_method` to ensure thread safety when accessing
-              the office client.
+            - The document is converted on an office instance leased from the pool, so only that instance
+              is restarted when the conversion times out.
+            - When the conversion cache is enabled, a document already converted with the same filters
+              is answered from the cache without touching the office.
         """
-
         call_ref = str(uuid.uuid4()).replace("-", "")[:6]
         logger = logging.getLogger('main')
-        start_time = time()
-        logger.debug('%s Convert File Solicitation from %s at %s: ' % (call_ref, client_id, datetime.now()))
+        timer = StageTimer('convert')
+        logger.debug('%s Convert File Solicitation from %s at %s: ', call_ref, client_id, datetime.now())
 
+        digest = None
         if data != "":
-            b_data = base64.b64decode(data)
-            logger.debug('%s Openning file from %s : ' % (call_ref, client_id))
+            document = nullcontext(base64.b64decode(data))
+            logger.debug('%s Openning file from %s : ', call_ref, client_id)
         elif identifier != "":
-            logger.debug('%s Openning identifier %s from %s :' % (call_ref, identifier, client_id))
-            b_data = self._readFile(identifier)
+            logger.debug('%s Openning identifier %s from %s :', call_ref, identifier, client_id)
+            name = self.spool.name(identifier)
+            if not self.spool.exists(name):
+                raise NoidentException('Wrong or no identifier.')
+            # Mapped, not read: the office reads it in place
+            document = self.spool.open_buffer(name)
+            digest = self.spool.meta(name).get('sha256')
         else:
             raise NoidentException('Wrong or no identifier.')
 
-        logger.debug("%s  read file %s len %s" % (call_ref, self._chktime(start_time), convert_size(len(b_data))))
+        with document as b_data:
+            logger.debug("%s  read file %s len %s", call_ref, timer.lap('read'), convert_size(len(b_data)))
+            out_mimes = out_mime if isinstance(out_mime, list) else [out_mime]
+            conv_datas = self.convert_outputs(b_data, in_mime, out_mimes, client_id, call_ref, timer, digest,
+                                              pdf_preset=pdf_preset, pdf_options=pdf_options)
+        results = {}
+        for mime, conv_data in conv_datas.items():
+            if spool:
+                with self.spool.result() as (result_identifier, result_file):
+                    result_file.write(conv_data)
+                logger.debug("%s  result spooled as %s %s", call_ref, result_identifier, timer.lap('spool'))
+                results[mime] = {'identifier': result_identifier, 'size': len(conv_data)}
+            else:
+                results[mime] = base64.b64encode(conv_data).decode('utf8')
+        return results if isinstance(out_mime, list) else results[out_mime]
+
+    def convert_bytes(self, b_data: bytes, in_mime: str = "odt", out_mime: str = "pdf", client_id: str = 'Unknown',
+                      call_ref: str = "", timer: Optional[StageTimer] = None, digest: Optional[str] = None,
+                      cached: bool = True, pdf_preset: str = "", pdf_options: Optional[dict] = None) -> bytes:
+        """ Convert a decoded document, shared by the JSON-RPC `convert` and the binary HTTP endpoint.
+        Args:
+            b_data (bytes): The file data to convert, or the mmap of a spooled file.
+            in_mime (str): The input MIME type of the file.
+            out_mime (str): The output MIME type to convert to.
+            client_id (str): The ID of the client making the request, for logging purposes.
+            call_ref (str): The call reference used to trace logs, a new one is created when empty.
+            timer (StageTimer): The timer of the request stages, a new one is created when empty.
+            digest (str): The sha256 of b_data when it is already known, for the cache key.
+            cached (bool): Whether the conversion cache is used, the test conversion always reaches an office.
+            pdf_preset (str): Name of a server side set of PDF export options.
+            pdf_options (dict): PDF export FilterData on top of the preset.
+        Returns:
+            bytes: The converted file data.
+        Raises:
+            Exception: If the file conversion fails or if the file has too many images.
+        """
+        return self.convert_outputs(b_data, in_mime, [out_mime], client_id, call_ref, timer, digest, cached,
+                                    pdf_preset, pdf_options)[out_mime]
+
+    def convert_outputs(self, b_data: bytes, in_mime: str = "odt", out_mimes: Optional[list[str]] = None,
+                        client_id: str = 'Unknown', call_ref: str = "", timer: Optional[StageTimer] = None,
+                        digest: Optional[str] = None, cached: bool = True, pdf_preset: str = "",
+                        pdf_options: Optional[dict] = None) -> dict[str, bytes]:
+        """ Convert a decoded document to several formats, the document is loaded once and exported to each.
+        Args:
+            out_mimes (list): The output MIME types to convert to, pdf by default.
+            The other arguments are the ones of `convert_bytes`.
+        Returns:
+            dict: The converted file data by output MIME type, in the order of out_mimes.
+        Raises:
+            Exception: If the file conversion fails or if the file has too many images.
+        """
+        call_ref = call_ref or str(uuid.uuid4()).replace("-", "")[:6]
+        timer = timer or StageTimer('convert')
+        logger = logging.getLogger('main')
+        out_mimes = list(dict.fromkeys(out_mimes or ['pdf']))
 
         # Avoid to handle files with too many images.
-        inzip = zipfile.ZipFile(io.BytesIO(b_data), "r")
-        if len(inzip.namelist()) > MAX_IMAGES:
+        cost = estimate_cost(b_data)
+        if cost.entries > MAX_IMAGES:
             raise Exception('File with too many images')
-        inzip = None
+        lane = self.office_pool.lane(cost.score)
+        logger.debug("%s  preflight %s lane %s %s", call_ref, cost, lane, timer.lap('preflight'))
 
-        star_office_client = self._conn_healthy()
+        infilter = filters.get(in_mime, "writer8")
+        outputs = {}
+        for out_mime in out_mimes:
+            outfilter = filters.get(out_mime, "writer8")
+            outputs[out_mime] = (outfilter, self.filter_data(outfilter, pdf_preset, pdf_options))
+
+        results: dict[str, bytes] = {}
+        cache_keys = {}
+        if cached and self.cache.enabled:
+            for out_mime, (outfilter, filter_data) in outputs.items():
+                # The options are only part of the key when given, the keys of the default exports do not change
+                options = (tuple(sorted(filter_data.items())),) if filter_data else ()
+                cache_keys[out_mime] = self.cache.key(b_data, infilter, outfilter, *options, digest=digest)
+                conv_data = self.cache.get(cache_keys[out_mime])
+                if conv_data is not None:
+                    logger.debug("%s  cache hit %s %s", call_ref, cache_keys[out_mime], timer.lap('cache'))
+                    results[out_mime] = conv_data
+
+        missing = [out_mime for out_mime in out_mimes if out_mime not in results]
+        if missing:
+            with self.office_pool.lease(client_id, lane) as office:
+                logger.debug("%s  leased %s %s", call_ref, office, timer.lap('wait'))
+                process = office.process
+                try:
+                    # Only the process that hung is recycled, it stays out of the pool until its call unwinds
+                    converted = self.watchdog.callWithTimeout(
+                        CONVERT_TIMEOUT * len(missing),
+                        self._convert,
+                        (office, b_data, infilter, [outputs[out_mime] for out_mime in missing], call_ref, timer, cost),
+                        on_timeout=lambda: self._restart_ooo(office),
+                        on_late=lambda future: self._quarantine(office, process, future)
+                    )
+                except TimeoutExeption:
+                    TIMEOUTS.inc(method=timer.method, filter=','.join(missing), client_id=client_id)
+                    raise Exception('The file cannot be processed')
+                self.last_success = time()
+                self._recycle_if_due(office)
+            for out_mime, conv_data in zip(missing, converted):
+                results[out_mime] = conv_data
+                if out_mime in cache_keys and conv_data:
+                    self.cache.put(cache_keys[out_mime], conv_data)
+
+        return {out_mime: results[out_mime] for out_mime in out_mimes}
+
+    def _convert(self, office: OfficeInstance, b_data: bytes, infilter: str = "writer8",
+                 outputs: Optional[list[tuple[str, dict]]] = None, call_ref: str = "",
+                 timer: Optional[StageTimer] = None, cost: Optional[DocumentCost] = None) -> list[bytes]:
+        """ Convert a document on the given office instance.
+        Args:
+            office (OfficeInstance): The office instance leased for this conversion.
+            b_data (bytes): The decoded file data to convert.
+            infilter (str): The LibreOffice import filter of the file.
+            outputs (list): The LibreOffice export filters to convert to, with the options of each,
+                the document is loaded once and exported to each one in turn.
+            call_ref (str): The call reference used to trace logs.
+            timer (StageTimer): The timer of the request stages.
+            cost (DocumentCost): The preflight of the document, the link, field and index updates it
+                rules out are skipped.
+        Returns:
+            list: The converted file data of each output.
+        Raises:
+            Exception: If the file conversion fails.
+        """
+        logger = logging.getLogger('main')
+        timer = timer or StageTimer('convert')
+        outputs = outputs or [("writer8", {})]
+
+        star_office_client = self._conn_healthy(office)
         if star_office_client == None:
             raise Exception('Client Not available')
 
-        logger.debug("%s  connection test ok %s" % (call_ref, self._chktime(start_time)))
-
-        infilter = filters.get(in_mime, "writer8")
-        outfilter = filters.get(out_mime, "writer8")
+        logger.debug("%s  connection test ok %s", call_ref, timer.lap('connect'))
 
         star_office_client.putDocument(
             b_data, filter_name=infilter, read_only=True)
 
-        logger.debug("%s  upload document to office %s" %
-                     (call_ref, self._chktime(start_time)))
+        logger.debug("%s  upload document to office %s",
+                     call_ref, timer.lap('load'))
 
+        conv_datas = []
         try:
-            conv_data = star_office_client.saveByStream(
-                filter_name=outfilter)
-            logger.debug("%s  download converted document %s" %
-                         (call_ref, self._chktime(start_time)))
+            updates = {'links': cost.links, 'fields': cost.fields, 'indexes': cost.indexes} if cost else {}
+            for outfilter, filter_data in outputs:
+                conv_datas.append(star_office_client.saveByStream(
+                    filter_name=outfilter, filter_data=filter_data, **updates))
+                logger.debug("%s  download document converted by %s %s",
+                             call_ref, outfilter, timer.lap('export'))
+                # The document is up to date after the first export
+                updates = {'links': False, 'fields': False, 'indexes': False}
         except Exception as e:
-            logger.debug("%s  conversion failed %s Exception: %s" %
-                         (call_ref, self._chktime(start_time), str(e)))
+            logger.debug("%s  conversion failed %s Exception: %s",
+                         call_ref, timer.lap('export'), str(e))
             star_office_client.closeDocument()
-            logger.debug("%s  emergency close document %s" %
-                         (call_ref, self._chktime(start_time)))
+            logger.debug("%s  emergency close document %s",
+                         call_ref, timer.lap('close'))
             raise e
         else:
             star_office_client.closeDocument()
-            logger.debug("%s  close document %s" % (call_ref, self._chktime(start_time)))
+            logger.debug("%s  close document %s", call_ref, timer.lap('close'))
 
-        return base64.b64encode(conv_data).decode('utf8')
+        return conv_datas
 
-    @office_locked_method
-    def join(self, idents: list[str], in_mime: str = 'writer8', out_mime: str = "writer_pdf_Export", username: str = "", password: str = "", client_id: str = 'Unknown'):
+    @measured_method('join')
+    def join(self, idents: list[str], in_mime: str = 'writer8', out_mime: str = "writer_pdf_Export",
+             username: str = "", password: str = "", client_id: str = 'Unknown', spool: bool = False,
+             pdf_preset: str = "", pdf_options: Optional[dict] = None):
         """ Join multiple files into one document using LibreOffice/OpenOffice.
         Args:
             idents (list): List of identifiers for the files to join.
@@ -334,79 +547,282 @@ class AerooServices():
             username (str): The username for authentication (not used in this context).
             password (str): The password for authentication (not used in this context).
             client_id (str): The ID of the client making the request, for logging purposes.
+            spool (bool): Stream the result from the office into the spool directory and return its
+                identifier, to be fetched in chunks with `download`.
+            pdf_preset (str): Name of a server side set of PDF export options.
+            pdf_options (dict): PDF export FilterData on top of the preset, both only apply to a PDF output.
         """
         call_ref = str(uuid.uuid4()).replace("-", "")[:6]
         logger = logging.getLogger('main')
-        logger.debug('%s Join %s identifiers: %s' %
-                     (call_ref, str(len(idents)), str(idents)))
-
-        start_time = time()
-        ident = idents.pop(0)
-        data = self._readFile(ident)
-        logger.debug("%s  read first file %s" % (call_ref, self._chktime(start_time)))
+        logger.debug('%s Join %s identifiers: %s',
+                     call_ref, str(len(idents)), str(idents))
 
-        star_office_client = self._conn_healthy()
-        logger.debug("%s  connection test ok %s" % (call_ref, self._chktime(start_time)))
+        timer = StageTimer('join')
+        names = [self.spool.name(ident) for ident in idents]
+        if not names or not all(self.spool.exists(name) for name in names):
+            raise NoidentException('Wrong or no identifier.')
+        logger.debug("%s  found files %s", call_ref, timer.lap('read'))
+        infilter = filters.get(in_mime, 'writer8') if in_mime else 'writer8'
+        outfilter = filters.get(out_mime, "writer_pdf_Export") if out_mime else "writer_pdf_Export"
+        filter_data = self.filter_data(outfilter, pdf_preset, pdf_options)
+
+        cost = estimate_join_cost([self.spool.size(name) for name in names])
+        lane = self.office_pool.lane(cost)
+        logger.debug("%s  preflight cost %s lane %s %s", call_ref, cost, lane, timer.lap('preflight'))
+
+        with self.office_pool.lease(client_id, lane) as office, self.spool.open_buffer(names[0]) as data:
+            logger.debug("%s  leased %s %s", call_ref, office, timer.lap('wait'))
+            star_office_client = self._conn_healthy(office)
+            logger.debug("%s  connection test ok %s", call_ref, timer.lap('connect'))
+
+            try:
+                star_office_client.putDocument(
+                    data, filter_name=infilter, read_only=True)
+                logger.debug("%s  upload first document to office %s",
+                             call_ref, timer.lap('load'))
+                star_office_client.appendDocuments(
+                    self._readFiles(names[1:]), filter_name=infilter)
+                logger.debug("%s  append documents %s", call_ref, timer.lap('append'))
+                if spool:
+                    with self.spool.result() as (result_identifier, result_file):
+                        result_size = star_office_client.saveByStream(outfilter, output=result_file,
+                                                                      filter_data=filter_data)
+                else:
+                    result_data = star_office_client.saveByStream(outfilter, filter_data=filter_data)
+                logger.debug("%s  download joined document %s", call_ref, timer.lap('export'))
+            except Exception as e:
+                logger.debug("%s  conversion failed %s Exception: %s",
+                             call_ref, timer.lap('export'), str(e))
+                star_office_client.closeDocument()
+                logger.debug("%s  emergency close document %s",
+                             call_ref, timer.lap('close'))
+                raise e
+            else:
+                star_office_client.closeDocument()
+                logger.debug("%s  close document %s", call_ref, timer.lap('close'))
+            self.last_success = time()
+            self._recycle_if_due(office)
+
+        logger.debug("%s  join finished %s", call_ref, timer.lap('finish'))
+        if spool:
+            return {'identifier': result_identifier, 'size': result_size}
+        return base64.b64encode(result_data).decode('utf8')
 
-        try:
-            infilter = filters.get(in_mime, 'writer8') if in_mime else 'writer8'
-            outfilter = filters.get(out_mime, "writer_pdf_Export") if out_mime else "writer_pdf_Export"
-            star_office_client.putDocument(
-                data, filter_name=infilter, read_only=True)
-            logger.debug("%s  upload first document to office %s" %
-                         (call_ref, self._chktime(start_time)))
-            star_office_client.appendDocuments(
-                self._readFiles(idents), filter_name=infilter)
-            result_data = star_office_client.saveByStream(outfilter)
-        except Exception as e:
-            logger.debug("%s  conversion failed %s Exception: %s" %
-                         (call_ref, self._chktime(start_time), str(e)))
-            star_office_client.closeDocument()
-            logger.debug("%s  emergency close document %s" %
-                         (call_ref, self._chktime(start_time)))
-            raise e
-        else:
-            star_office_client.closeDocument()
-            logger.debug("%s  close document %s" % (call_ref, self._chktime(start_time)))
+    @measured_method('download')
+    def download(self, identifier: str = "", offset: int = 0, length: int = DOWNLOAD_CHUNK_SIZE, username: str = "",
+                 password: str = "", client_id: str = 'Unknown'):
+        """ Download a piece of a spooled conversion or join result, the counterpart of `upload`.
+        Args:
+            identifier (str): The result identifier returned by `convert` or `join` with spool set.
+            offset (int): Position of the first byte of the chunk.
+            length (int): Maximum number of bytes of the chunk.
+            username (str): The username for authentication (not used in this context).
+            password (str): The password for authentication (not used in this context).
+            client_id (str): The ID of the client making the request, for logging purposes.
+        Returns:
+            dict: The base64 encoded chunk data, its offset, the total size and whether it is the last one.
+        Raises:
+            NoidentException: If the identifier is invalid or the result expired.
+        """
+        logger = logging.getLogger('main')
+        logger.debug('Download identifier: %s offset %s from %s', identifier, offset, client_id)
+        offset = max(int(offset), 0)
+        length = min(max(int(length), 1), MAX_DOWNLOAD_CHUNK_SIZE)
+        with self.open_result(identifier) as result_file:
+            try:
+                size = fstat(result_file.fileno()).st_size
+                result_file.seek(offset)
+                chunk = result_file.read(length)
+            finally:
+                self.release_result(identifier)
+        return {
+            'identifier': identifier,
+            'data': base64.b64encode(chunk).decode('utf8'),
+            'offset': offset,
+            'size': size,
+            'is_last': offset + len(chunk) >= size,
+        }
+
+    def open_result(self, identifier: str):
+        """ Open a spooled result for streaming, raises NoidentException when it does not exist.
+
+        The Cleaner does not evict the result until `release_result` is called.
+        """
+        name = self.spool.name(identifier, RESULT_PREFIX)
+        if not identifier or not self.spool.exists(name):
+            raise NoidentException('Wrong or no identifier.')
+        result_file = self.spool.open(name)
+        if self.spool.cleaner is not None:
+            self.spool.cleaner.hold(name)
+        return result_file
 
-        logger.debug("%s  join finished %s" % (call_ref, self._chktime(start_time)))
-        return base64.b64encode(result_data).decode('utf8')
+    def release_result(self, identifier: str):
+        """ Counterpart of `open_result`, once the result file is closed. """
+        if self.spool.cleaner is not None:
+            self.spool.cleaner.release(self.spool.name(identifier, RESULT_PREFIX))
 
     def test(self, client_id: str = ''):
         """ Test the connection to LibreOffice/OpenOffice by converting a test ODT file to PDF.
+        The cache is skipped, so the conversion always reaches an office.
         """
         localPath = Path(__file__).resolve().absolute().with_name('test.odt')
-        data: str = ''
         with open(localPath, "rb") as tmpfile:
-            data = base64.b64encode(tmpfile.read()).decode('utf-8')
+            data = tmpfile.read()
 
-        result = self.convert(data, in_mime='odt', out_mime='pdf', client_id="unknown tester")[:4]
-        if 'JVBE' == result:  # b'%PDF' Check for magick words
-            return {'status': 'ok', 'dig': result[:128]}
+        result = self.convert_bytes(data, in_mime='odt', out_mime='pdf', client_id=client_id or "unknown tester",
+                                    cached=False)
+        if result[:4] == b'%PDF':  # Check for magick words
+            return {'status': 'ok', 'dig': base64.b64encode(result[:3]).decode('utf8')}
 
         raise Exception('Convertion failed')
 
-    def _restart_ooo(self):
-        """ Restart the LibreOffice/OpenOffice background process using a configured script.
-        This method attempts to execute a restart script defined in the `soffice_restart_cmd`
-        attribute.
+    def queue_stats(self, client_id: str = ''):
+        """ Office queue depth and wait times by client_id. """
+        return self.office_pool.stats()
+
+    def cache_stats(self, client_id: str = ''):
+        """ Hit/miss counters and sizes of the conversion cache, to size it. """
+        return self.cache.stats()
+
+    def filter_data(self, outfilter: str, pdf_preset: str = "", pdf_options: Optional[dict] = None) -> dict:
+        """ The FilterData of an export, the PDF preset and options of the request are ignored by other filters.
+        Args:
+            outfilter (str): The LibreOffice export filter.
+            pdf_preset (str): The name of a PDF preset.
+            pdf_options (dict): PDF export options overriding the ones of the preset.
+        Returns:
+            dict: The FilterData, empty when the export is not a PDF.
+        Raises:
+            ValueError: If the preset is unknown or an option is not valid.
+        """
+        if not is_pdf(outfilter):
+            return {}
+        return self.pdf_presets.resolve(pdf_preset, pdf_options)
+
+    def _quarantine(self, office: OfficeInstance, process: int, future: Future):
+        """ Keep the process of a cancelled call still running on it away from the next calls until it ends.
+        When a standby process took over, the office instance stays in the pool and only the spare now
+        holding the process waits before becoming a standby.
+        """
+        logger = logging.getLogger('main')
+        if office.process != process:
+            logger.warning('Process %s still runs a cancelled call, kept out of standby until it ends' % process)
+            self.office_pool.hold(process, future)
+            return
+        logger.warning('%s still runs a cancelled call, kept out of the pool until it ends' % office)
+        self.office_pool.quarantine(office)
+        future.add_done_callback(lambda _: self.office_pool.reinstate(office))
+
+    def _restart_ooo(self, office: OfficeInstance):
+        """ Replace the LibreOffice/OpenOffice process of one office instance, the other instances keep running.
+        A ready standby process takes over at once and the failed one is restarted in the background,
+        without a standby the process is restarted in place and waited for.
         """
         logger = logging.getLogger('main')
-        if not self.soffice_restart_cmd:
-            logger.warning(
-                'No LibreOffice/OpenOffice restart script configured')
-            return False
         logger.info(
-            'Restarting LibreOffice/OpenOffice background process')
-        try:
-            logger.info('Executing restart script "%s"' %
-                        self.soffice_restart_cmd)
-            subprocess.Popen(self.soffice_restart_cmd, start_new_session=True)
-            sleep(4)  # Let some time for LibO/OOO to be fully started
-        except OSError as e:
-            logger.error(
-                'Failed to execute the restart script. OS error: %s' % e)
-        except Exception as e:
-            logger.error(
-                'Failed to execute the restart script. General error: %s' % e)
+            'Restarting LibreOffice/OpenOffice background process %s', office)
+        RESTARTS.inc(instance=office.index)
+        if self._failover(office):
+            return True
+        office.star_office_client = None
+        if not self._start_office(office):
+            return False
+        office.star_office_client = self._wait_conn(office)
+        return True
+
+    def _failover(self, office: OfficeInstance) -> bool:
+        """ Move a ready standby process to the office instance, False when there is none. """
+        spare = self.office_pool.promote(office)
+        if spare is None:
+            return False
+        logger = logging.getLogger('main')
+        logger.info('Standby process promoted to %s, restarting process %s in the background',
+                    office, spare.process)
+        if spare.star_office_client is not None:
+            # A cancelled call may still hold it, it must not reconnect to the restarted process
+            spare.star_office_client.markDead()
+        self._respawn(spare)
         return True
+
+    def _respawn(self, spare: OfficeInstance, terminate: bool = False):
+        """ (Re)start the process of a spare in a thread, it becomes a standby once connected.
+        With terminate, the process is first asked to exit by itself.
+        """
+        threading.Thread(target=self._start_standby, args=(spare, terminate),
+                         name='office-standby-%s' % spare.process, daemon=True).start()
+
+    def _start_standby(self, spare: OfficeInstance, terminate: bool = False):
+        logger = logging.getLogger('main')
+        if terminate:
+            self._terminate(spare)
+        spare.star_office_client = None
+        for attempt in range(3):
+            if not self._start_office(spare):
+                return
+            star_office_client = self._wait_conn(spare)
+            if star_office_client is not None:
+                spare.star_office_client = star_office_client
+                self.office_pool.add_standby(spare)
+                logger.info('Standby process %s ready', spare.process)
+                return
+        logger.error('Standby process %s failed to start, the pool runs without it', spare.process)
+
+    def _recycle_if_due(self, office: OfficeInstance):
+        """ Count the conversion done by the office instance and recycle its process past a recycling limit.
+        It is called while the lease is held, so no other request uses the process. A standby process takes
+        over at once and the old one exits in the background. Without one, the instance stays out of the pool
+        once released and is recycled in the background, the request that reached the limit gets its response
+        meanwhile.
+        """
+        supervisor = self.office_pool.supervisor
+        if supervisor is None:
+            return
+        supervisor.record_conversion(office)
+        reason = supervisor.recycle_reason(office)
+        if reason is None:
+            return
+        logger = logging.getLogger('main')
+        logger.info('Recycling %s, past its %s limit %s', office, reason, supervisor.stats(office))
+        RECYCLES.inc(instance=office.index, reason=reason)
+        spare = self.office_pool.promote(office)
+        if spare is not None:
+            self._respawn(spare, terminate=True)
+            return
+        self.office_pool.quarantine(office)
+        threading.Thread(target=self._recycle, args=(office,),
+                         name='office-recycle-%s' % office.index, daemon=True).start()
+
+    def _recycle(self, office: OfficeInstance):
+        """ Terminate the process of a quarantined office instance, or kill it when it does not exit, start it
+        again and give the instance back to the pool.
+        """
+        logger = logging.getLogger('main')
+        try:
+            if self._terminate(office):
+                if self._start_office(office):
+                    office.star_office_client = self._wait_conn(office)
+            else:
+                self._restart_ooo(office)
+        except Exception:
+            # The next lease connects or restarts it again
+            logger.exception('Failed to recycle %s', office)
+        finally:
+            self.office_pool.reinstate(office)
+
+    def _terminate(self, office: OfficeInstance) -> bool:
+        """ Ask the process of the office instance to exit, True when it did within RECYCLE_GRACE. """
+        star_office_client, office.star_office_client = office.star_office_client, None
+        if star_office_client is None:
+            return False
+        star_office_client.terminate()
+        return self.office_pool.supervisor.wait_exit(office, RECYCLE_GRACE)
+
+    def _start_office(self, office: OfficeInstance) -> bool:
+        """ (Re)start the process of the office instance, the supervisor kills the previous one. """
+        supervisor = self.office_pool.supervisor
+        if supervisor is None:
+            logger = logging.getLogger('main')
+            logger.warning(
+                'No LibreOffice/OpenOffice supervisor configured')
+            return False
+        return supervisor.start(office) is not None
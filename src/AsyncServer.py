@@ -0,0 +1,368 @@
+import asyncio
+import io
+import logging
+import socket
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from typing import Callable, Optional
+from urllib.parse import unquote
+
+from KeepAliveHandler import MAX_BODY_BYTES, BodyTooLarge
+from Metrics import HTTP_INFLIGHT, HTTP_REJECTED
+
+MAX_HEAD_BYTES = 64 * 1024  # request line and headers
+READ_BLOCK_SIZE = 64 * 1024
+DISCARD_LIMIT = 64 * 1024 * 1024  # body bytes read and dropped after a rejection before closing
+_END = object()
+
+
+def wants_keep_alive(version: str, connection: str) -> bool:
+    """ Whether the client keeps the connection open: HTTP/1.1 does unless it says close. """
+    tokens = {token.strip().lower() for token in connection.split(',')}
+    if 'close' in tokens:
+        return False
+    return version == 'HTTP/1.1' or 'keep-alive' in tokens
+
+
+class AsyncServer():
+    """ asyncio HTTP front end running a WSGI application on a fixed pool of threads.
+
+    Connections are accepted and read on the event loop, an idle or slow client
+    costs a coroutine instead of a thread. A request is only admitted while
+    fewer than `workers + queue_size` are in flight: past it the server answers
+    at once with 503, or with 429 when one address holds `per_client` of them,
+    both with a Retry-After header and without keeping the body in memory.
+    Admitted requests run the application on the pool, which bounds the threads
+    and the payloads held at once. The paths in `inline_paths` are cheap
+    applications run on the loop itself and never turned away.
+
+    Connections are kept open between requests, HTTP/1.1 keep-alive: request
+    bodies come with a Content-Length or in chunks, and responses get a
+    Content-Length when the application returns a single block, or are sent
+    in chunks. A connection is closed after `idle_timeout` seconds without a
+    request, or once it served `max_requests`. A body over `max_body_bytes`
+    is answered with 413 and the connection closed, before it is read whole.
+    """
+
+    def __init__(self, app: Callable, host: str = '0.0.0.0', port: int = 8989, workers: int = 8,
+                 queue_size: int = 64, per_client: int = 0, retry_after: int = 1, timeout: int = 60,
+                 idle_timeout: int = 15, max_requests: int = 1000, max_body_bytes: int = MAX_BODY_BYTES,
+                 inline_paths: tuple = ()):
+        """
+        Parameters
+        ----------
+        app : callable
+            WSGI application
+        host : str, optional
+            Address to listen on (default is '0.0.0.0')
+        port : int, optional
+            Port to listen on (default is 8989)
+        workers : int, optional
+            Threads running the application (default is 8)
+        queue_size : int, optional
+            Requests admitted while all the threads are busy (default is 64)
+        per_client : int, optional
+            Requests in flight allowed to one address, 0 for no limit (default is 0)
+        retry_after : int, optional
+            Seconds of the Retry-After header of the rejections (default is 1)
+        timeout : int, optional
+            Seconds to wait for each read from the client within a request (default is 60)
+        idle_timeout : int, optional
+            Seconds a kept open connection waits for its next request (default is 15)
+        max_requests : int, optional
+            Requests served by a connection before it is closed, 0 for no limit (default is 1000)
+        max_body_bytes : int, optional
+            Largest request body, 0 for no limit (default is 256 MiB)
+        inline_paths : tuple, optional
+            Paths of applications run on the event loop, without admission (default is none)
+        """
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.limit = workers + queue_size
+        self.per_client = per_client
+        self.retry_after = retry_after
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.max_body_bytes = max_body_bytes
+        self.inline_paths = set(inline_paths)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+        self._inflight = 0
+        self._clients: dict[str, int] = {}  # address: requests in flight
+        # Bind now, so an address in use fails like make_server does
+        self.socket = socket.create_server((host, port), backlog=1024)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def serve_forever(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        server = await asyncio.start_server(self._handle, sock=self.socket, limit=MAX_HEAD_BYTES)
+        async with server:
+            await server.serve_forever()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info('peername')
+        remote_addr = peer[0] if peer else ''
+        # Answers are written in pieces, Nagle would hold each one until the client acknowledges the last
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        requests = 0
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'),
+                                                  self.idle_timeout if requests else self.timeout)
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, '431 Request Header Fields Too Large', [], b'Headers too large\n')
+                    return
+                requests += 1
+                keep_alive = await self._request(reader, writer, head, remote_addr,
+                                                 last=bool(self.max_requests) and requests >= self.max_requests)
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            # Idle past the timeout, or the client went away or stalled, nobody is left to answer
+            pass
+        finally:
+            writer.close()
+
+    async def _request(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, head: bytes,
+                       remote_addr: str, last: bool) -> bool:
+        """ Serve one request, return whether the connection can be reused. """
+        try:
+            method, target, version, headers = self._parseHead(head)
+            chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+            length = 0 if chunked else int(headers.get('content-length') or 0)
+        except ValueError:
+            await self._respond(writer, '400 Bad Request', [], b'Bad request\n')
+            return False
+        keep_alive = not last and wants_keep_alive(version, headers.get('connection', ''))
+        expect_continue = version == 'HTTP/1.1' and headers.get('expect', '').lower() == '100-continue'
+
+        inline = target.split('?', 1)[0] in self.inline_paths
+        if not inline:
+            rejection = self._admit(remote_addr)
+            if rejection:
+                await self._reject(reader, writer, rejection, length, chunked or expect_continue)
+                return False
+        try:
+            try:
+                body = await self._readBody(reader, writer, length, chunked, expect_continue)
+            except BodyTooLarge:
+                await self._respond(writer, '413 Payload Too Large', [], b'Request body too large\n')
+                return False
+            except (ValueError, asyncio.LimitOverrunError):
+                await self._respond(writer, '400 Bad Request', [], b'Bad chunked body\n')
+                return False
+            return await self._run(writer, self._environ(method, target, version, headers, body, remote_addr),
+                                   keep_alive, inline)
+        finally:
+            if not inline:
+                self._release(remote_addr)
+
+    def _admit(self, remote_addr: str) -> Optional[str]:
+        """ Count a new request in, or return the status turning it away. Runs on the loop. """
+        if self._inflight >= self.limit:
+            return '503 Service Unavailable'
+        if self.per_client and self._clients.get(remote_addr, 0) >= self.per_client:
+            return '429 Too Many Requests'
+        self._inflight += 1
+        self._clients[remote_addr] = self._clients.get(remote_addr, 0) + 1
+        HTTP_INFLIGHT.set(self._inflight)
+        return None
+
+    def _release(self, remote_addr: str):
+        self._inflight -= 1
+        self._clients[remote_addr] -= 1
+        if not self._clients[remote_addr]:
+            del self._clients[remote_addr]
+        HTTP_INFLIGHT.set(self._inflight)
+
+    async def _reject(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, status: str, length: int,
+                      unread: bool):
+        """ Answer a rejection and close. unread tells the body is not to be drained, chunked or never sent. """
+        HTTP_REJECTED.inc(status=status[:3])
+        logging.getLogger('main').debug('%s: %s, %s requests in flight', status, writer.get_extra_info('peername'),
+                                        self._inflight)
+        await self._respond(writer, status, [('Retry-After', str(self.retry_after))], b'Server busy, retry later\n')
+        if unread or length > DISCARD_LIMIT:
+            return
+        # Closing with the body unread would reset the connection under the answer
+        while length > 0:
+            block = await asyncio.wait_for(reader.read(min(length, READ_BLOCK_SIZE)), self.timeout)
+            if not block:
+                break
+            length -= len(block)
+
+    def _parseHead(self, head: bytes) -> tuple:
+        lines = head.decode('latin-1').split('\r\n')
+        method, target, version = lines[0].split(' ', 2)
+        headers: dict[str, str] = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, colon, value = line.partition(':')
+            if not colon:
+                raise ValueError('bad header line %r' % line)
+            name = name.strip().lower()
+            headers[name] = '%s,%s' % (headers[name], value.strip()) if name in headers else value.strip()
+        return method, target, version, headers
+
+    async def _readBody(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, length: int,
+                        chunked: bool, expect_continue: bool) -> bytes:
+        if self.max_body_bytes and length > self.max_body_bytes:
+            # Before 100 Continue, the client is spared sending it
+            raise BodyTooLarge('body of %s bytes' % length)
+        if expect_continue:
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        if chunked:
+            return await self._readChunked(reader)
+        blocks = []
+        while length > 0:
+            block = await asyncio.wait_for(reader.read(min(length, READ_BLOCK_SIZE)), self.timeout)
+            if not block:
+                raise asyncio.IncompleteReadError(b''.join(blocks), length)
+            blocks.append(block)
+            length -= len(block)
+        return b''.join(blocks)
+
+    async def _readChunked(self, reader: asyncio.StreamReader) -> bytes:
+        """ Decode a `Transfer-Encoding: chunked` body, raises ValueError when it is malformed. """
+        blocks = []
+        total = 0
+        while True:
+            line = await asyncio.wait_for(reader.readuntil(b'\r\n'), self.timeout)
+            size = int(line.split(b';', 1)[0].strip(), 16)
+            if not size:
+                break
+            total += size
+            if self.max_body_bytes and total > self.max_body_bytes:
+                raise BodyTooLarge('chunked body over %s bytes' % self.max_body_bytes)
+            blocks.append(await asyncio.wait_for(reader.readexactly(size), self.timeout))
+            if await asyncio.wait_for(reader.readexactly(2), self.timeout) != b'\r\n':
+                raise ValueError('chunk without its CRLF')
+        # Trailers are ignored, until the empty line
+        while (await asyncio.wait_for(reader.readuntil(b'\r\n'), self.timeout)) != b'\r\n':
+            pass
+        return b''.join(blocks)
+
+    def _environ(self, method: str, target: str, version: str, headers: dict, body: bytes, remote_addr: str) -> dict:
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote(path, 'iso-8859-1'),
+            'QUERY_STRING': query,
+            # Like wsgiref, which the applications were written against
+            'CONTENT_TYPE': headers.get('content-type', 'text/plain'),
+            'REMOTE_ADDR': remote_addr,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': str(self.port),
+            'SERVER_PROTOCOL': version,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        if 'content-length' in headers or 'transfer-encoding' in headers:
+            # The body is read whole, chunked ones too
+            environ['CONTENT_LENGTH'] = str(len(body))
+        for name, value in headers.items():
+            if name not in ('content-type', 'content-length', 'transfer-encoding'):
+                environ['HTTP_' + name.upper().replace('-', '_')] = value
+        return environ
+
+    async def _run(self, writer: asyncio.StreamWriter, environ: dict, keep_alive: bool, inline: bool = False) -> bool:
+        """ Run the application and stream its response, each step of the iterator on the pool.
+
+        Return whether the connection can be reused.
+        """
+        loop = asyncio.get_running_loop()
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'] = status
+            response['headers'] = headers
+
+        def call(function, *args):
+            if inline:
+                return asyncio.sleep(0, function(*args))
+            return loop.run_in_executor(self._executor, function, *args)
+
+        def start():
+            result = self.app(environ, start_response)
+            # Generators only call start_response once they are iterated, the
+            # second block tells whether the length of the response is known
+            iterator = iter(result)
+            first = next(iterator, _END)
+            return result, iterator, [block for block in (first, next(iterator, _END) if first is not _END else _END)
+                                      if block is not _END]
+
+        logger = logging.getLogger('main')
+        try:
+            result, iterator, blocks = await call(start)
+        except Exception as e:
+            logger.error('%s %s failed: %s', environ['REQUEST_METHOD'], environ['PATH_INFO'], e)
+            await self._respond(writer, '500 Internal Server Error', [], b'Internal server error\n', keep_alive)
+            return keep_alive
+        try:
+            status = response.get('status', '200 OK')
+            headers = list(response.get('headers', []))
+            chunked = False
+            if not any(name.lower() == 'content-length' for name, _ in headers):
+                if len(blocks) < 2:
+                    headers.append(('Content-Length', str(sum(len(block) for block in blocks))))
+                elif environ['SERVER_PROTOCOL'] == 'HTTP/1.1':
+                    headers.append(('Transfer-Encoding', 'chunked'))
+                    chunked = True
+                else:
+                    # An HTTP/1.0 client reads the body until the connection is closed
+                    keep_alive = False
+            head = self._head(status, headers, keep_alive)
+            response['sent'] = True
+            while blocks:
+                for block in blocks:
+                    if block:
+                        # The head goes out with the first block
+                        writer.writelines((head, b'%x\r\n' % len(block), block, b'\r\n') if chunked else (head, block))
+                        head = b''
+                        await writer.drain()
+                block = await call(next, iterator, _END)
+                blocks = [] if block is _END else [block]
+            writer.write(head + b'0\r\n\r\n' if chunked else head)
+            await writer.drain()
+            logger.debug('%s "%s %s" %s', environ['REMOTE_ADDR'], environ['REQUEST_METHOD'], environ['PATH_INFO'],
+                         status.split(' ', 1)[0])
+        except Exception as e:
+            if isinstance(e, ConnectionError):
+                raise
+            # Headers are gone, the cut response can only be told by closing
+            logger.error('%s %s failed: %s', environ['REQUEST_METHOD'], environ['PATH_INFO'], e)
+            return False
+        finally:
+            if hasattr(result, 'close'):
+                await call(result.close)
+        return keep_alive
+
+    def _head(self, status: str, headers: list, keep_alive: bool = False) -> bytes:
+        lines = ['HTTP/1.1 %s' % status]
+        lines.extend('%s: %s' % (name, value) for name, value in headers)
+        lines.append('Date: %s' % formatdate(usegmt=True))
+        lines.append('Connection: %s' % ('keep-alive' if keep_alive else 'close'))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: str, headers: list, body: bytes,
+                       keep_alive: bool = False):
+        writer.write(self._head(status, [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))]
+                                + headers, keep_alive) + body)
+        await writer.drain()
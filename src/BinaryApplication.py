@@ -0,0 +1,124 @@
+import logging
+from email.parser import BytesParser
+from email.policy import HTTP
+from os import fstat
+from urllib.parse import parse_qs
+
+from AerooServices import AerooServices, NoidentException
+from Metrics import ERRORS, REQUESTS
+
+BLOCK_SIZE = 64 * 1024  # Size of the blocks of a streamed download
+
+content_types: dict[str, str] = {
+    'pdf': 'application/pdf',
+    'odt': 'application/vnd.oasis.opendocument.text',
+    'ods': 'application/vnd.oasis.opendocument.spreadsheet',
+    'doc': 'application/msword',
+    'xls': 'application/vnd.ms-excel',
+    'csv': 'text/csv',
+}
+
+
+class BinaryApplication():
+    """ WSGI application for raw documents, without base64 nor JSON.
+
+    POST /convert?in=odt&out=pdf&preset=screen with the document as the body, either
+    `application/octet-stream` or `multipart/form-data`, answers the converted
+    bytes. It goes through the same `AerooServices.convert_bytes` path as the
+    JSON-RPC `convert` method.
+
+    GET /download?identifier=... streams a result spooled by `convert` or `join`.
+    """
+
+    def __init__(self, services: AerooServices):
+        self.services = services
+        self.paths = {
+            '/convert': self._convert,
+            '/download': self._download,
+        }
+
+    def __call__(self, environ, start_response):
+        handler = self.paths.get(environ.get('PATH_INFO', '/'))
+        if handler is None:
+            return self._error(start_response, '404 Not Found', 'Not found')
+        return handler(environ, start_response)
+
+    def _download(self, environ, start_response):
+        if environ['REQUEST_METHOD'] != 'GET':
+            return self._error(start_response, '405 Method Not Allowed', 'Only GET is allowed')
+        identifier = parse_qs(environ.get('QUERY_STRING', '')).get('identifier', [''])[0]
+        try:
+            result_file = self.services.open_result(identifier)
+        except NoidentException as e:
+            return self._error(start_response, '404 Not Found', str(e))
+        start_response('200 OK', [
+            ('Content-Type', 'application/octet-stream'),
+            ('Content-Length', str(fstat(result_file.fileno()).st_size)),
+        ])
+        return self._readBlocks(identifier, result_file)
+
+    def _readBlocks(self, identifier: str, result_file):
+        try:
+            with result_file:
+                for block in iter(lambda: result_file.read(BLOCK_SIZE), b''):
+                    yield block
+        finally:
+            self.services.release_result(identifier)
+
+    def _convert(self, environ, start_response):
+        logger = logging.getLogger('main')
+        if environ['REQUEST_METHOD'] != 'POST':
+            return self._error(start_response, '405 Method Not Allowed', 'Only POST is allowed')
+
+        params = {key: values[0] for key, values in parse_qs(environ.get('QUERY_STRING', '')).items()}
+        try:
+            content_length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+        if content_length <= 0:
+            return self._error(start_response, '411 Length Required', 'Content-Length is required')
+
+        body = environ['wsgi.input'].read(content_length)
+        content_type = environ.get('CONTENT_TYPE', 'application/octet-stream')
+        if content_type.split(';', 1)[0].strip() == 'multipart/form-data':
+            body = self._readMultipart(content_type, body, params)
+            if body is None:
+                return self._error(start_response, '400 Bad Request', 'No file in the multipart body')
+
+        in_mime = params.get('in', 'odt')
+        out_mime = params.get('out', 'pdf')
+        client_id = params.get('client_id', 'unknown')
+        REQUESTS.inc(method='http_convert', filter=out_mime, client_id=client_id)
+        try:
+            result = self.services.convert_bytes(body, in_mime=in_mime, out_mime=out_mime, client_id=client_id,
+                                                 pdf_preset=params.get('preset', ''))
+        except ValueError as e:
+            ERRORS.inc(method='http_convert', filter=out_mime, client_id=client_id)
+            return self._error(start_response, '400 Bad Request', str(e))
+        except Exception as e:
+            ERRORS.inc(method='http_convert', filter=out_mime, client_id=client_id)
+            logger.warning('Binary convert from %s failed: %s', client_id, e)
+            return self._error(start_response, '500 Internal Server Error', str(e))
+
+        start_response('200 OK', [
+            ('Content-Type', content_types.get(out_mime, 'application/octet-stream')),
+            ('Content-Length', str(len(result))),
+        ])
+        return [result]
+
+    def _readMultipart(self, content_type: str, body: bytes, params: dict):
+        """ Return the first file of a multipart body, the other fields are added to params. """
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + content_type.encode('latin-1') + b'\r\n\r\n' + body)
+        data = None
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if part.get_filename() is None and name != 'file':
+                params.setdefault(name, part.get_content().strip())
+            elif data is None:
+                data = part.get_payload(decode=True)
+        return data
+
+    def _error(self, start_response, status: str, message: str):
+        start_response(status, [('Content-Type', 'text/plain')])
+        return [message.encode('utf-8')]
@@ -1,39 +1,51 @@
-import threading
-from typing import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from typing import Callable, Optional
+
+UNWIND_GRACE = 30  # seconds for a cancelled call to fail once its office is gone
 
 
 class TimeoutExeption(Exception):
     pass
 
 
-class SharedObject(object):
-    response: str = ""
-
-
-class _Executor(threading.Thread):
-
-    def __init__(self, shared: SharedObject, toExecute: Callable, args: tuple):
-        super(_Executor, self).__init__()
-        self.to_execute = toExecute
-        self.args = args
-        self.shared = shared
-
-    def run(self):
-        self.shared.response = self.to_execute(*self.args)
-
-
-class ExecutorWithTimeout:
-    shared_obj = SharedObject()
-
-    def callWithTimeout(self, timeout_sec: int, callable: Callable, args: tuple) -> str:
+class Watchdog:
+    """ Runs office calls on a fixed pool of threads, with a future and a deadline per call.
+
+    A thread blocked in a UNO call cannot be interrupted: a call past its
+    deadline is cancelled by recycling the office it talks to, which makes the
+    call fail and gives the thread back to the pool. Results and exceptions
+    travel in the future of each call, never through shared state.
+    """
+
+    def __init__(self, workers: int):
+        """
+        Parameters
+        ----------
+        workers : int
+            Threads of the pool, leave room for calls still unwinding after a timeout
+        """
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='office-call')
+
+    def callWithTimeout(self, timeout_sec: int, callable: Callable, args: tuple,
+                        on_timeout: Optional[Callable[[], None]] = None,
+                        on_late: Optional[Callable[[Future], None]] = None):
+        """ Return callable(*args), or raise its exception, or TimeoutExeption after timeout_sec.
+
+        on_timeout is called when the call is already running at the deadline, to
+        kill what it waits on; the call then gets UNWIND_GRACE seconds to finish
+        before this method returns. When it is still running after them, on_late
+        gets its future, to keep the resource under it away from the next calls
+        until it ends.
+        """
         if timeout_sec <= 0:
             raise Exception("timeout_sec too short")
-        process = _Executor(self.shared_obj, callable, args)
-        process.start()
-        # Esperar el tiempo de timeout
-        process.join(timeout_sec)
-
-        if process.is_alive():
+        future = self._executor.submit(callable, *args)
+        try:
+            return future.result(timeout_sec)
+        except FutureTimeoutError:
+            if not future.cancel() and on_timeout is not None:
+                on_timeout()
+                wait([future], UNWIND_GRACE)
+                if not future.done() and on_late is not None:
+                    on_late(future)
             raise TimeoutExeption('TimeOut')
-
-        return self.shared_obj.response
@@ -1,18 +1,34 @@
-
+import heapq
 import logging
-from os import listdir, stat, unlink
+import threading
+from os import scandir, stat, unlink
 from threading import Thread
 from time import sleep, time
+from typing import Optional
+
+SHARD_LENGTH = 2  # spool subdirectories are named by the first hex digits of the file names
+META_SUFFIX = '.meta'
+PARTIAL_PREFIX = '_'  # files still being written
 
 
 class Cleaner(Thread):
-    """Clean old/unused files."""
+    """Clean old/unused files.
+
+    The files of the spool are kept in an in-memory index ordered by age,
+    `register` and `discard` are called by the services when they write,
+    rename or remove a file. Each pass only pops the expired files from the
+    index, and evicts the oldest ones while the spool is over its quota, but
+    never a partial file still being written nor a result held by a download. The
+    directory is only listed at start and every `resync` seconds, to pick up
+    files the services did not report.
+    """
     delay: int = 60
     expire: int = 1800
     spool_directory: str = '/tmp/aeroo-docs'
     spool_path: str = spool_directory + '/%s'
 
-    def __init__(self, delay: int = 60, expire: int = 1800, spool_directory: str = '/tmp/aeroo-docs'):
+    def __init__(self, delay: int = 60, expire: int = 1800, spool_directory: str = '/tmp/aeroo-docs',
+                 quota: int = 0, resync: int = 3600):
         """
         Parameters
         ----------
@@ -22,6 +38,10 @@ class Cleaner(Thread):
             seconds to consider a file obsolete (default is 1800, iqual to 30 minutes)
         spool_directory : str, optional
             directory for temp files to clean (default is '/tmp/aeroo-docs')
+        quota : int, optional
+            bytes the spool files may use, the oldest are deleted past it (default is 0, no quota)
+        resync : int, optional
+            seconds between full scans of the spool directory (default is 3600)
         """
         super(Cleaner, self).__init__()
         self.name = 'Cleaner thread'
@@ -29,15 +49,136 @@ class Cleaner(Thread):
         self.expire = expire
         self.spool_directory = spool_directory
         self.spool_path = spool_directory + '/%s'
+        self.quota = quota
+        self.resync_delay = resync
+        self._lock = threading.Lock()
+        self._entries: dict[str, tuple[float, int]] = {}  # name: (mtime, size)
+        self._heap: list[tuple[float, str]] = []  # (mtime, name), stale items are skipped when popped
+        self._bytes = 0
+        self._held: dict[str, int] = {}  # name: downloads reading it
 
     def run(self):
-        logger = logging.getLogger('main')
+        last_resync = 0.0
         while True:
-            files = listdir(self.spool_directory)
-            for fname in files:
-                testfile = self.spool_path % fname
-                atribs = stat(testfile)
-                if int(time()) - atribs.st_mtime > self.expire:
-                    unlink(testfile)
-                    logger.debug(f'Cleaner: {testfile} deleted')
+            if time() - last_resync >= self.resync_delay:
+                self.resync()
+                last_resync = time()
+            self.clean()
             sleep(self.delay)
+
+    def register(self, fname: str, mtime: Optional[float] = None, size: Optional[int] = None):
+        """ Index a file of the spool, created or written now. """
+        if mtime is None or size is None:
+            try:
+                atribs = stat(self.spool_path % fname)
+            except FileNotFoundError:
+                self.discard(fname)
+                return
+            mtime, size = atribs.st_mtime, atribs.st_size
+        with self._lock:
+            old_size = self._entries.get(fname, (0.0, 0))[1]
+            self._entries[fname] = (mtime, size)
+            self._bytes += size - old_size
+            heapq.heappush(self._heap, (mtime, fname))
+
+    def discard(self, fname: str):
+        """ Forget a file renamed or deleted by someone else. """
+        with self._lock:
+            _, size = self._entries.pop(fname, (0.0, 0))
+            self._bytes -= size
+
+    def hold(self, fname: str):
+        """ Keep a file out of the quota eviction while a download reads it, until `release`. """
+        with self._lock:
+            self._held[fname] = self._held.get(fname, 0) + 1
+
+    def release(self, fname: str):
+        with self._lock:
+            holds = self._held.pop(fname, 0) - 1
+            if holds > 0:
+                self._held[fname] = holds
+
+    def resync(self):
+        """ Rebuild the index from the spool directory and its shards. """
+        entries = {}
+        self._scan(self.spool_directory, '', entries)
+        with self._lock:
+            self._entries = entries
+            self._heap = [(mtime, fname) for fname, (mtime, _) in entries.items()]
+            heapq.heapify(self._heap)
+            self._bytes = sum(size for _, size in entries.values())
+        logging.getLogger('main').debug('Cleaner: %s files, %s bytes in the spool' % (len(entries), self._bytes))
+
+    def _scan(self, directory: str, prefix: str, entries: dict):
+        with scandir(directory) as files:
+            for entry in files:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        # Shards are named by two hex digits, other subdirectories like
+                        # the conversion cache handle their own eviction
+                        if not prefix and len(entry.name) == SHARD_LENGTH:
+                            self._scan(entry.path, entry.name + '/', entries)
+                    elif entry.is_file(follow_symlinks=False) and not entry.name.endswith(META_SUFFIX):
+                        atribs = entry.stat(follow_symlinks=False)
+                        entries[prefix + entry.name] = (atribs.st_mtime, atribs.st_size)
+                except FileNotFoundError:
+                    continue
+
+    def clean(self):
+        """ Delete the expired files, then the oldest ones while over the quota. """
+        logger = logging.getLogger('main')
+        now = time()
+        for fname in self._pop_expired(now):
+            self._unlink(fname)
+            logger.debug(f'Cleaner: {self.spool_path % fname} deleted')
+        if self.quota:
+            for fname in self._pop_over_quota():
+                self._unlink(fname)
+                logger.debug(f'Cleaner: {self.spool_path % fname} evicted, spool over quota')
+
+    def _pop_expired(self, now: float) -> list[str]:
+        expired = []
+        with self._lock:
+            while self._heap and now - self._heap[0][0] > self.expire:
+                fname = self._pop()
+                if fname:
+                    # A hold never released, like a download the client dropped, ends with the file
+                    self._held.pop(fname, None)
+                    expired.append(fname)
+        return expired
+
+    def _pop_over_quota(self) -> list[str]:
+        evicted = []
+        kept = []
+        with self._lock:
+            while self._heap and self._bytes > self.quota:
+                fname = self._heap[0][1]
+                if fname.rsplit('/', 1)[-1].startswith(PARTIAL_PREFIX) or fname in self._held:
+                    # An upload or a result still being written, or a result being downloaded
+                    kept.append(heapq.heappop(self._heap))
+                    continue
+                fname = self._pop()
+                if fname:
+                    evicted.append(fname)
+            for item in kept:
+                heapq.heappush(self._heap, item)
+        return evicted
+
+    def _pop(self) -> Optional[str]:
+        """ Pop the oldest file out of the index, None for a stale heap item. Called with the lock held. """
+        mtime, fname = heapq.heappop(self._heap)
+        entry = self._entries.get(fname)
+        if entry is None or entry[0] != mtime:
+            # Written again or discarded since this item was pushed
+            return None
+        del self._entries[fname]
+        self._bytes -= entry[1]
+        return fname
+
+    def _unlink(self, fname: str):
+        # The file and its metadata sidecar
+        for testfile in (self.spool_path % fname, self.spool_path % fname + META_SUFFIX):
+            try:
+                unlink(testfile)
+            except FileNotFoundError:
+                pass
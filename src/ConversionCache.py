@@ -0,0 +1,160 @@
+import logging
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from os import makedirs, rename, scandir, unlink, utime
+from typing import Optional
+
+
+class ConversionCache():
+    """ Content addressed cache of conversion results.
+
+    Results are keyed by a hash of the decoded input and the conversion options.
+    There is an in-memory LRU tier and an optional on-disk tier, both bounded
+    by bytes; a disk hit is promoted to memory.
+    """
+
+    def __init__(self, memory_bytes: int = 0, disk_bytes: int = 0, directory: Optional[str] = None):
+        """
+        Parameters
+        ----------
+        memory_bytes : int, optional
+            Maximum size of the in-memory tier, 0 disables it (default is 0)
+        disk_bytes : int, optional
+            Maximum size of the on-disk tier, 0 disables it (default is 0)
+        directory : str, optional
+            Directory of the on-disk tier, required when disk_bytes is set
+        """
+        if disk_bytes and not directory:
+            raise ValueError('The disk cache needs a directory')
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._disk: OrderedDict[str, int] = OrderedDict()
+        self._disk_size = 0
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.disk_bytes:
+            self._load_disk()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.memory_bytes or self.disk_bytes)
+
+    def key(self, data: bytes, *options, digest: Optional[str] = None) -> str:
+        """ Hash of the document data and everything that changes the result.
+
+        digest is the sha256 of data when it is already known, like for spooled uploads.
+        """
+        key = sha256((digest or sha256(data).hexdigest()).encode())
+        for option in options:
+            key.update(b'\0' + repr(option).encode())
+        return key.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        logger = logging.getLogger('main')
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return data
+            if key not in self._disk:
+                self.misses += 1
+                return None
+            self._disk.move_to_end(key)
+        try:
+            with open(self._path(key), 'rb') as cachefile:
+                data = cachefile.read()
+            utime(self._path(key))
+        except OSError as e:
+            logger.warning('Cache: failed to read %s: %s', key, e)
+            with self._lock:
+                self._forget_disk(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits_disk += 1
+            self._store_memory(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        logger = logging.getLogger('main')
+        with self._lock:
+            self._store_memory(key, data)
+            if not self.disk_bytes or key in self._disk or len(data) > self.disk_bytes:
+                return
+        tmp_path = self._path('_%s.%s' % (key, threading.get_ident()))
+        try:
+            with open(tmp_path, 'wb') as cachefile:
+                cachefile.write(data)
+            rename(tmp_path, self._path(key))
+        except OSError as e:
+            logger.warning('Cache: failed to write %s: %s', key, e)
+            return
+        with self._lock:
+            self._disk[key] = len(data)
+            self._disk_size += len(data)
+            self._evict_disk()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits_memory': self.hits_memory,
+                'hits_disk': self.hits_disk,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_size,
+                'memory_limit': self.memory_bytes,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_size,
+                'disk_limit': self.disk_bytes,
+            }
+
+    def _path(self, key: str) -> str:
+        return '%s/%s' % (self.directory, key)
+
+    def _store_memory(self, key: str, data: bytes):
+        if key in self._memory or len(data) > self.memory_bytes:
+            return
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, old_data = self._memory.popitem(last=False)
+            self._memory_size -= len(old_data)
+            self.evictions += 1
+
+    def _evict_disk(self):
+        while self._disk_size > self.disk_bytes:
+            old_key, old_size = self._disk.popitem(last=False)
+            self._disk_size -= old_size
+            self.evictions += 1
+            try:
+                unlink(self._path(old_key))
+            except FileNotFoundError:
+                pass
+
+    def _forget_disk(self, key: str):
+        size = self._disk.pop(key, None)
+        if size is not None:
+            self._disk_size -= size
+
+    def _load_disk(self):
+        """ Rebuild the disk index from a previous run, oldest entries first. """
+        makedirs(self.directory, exist_ok=True)
+        entries = []
+        with scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith('_'):
+                    atribs = entry.stat()
+                    entries.append((atribs.st_mtime, entry.name, atribs.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_size += size
+        self._evict_disk()
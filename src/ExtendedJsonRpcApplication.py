@@ -1,8 +1,102 @@
 import json
+import re
+from logging import DEBUG
+from typing import Callable, Optional
 from urllib.parse import parse_qs
 from xmlrpc.client import PARSE_ERROR
 from jsonrpc2 import JsonRpcApplication, errors, logger, GENERIC_APPLICATION_ERROR
 
+try:
+    import orjson
+except ImportError:  # optional, a faster JSON parser and encoder
+    orjson = None
+try:
+    import ujson
+except ImportError:  # optional, used when orjson is missing
+    ujson = None
+
+
+def json_backend(name: str) -> tuple[Callable, Callable]:
+    """ The loads and dumps of a JSON backend, 'orjson', 'ujson' or 'json'; dumps returns bytes. """
+    if name == 'orjson':
+        def orjson_dumps(obj) -> bytes:
+            # Like json, integer keys are written as strings
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        return orjson.loads, orjson_dumps
+    if name == 'ujson':
+        def ujson_dumps(obj) -> bytes:
+            return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+        return ujson.loads, ujson_dumps
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+    return json.loads, json_dumps
+
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'ujson' if ujson is not None else 'json'
+json_loads, json_dumps = json_backend(JSON_BACKEND)
+
+LARGE_PAYLOAD = 64 * 1024  # bodies and strings from which the base64 payload is handled apart
+DATA_RE = re.compile(rb'"data"\s*:\s*"')
+JSON_UNSAFE = bytes(range(32)) + b'"\\'  # characters a JSON string cannot hold unescaped
+PAYLOAD_PLACEHOLDER = '__aeroo_payload__'
+LOG_BODY_LIMIT = 1024
+
+
+def loads_request(body: bytes):
+    """ Parse a JSON-RPC request, the large `data` param is sliced out of the bytes instead of scanned.
+
+    The base64 of a document needs no escaping: the rest of the body is parsed
+    with an empty `data`, which then gets the bytes between its quotes.
+    """
+    if len(body) >= LARGE_PAYLOAD:
+        match = DATA_RE.search(body)
+        if match:
+            start = match.end()
+            end = body.find(b'"', start)
+            if end > 0 and body.find(b'\\', start, end) < 0:
+                view = memoryview(body)
+                try:
+                    data = json_loads(b''.join((view[:start], view[end:])))
+                except ValueError:
+                    data = None
+                params = data.get('params') if isinstance(data, dict) else None
+                if isinstance(params, dict) and params.get('data') == '':
+                    params['data'] = str(view[start:end], 'utf-8')
+                    return data
+    return json_loads(body)
+
+
+def dumps_response(resdata) -> list[bytes]:
+    """ Serialize a JSON-RPC response, in pieces when its base64 payload is copied as is.
+
+    The payload is the result, or the `data` of a result dict like the ones of
+    `download`. It is only copied when it needs no escaping, which base64 never does.
+    """
+    result = resdata.get('result') if isinstance(resdata, dict) else None
+    payload = _rawString(result)
+    if payload is not None:
+        envelope = dict(resdata, result=PAYLOAD_PLACEHOLDER)
+    else:
+        payload = _rawString(result.get('data')) if isinstance(result, dict) else None
+        if payload is None:
+            return [json_dumps(resdata)]
+        envelope = dict(resdata, result=dict(result, data=PAYLOAD_PLACEHOLDER))
+    pieces = json_dumps(envelope).split(b'"%s"' % PAYLOAD_PLACEHOLDER.encode())
+    if len(pieces) != 2:
+        return [json_dumps(resdata)]
+    return [pieces[0], b'"', payload, b'"', pieces[1]]
+
+
+def _rawString(value) -> Optional[bytes]:
+    """ The bytes of a large string that needs no JSON escaping, else None. """
+    if not isinstance(value, str) or len(value) < LARGE_PAYLOAD or not value.isascii():
+        return None
+    raw = value.encode('ascii')
+    if len(raw.translate(None, JSON_UNSAFE)) != len(raw):
+        return None
+    return raw
+
 
 class ExtendedJsonRpcApplication(JsonRpcApplication):
 
@@ -28,38 +122,35 @@ class ExtendedJsonRpcApplication(JsonRpcApplication):
 
             if 'error' in resdata:
                 if resdata['error'].get('code', GENERIC_APPLICATION_ERROR) == GENERIC_APPLICATION_ERROR:  # type: ignore
-                    start_response('500 Internal Server Error', [('Content-Type', 'application/json')])
-                    return [json.dumps(resdata).encode('utf-8')]
+                    return self._respond(start_response, '500 Internal Server Error', resdata)
 
-            start_response('200 OK', [('Content-Type', 'application/json')])
-            return [json.dumps(resdata).encode('utf-8')]
+            return self._respond(start_response, '200 OK', resdata)
 
         # POST: Add automaticaly missing params
         if environ['REQUEST_METHOD'] != "POST":
             start_response('405 Method Not Allowed',
                            [('Content-type', 'text/plain')])
-            return ["405 Method Not Allowed"]
+            return [b"405 Method Not Allowed"]
 
         logger.debug("check content-type")
         if environ['CONTENT_TYPE'].split(';', 1)[0] not in ('application/json', 'application/json-rpc'):
             start_response('400 Bad Request',
                            [('Content-type', 'text/plain')])
-            return ["Content-type must by application/json"]
+            return [b"Content-type must by application/json"]
 
         content_length = -1
         if "CONTENT_LENGTH" in environ:
             content_length = int(environ["CONTENT_LENGTH"])
         try:
-            body = environ['wsgi.input'].read(content_length)
-            body = body.decode('utf-8')
-            data: dict = json.loads(body)
+            # Parsed from the bytes, without decoding the body into a str first
+            data: dict = loads_request(environ['wsgi.input'].read(content_length))
             if not data['params']:
                 data['params'] = {}
             if not 'client_id' in data['params']:
-                data['params']['client_id'] = 'unknown - %s' % environ['REMOTE_ADDR']
+                # One label for every anonymous client, not a queue and metric series per address
+                data['params']['client_id'] = 'unknown'
 
             resdata = self.rpc(data)
-            logger.debug("response %s" % json.dumps(resdata))
         except ValueError as e:
             resdata = {
                 'jsonrpc': '2.0',
@@ -70,9 +161,17 @@ class ExtendedJsonRpcApplication(JsonRpcApplication):
                 }
             }
 
+        if resdata:
+            return self._respond(start_response, '200 OK', resdata)
         start_response('200 OK',
                        [('Content-type', 'application/json')])
-
-        if resdata:
-            return [json.dumps(resdata).encode('utf-8')]
         return []
+
+    def _respond(self, start_response, status: str, resdata) -> list[bytes]:
+        # Serialized once, the debug log shows the start of the same bytes
+        body = dumps_response(resdata)
+        if logger.isEnabledFor(DEBUG):
+            logger.debug("response %s", body[0][:LOG_BODY_LIMIT])
+        start_response(status, [('Content-type', 'application/json'),
+                                ('Content-Length', str(sum(len(piece) for piece in body)))])
+        return body
@@ -0,0 +1,158 @@
+import heapq
+import itertools
+import logging
+import threading
+from contextlib import contextmanager
+from time import time
+from typing import Optional
+
+
+class _Ticket():
+    """ A request waiting for an office instance. """
+
+    def __init__(self, client_id: str, start: float, finish: float):
+        self.client_id = client_id
+        self.start = start
+        self.finish = finish
+        self.enqueued = time()
+        self.instance = None
+        self.ready = threading.Event()
+
+
+class _ClientStats():
+
+    def __init__(self):
+        self.queued = 0
+        self.served = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def as_dict(self, weight: float) -> dict:
+        return {
+            'weight': weight,
+            'queued': self.queued,
+            'served': self.served,
+            'wait_avg': round(self.wait_total / self.served, 6) if self.served else 0.0,
+            'wait_max': round(self.wait_max, 6),
+        }
+
+
+class FairScheduler():
+    """ Weighted fair queueing of office instances by client_id.
+
+    Every request gets a virtual finish tag, `max(virtual time, last tag of the
+    client) + 1 / weight`, and a free instance goes to the smallest tag. A client
+    sending thousands of requests only gets its share, the others keep being
+    served between them instead of waiting behind the whole batch.
+    """
+
+    def __init__(self, instances: list, weights: Optional[dict[str, float]] = None, default_weight: float = 1.0):
+        """
+        Parameters
+        ----------
+        instances : list
+            Resources handed out, the office instances of the pool
+        weights : dict, optional
+            Weight by client_id, a client with weight 2 gets twice the share of a client with weight 1
+        default_weight : float, optional
+            Weight of the clients not in weights (default is 1.0)
+        """
+        self.weights = weights or {}
+        self.default_weight = default_weight
+        self.resources = list(instances)
+        self._idle = list(instances)
+        self._quarantined: dict = {}  # instance: holds keeping it out of the idle list
+        self._parked: list = []  # quarantined instances whose lease ended
+        self._lock = threading.Lock()
+        self._waiting: list = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: dict[str, float] = {}
+        self._stats: dict[str, _ClientStats] = {}
+
+    def weight(self, client_id: str) -> float:
+        return self.weights.get(client_id, self.default_weight)
+
+    @contextmanager
+    def lease(self, client_id: str = 'Unknown'):
+        """ Wait for the turn of the client and hold an instance until the block ends. """
+        ticket = self._enqueue(client_id)
+        ticket.ready.wait()
+        try:
+            yield ticket.instance
+        finally:
+            self._release(ticket.instance)
+
+    @property
+    def queued(self) -> int:
+        with self._lock:
+            return len(self._waiting)
+
+    @property
+    def busy(self) -> int:
+        with self._lock:
+            return len(self.resources) - len(self._idle)
+
+    def stats(self) -> dict:
+        """ Queue depth and wait times by client_id. """
+        with self._lock:
+            return {client_id: stats.as_dict(self.weight(client_id)) for client_id, stats in self._stats.items()}
+
+    def _enqueue(self, client_id: str) -> _Ticket:
+        with self._lock:
+            start = max(self._virtual_time, self._last_finish.get(client_id, 0.0))
+            ticket = _Ticket(client_id, start, start + 1.0 / self.weight(client_id))
+            self._last_finish[client_id] = ticket.finish
+            self._stats.setdefault(client_id, _ClientStats()).queued += 1
+            heapq.heappush(self._waiting, (ticket.finish, next(self._sequence), ticket))
+            self._dispatch()
+        return ticket
+
+    def quarantine(self, instance):
+        """ Keep a leased instance out of the idle list after its lease ends, until `reinstate`. """
+        with self._lock:
+            self._quarantined[instance] = self._quarantined.get(instance, 0) + 1
+
+    def reinstate(self, instance):
+        """ Drop a hold of `quarantine`, the instance is handed out again once its lease ended and no hold is left. """
+        with self._lock:
+            holds = self._quarantined.pop(instance, 0) - 1
+            if holds > 0:
+                self._quarantined[instance] = holds
+            elif instance in self._parked:
+                self._parked.remove(instance)
+                self._idle.append(instance)
+                self._dispatch()
+
+    @property
+    def quarantined(self) -> int:
+        with self._lock:
+            return len(self._quarantined)
+
+    def _release(self, instance):
+        with self._lock:
+            if instance in self._quarantined:
+                self._parked.append(instance)
+                return
+            self._idle.append(instance)
+            self._dispatch()
+
+    def _dispatch(self):
+        """ Hand idle instances to the smallest tags, called with the lock held. """
+        logger = logging.getLogger('main')
+        while self._idle and self._waiting:
+            _, _, ticket = heapq.heappop(self._waiting)
+            self._virtual_time = max(self._virtual_time, ticket.start)
+            wait = time() - ticket.enqueued
+            stats = self._stats[ticket.client_id]
+            stats.queued -= 1
+            stats.served += 1
+            stats.wait_total += wait
+            stats.wait_max = max(stats.wait_max, wait)
+            ticket.instance = self._idle.pop()
+            ticket.ready.set()
+            if wait > 1:
+                logger.debug('  %s waited %s s for an office', ticket.client_id, round(wait, 3))
+        if not self._waiting:
+            # Idle clients do not keep credit nor debt for the next burst
+            self._last_finish.clear()
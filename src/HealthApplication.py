@@ -0,0 +1,140 @@
+import json
+import logging
+from threading import Thread
+from time import sleep, time
+from typing import Optional
+
+from AerooServices import AerooServices
+
+
+class Canary(Thread):
+    """ Runs the `test` conversion every `delay` seconds and keeps its last result.
+
+    The probes read the result instead of converting a document each time, so
+    they never wait behind the conversions nor add load to the offices.
+    """
+
+    def __init__(self, services: AerooServices, delay: int = 300):
+        """
+        Parameters
+        ----------
+        services : AerooServices
+            Services running the test conversion
+        delay : int, optional
+            Seconds between two test conversions (default is 300)
+        """
+        super(Canary, self).__init__()
+        self.name = 'Canary thread'
+        self.daemon = True
+        self.services = services
+        self.delay = delay
+        self.last_run = 0.0
+        self.last_ok = 0.0
+        self.seconds = 0.0
+        self.error: Optional[str] = None
+
+    @property
+    def healthy(self) -> bool:
+        """ False when the last test conversion failed, True before the first one. """
+        return self.error is None
+
+    def run(self):
+        logger = logging.getLogger('main')
+        while True:
+            start_time = time()
+            try:
+                self.services.test(client_id='canary')
+            except Exception as e:
+                self.error = str(e) or e.__class__.__name__
+                logger.warning('Canary conversion failed: %s', self.error)
+            else:
+                self.error = None
+                self.last_ok = time()
+            self.last_run = start_time
+            self.seconds = time() - start_time
+            sleep(self.delay)
+
+    def stats(self) -> dict:
+        return {
+            'healthy': self.healthy,
+            'last_run': round(self.last_run, 3),
+            'last_ok': round(self.last_ok, 3),
+            'seconds': round(self.seconds, 6),
+            'error': self.error,
+        }
+
+
+class HealthApplication():
+    """ WSGI application of the liveness and readiness probes.
+
+    GET /healthz answers while the process serves requests. GET /readyz answers
+    503 when no office instance has a process running or a connection, or when
+    the last canary conversion failed. Both only read cached state: the
+    connections kept by the instances, the queue depths and the times of the last
+    successful conversion and canary run. Neither takes an office lease.
+    """
+
+    def __init__(self, services: AerooServices, canary: Optional[Canary] = None, jobs=None):
+        """
+        Parameters
+        ----------
+        services : AerooServices
+            Services whose office pool is reported
+        canary : Canary, optional
+            Background test conversion, not reported when missing
+        jobs : JobQueue, optional
+            Queue of the asynchronous jobs, its depth is reported
+        """
+        self.services = services
+        self.canary = canary
+        self.jobs = jobs
+        self.started = time()
+        self.paths = {
+            '/healthz': self._healthz,
+            '/readyz': self._readyz,
+        }
+
+    def __call__(self, environ, start_response):
+        handler = self.paths.get(environ.get('PATH_INFO', '/'))
+        if handler is None:
+            return self._respond(start_response, '404 Not Found', {'status': 'not found'})
+        return handler(environ, start_response)
+
+    def _healthz(self, environ, start_response):
+        return self._respond(start_response, '200 OK', {'status': 'ok', 'uptime': round(time() - self.started, 3)})
+
+    def _readyz(self, environ, start_response):
+        office_pool = self.services.office_pool
+        supervisor = office_pool.supervisor
+        instances = {}
+        for office in office_pool.instances:
+            instances[office.index] = {
+                'process': office.process,
+                'connected': office.star_office_client is not None,
+                'running': supervisor.running(office) if supervisor is not None else None,
+            }
+        ready = any(instance['connected'] or instance['running'] for instance in instances.values())
+        if self.canary is not None:
+            ready = ready and self.canary.healthy
+        last_success = self.services.last_success
+        queues = {lane: scheduler.queued for lane, scheduler in office_pool.lanes.items()}
+        if self.jobs is not None:
+            queues['jobs'] = self.jobs.queued
+        body = {
+            'status': 'ready' if ready else 'unavailable',
+            'instances': instances,
+            'standby': office_pool.standby,
+            'busy': {lane: scheduler.busy for lane, scheduler in office_pool.lanes.items()},
+            'queued': queues,
+            'last_success': round(last_success, 3),
+            'last_success_age': round(time() - last_success, 3) if last_success else None,
+            'canary': self.canary.stats() if self.canary is not None else None,
+        }
+        return self._respond(start_response, '200 OK' if ready else '503 Service Unavailable', body)
+
+    def _respond(self, start_response, status: str, body: dict):
+        data = json.dumps(body).encode('utf-8')
+        start_response(status, [('Content-Type', 'application/json'),
+                                ('Cache-Control', 'no-store'),
+                                ('Content-Length', str(len(data)))])
+        return [data]
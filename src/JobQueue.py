@@ -0,0 +1,186 @@
+import logging
+import threading
+import uuid
+from queue import Full, Queue
+from time import time
+from typing import Optional, Union
+
+from AerooServices import DOWNLOAD_CHUNK_SIZE, AerooServices, NoidentException, filters
+
+
+class Job():
+    """ A conversion or join waiting for, or running on, a background worker. """
+
+    def __init__(self, method: str, kwargs: dict, client_id: str):
+        self.id = uuid.uuid4().hex
+        self.method = method
+        self.kwargs = kwargs
+        self.client_id = client_id
+        self.state = 'queued'
+        self.created = time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        now = time()
+        return {
+            'job_id': self.id,
+            'method': self.method,
+            'state': self.state,
+            'waiting': round((self.started or now) - self.created, 3),
+            'running': round((self.finished or now) - self.started, 3) if self.started else 0,
+            'result': self.result,
+            'error': self.error,
+        }
+
+
+class JobQueue():
+    """ Background worker queue in front of AerooServices.
+
+    `submit_convert` and `submit_join` return a job id right away, the work runs
+    on a worker thread and its result is spooled, so `job_result` hands it back
+    in chunks like `download`. The document of a `submit_convert` is spooled like an
+    upload before it is queued. Finished jobs are forgotten after `expire` seconds,
+    their spooled documents and results are removed by the Cleaner.
+    """
+
+    def __init__(self, services: AerooServices, workers: int = 1, max_queued: int = 1000, expire: int = 1800):
+        """
+        Parameters
+        ----------
+        services : AerooServices
+            Services used to run the jobs
+        workers : int, optional
+            Number of worker threads (default is 1)
+        max_queued : int, optional
+            Maximum number of jobs waiting for a worker (default is 1000)
+        expire : int, optional
+            Seconds a finished job is kept (default is 1800, iqual to the Cleaner expiration)
+        """
+        self.services = services
+        self.expire = expire
+        self._jobs: dict[str, Job] = {}
+        self._jobs_lock = threading.Lock()
+        self._queue: Queue = Queue(max_queued)
+        for index in range(workers):
+            worker = threading.Thread(target=self._work, name='Job worker %s' % index, daemon=True)
+            worker.start()
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def submit_convert(self, data: str = "", identifier: str = "", in_mime: str = "odt",
+                       out_mime: Union[str, list[str]] = "pdf", username: str = "", password: str = "",
+                       client_id: str = 'Unknown', pdf_preset: str = "", pdf_options: Optional[dict] = None):
+        """ Enqueue a `convert` and return its job id. """
+        self._check_room()
+        # Refused now rather than as a failed job
+        for mime in out_mime if isinstance(out_mime, list) else [out_mime]:
+            self.services.filter_data(filters.get(mime, "writer8"), pdf_preset, pdf_options)
+        if data != "":
+            # The document waits in the spool like an upload, a queued job only holds its identifier
+            identifier = self._spool(data, client_id)
+        return self._submit('convert', client_id, identifier=identifier, in_mime=in_mime,
+                            out_mime=out_mime, username=username, password=password,
+                            pdf_preset=pdf_preset, pdf_options=pdf_options)
+
+    def submit_join(self, idents: list[str], in_mime: str = 'writer8', out_mime: str = "writer_pdf_Export",
+                    username: str = "", password: str = "", client_id: str = 'Unknown',
+                    pdf_preset: str = "", pdf_options: Optional[dict] = None):
+        """ Enqueue a `join` and return its job id. """
+        self.services.filter_data(filters.get(out_mime, "writer_pdf_Export") if out_mime else "writer_pdf_Export",
+                                  pdf_preset, pdf_options)
+        return self._submit('join', client_id, idents=list(idents), in_mime=in_mime, out_mime=out_mime,
+                            username=username, password=password, pdf_preset=pdf_preset, pdf_options=pdf_options)
+
+    def job_status(self, job_id: str = "", client_id: str = 'Unknown'):
+        """ State of a job: queued, running, done or failed, with its waiting and running times. """
+        job = self._get(job_id)
+        status = job.as_dict()
+        if job.state == 'queued':
+            with self._queue.mutex:
+                waiting = list(self._queue.queue)
+            status['position'] = waiting.index(job) + 1 if job in waiting else 0
+        return status
+
+    def job_result(self, job_id: str = "", offset: int = 0, length: int = DOWNLOAD_CHUNK_SIZE,
+                   client_id: str = 'Unknown', out_mime: str = ""):
+        """ A chunk of the output of a finished job, as returned by `download`.
+
+        The out_mime picks one of the outputs of a conversion to several formats.
+        """
+        job = self._get(job_id)
+        if job.state == 'failed':
+            raise Exception('Job %s failed: %s' % (job.id, job.error))
+        if job.state != 'done':
+            raise Exception('Job %s is %s' % (job.id, job.state))
+        result = job.result
+        if 'identifier' not in result:
+            if out_mime not in result:
+                raise Exception('Job %s has no %s output, out_mime is one of %s' % (job.id, out_mime or 'default',
+                                                                                  ', '.join(result)))
+            result = result[out_mime]
+        chunk = self.services.download(result['identifier'], offset, length, client_id=client_id)
+        chunk['job_id'] = job.id
+        return chunk
+
+    def _check_room(self):
+        # Refused before the document is spooled for nothing
+        if self._queue.full():
+            raise Exception('Job queue is full')
+
+    def _spool(self, data: str, client_id: str) -> str:
+        uploaded = self.services.upload(data=data, is_last=True, client_id=client_id)
+        if not uploaded:
+            raise Exception('Could not spool the job document')
+        return uploaded['identifier']
+
+    def _submit(self, method: str, client_id: str, **kwargs) -> dict:
+        logger = logging.getLogger('main')
+        self._prune()
+        job = Job(method, kwargs, client_id)
+        with self._jobs_lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except Full:
+            with self._jobs_lock:
+                del self._jobs[job.id]
+            raise Exception('Job queue is full')
+        logger.debug('Job %s %s queued from %s', job.id, method, client_id)
+        return {'job_id': job.id, 'state': job.state}
+
+    def _get(self, job_id: str) -> Job:
+        with self._jobs_lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise NoidentException('Wrong or expired job.')
+        return job
+
+    def _prune(self):
+        limit = time() - self.expire
+        with self._jobs_lock:
+            for job_id in [job.id for job in self._jobs.values() if job.finished and job.finished < limit]:
+                del self._jobs[job_id]
+
+    def _work(self):
+        logger = logging.getLogger('main')
+        while True:
+            job = self._queue.get()
+            job.state = 'running'
+            job.started = time()
+            logger.debug('Job %s %s started', job.id, job.method)
+            try:
+                method = getattr(self.services, job.method)
+                job.result = method(client_id=job.client_id, spool=True, **job.kwargs)
+                job.finished = time()
+                job.state = 'done'
+            except Exception as e:
+                logger.warning('Job %s %s failed: %s', job.id, job.method, e)
+                job.error = str(e)
+                job.finished = time()
+                job.state = 'failed'
+            self._queue.task_done()
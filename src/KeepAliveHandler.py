@@ -0,0 +1,208 @@
+import io
+import socket
+from typing import BinaryIO
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler
+
+MAX_LINE = 65536  # request, header and chunk size lines
+DISCARD_LIMIT = 64 * 1024 * 1024  # body bytes left unread by the application and dropped to keep the connection
+MAX_BODY_BYTES = 256 * 1024 * 1024
+
+
+class BodyTooLarge(ValueError):
+    """ The request body is over the limit of the server. """
+
+
+def read_chunked(rfile: BinaryIO, limit: int = 0) -> bytes:
+    """ Decode a `Transfer-Encoding: chunked` body, raises ValueError when it is malformed.
+
+    The body is held in memory, past `limit` bytes (0 for no limit) BodyTooLarge is raised
+    before the chunk is read.
+    """
+    blocks = []
+    total = 0
+    while True:
+        line = rfile.readline(MAX_LINE + 1)
+        size = int(line.split(b';', 1)[0].strip(), 16)
+        if not size:
+            break
+        total += size
+        if limit and total > limit:
+            raise BodyTooLarge('chunked body over %s bytes' % limit)
+        block = rfile.read(size)
+        if len(block) < size or rfile.readline(MAX_LINE + 1).strip():
+            raise ValueError('truncated chunk')
+        blocks.append(block)
+    # Trailers are ignored, until the empty line
+    while rfile.readline(MAX_LINE + 1).strip():
+        pass
+    return b''.join(blocks)
+
+
+class LimitedReader(io.RawIOBase):
+    """ wsgi.input of a keep-alive connection: reads stop at the end of the body, not of the stream. """
+
+    def __init__(self, rfile: BinaryIO, length: int):
+        self.rfile = rfile
+        self.remaining = length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self.remaining <= 0:
+            return 0
+        data = self.rfile.read(min(len(buffer), self.remaining))
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def readline(self, size=-1) -> bytes:
+        if self.remaining <= 0:
+            return b''
+        line = self.rfile.readline(self.remaining if size < 0 else min(size, self.remaining))
+        self.remaining -= len(line)
+        return line
+
+    def discard(self) -> bool:
+        """ Read what the application left of the body, False when too much is left or the client is gone. """
+        if self.remaining > DISCARD_LIMIT:
+            return False
+        while self.remaining > 0:
+            if not self.read(min(self.remaining, MAX_LINE)):
+                return False
+        return True
+
+
+class KeepAliveHandler(ServerHandler):
+    """ ServerHandler answering HTTP/1.1, with a length or chunks so the connection can be reused. """
+
+    http_version = '1.1'
+    chunked = False
+
+    def cleanup_headers(self):
+        # Sets Content-Length when the application returned a single block
+        super(KeepAliveHandler, self).cleanup_headers()
+        if self.request_handler.close_connection:
+            self.headers['Connection'] = 'close'
+        elif 'Content-Length' not in self.headers:
+            if self.request_handler.request_version == 'HTTP/1.1':
+                self.headers['Transfer-Encoding'] = 'chunked'
+                self.chunked = True
+            else:
+                # An HTTP/1.0 client reads the body until the connection is closed
+                self.request_handler.close_connection = True
+                self.headers['Connection'] = 'close'
+
+    def write(self, data: bytes):
+        if not self.status:
+            raise AssertionError("write() before start_response()")
+        if not self.headers_sent:
+            # The Content-Length of an application returning a single block
+            self.bytes_sent = len(data)
+            self.send_headers()
+        else:
+            self.bytes_sent += len(data)
+        if self.chunked:
+            if data:
+                self._write(b'%x\r\n%s\r\n' % (len(data), data))
+                self._flush()
+        else:
+            self._write(data)
+            self._flush()
+
+    def finish_content(self):
+        if self.chunked:
+            self._write(b'0\r\n\r\n')
+            self._flush()
+        else:
+            super(KeepAliveHandler, self).finish_content()
+
+    def handle_error(self):
+        # The response may be cut, the next one would be read as its end
+        self.request_handler.close_connection = True
+        super(KeepAliveHandler, self).handle_error()
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """ WSGIRequestHandler serving several requests per connection.
+
+    The server gives `idle_timeout`, the seconds to wait for the next request
+    and for each read, and `max_requests`, the requests served before the
+    connection is closed (0 for no limit), and `max_body_bytes`, the largest
+    request body, answered with 413 past it (0 for no limit). Request bodies
+    come with a Content-Length or in chunks.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written in pieces, Nagle would hold each one until the client acknowledges the last
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.timeout = getattr(self.server, 'idle_timeout', None)
+        self.requests_served = 0
+        super(KeepAliveRequestHandler, self).setup()
+
+    def handle(self):
+        self.close_connection = True
+        try:
+            self.handle_one_request()
+            while not self.close_connection:
+                self.handle_one_request()
+        except (socket.timeout, ConnectionError):
+            # Idle past the timeout, or the client went away
+            pass
+
+    def handle_one_request(self):
+        self.raw_requestline = self.rfile.readline(MAX_LINE + 1)
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > MAX_LINE:
+            self.requestline = ''
+            self.request_version = ''
+            self.command = ''
+            self.send_error(414)
+            self.close_connection = True
+            return
+        if not self.parse_request():
+            # An error code has been sent
+            self.close_connection = True
+            return
+        max_requests = getattr(self.server, 'max_requests', 0)
+        if max_requests and self.requests_served + 1 >= max_requests:
+            # The last one, told to the client in the response
+            self.close_connection = True
+        environ = self.get_environ()
+        max_body = getattr(self.server, 'max_body_bytes', MAX_BODY_BYTES)
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            try:
+                body = read_chunked(self.rfile, max_body)
+            except BodyTooLarge:
+                # The rest of the body is left unread, the connection cannot be reused
+                self.send_error(413)
+                self.close_connection = True
+                return
+            except ValueError:
+                self.send_error(400, 'Bad chunked body')
+                self.close_connection = True
+                return
+            environ['CONTENT_LENGTH'] = str(len(body))
+            stdin = io.BytesIO(body)
+        else:
+            try:
+                length = int(environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                self.send_error(400, 'Bad Content-Length')
+                self.close_connection = True
+                return
+            if max_body and length > max_body:
+                self.send_error(413)
+                self.close_connection = True
+                return
+            stdin = LimitedReader(self.rfile, length)
+        handler = KeepAliveHandler(stdin, self.wfile, self.get_stderr(), environ, multithread=False)
+        handler.request_handler = self  # backpointer for logging
+        handler.run(self.server.get_app())
+        self.requests_served += 1
+        if isinstance(stdin, LimitedReader) and not self.close_connection and not stdin.discard():
+            self.close_connection = True
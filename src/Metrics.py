@@ -0,0 +1,182 @@
+import bisect
+import threading
+from time import time
+from typing import Callable, Optional
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 100.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{%s}' % ','.join(pairs) if pairs else ''
+
+
+class _Metric():
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.kind)]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return ['%s%s %s' % (self.name, _labels(self.labelnames, key), value) for key, value in values]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """ Gauge set by the code or, when collect is given, read at scrape time.
+
+    collect returns a list of (labels, value) pairs.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (),
+                 collect: Optional[Callable[[], list]] = None):
+        super(Gauge, self).__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def _samples(self) -> list[str]:
+        if self.collect is None:
+            return super(Gauge, self)._samples()
+        return ['%s%s %s' % (self.name, _labels(self.labelnames, self._key(labels)), value)
+                for labels, value in self.collect()]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket plus +Inf, then the sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        lines = []
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append('%s_bucket%s %s' % (self.name, _labels(self.labelnames, key, 'le="%s"' % le), cumulative))
+            lines.append('%s_count%s %s' % (self.name, _labels(self.labelnames, key), cumulative))
+            lines.append('%s_sum%s %s' % (self.name, _labels(self.labelnames, key), round(counts[-1], 6)))
+        return lines
+
+
+class Registry():
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class StageTimer():
+    """ Times the stages of one request into STAGE_SECONDS.
+
+    `lap` records the time since the previous stage and returns the time since
+    the start, formatted like the debug log lines.
+    """
+
+    def __init__(self, method: str):
+        self.method = method
+        self.start = self.last = time()
+
+    def lap(self, stage: str) -> str:
+        now = time()
+        STAGE_SECONDS.observe(now - self.last, method=self.method, stage=stage)
+        self.last = now
+        return '%s s' % str(round(now - self.start, 6))
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'aeroo_requests_total', 'Requests by RPC method, output filter and client.', ('method', 'filter', 'client_id')))
+ERRORS = REGISTRY.register(Counter(
+    'aeroo_errors_total', 'Failed requests by RPC method, output filter and client.',
+    ('method', 'filter', 'client_id')))
+TIMEOUTS = REGISTRY.register(Counter(
+    'aeroo_timeouts_total', 'Conversions cut by the timeout.', ('method', 'filter', 'client_id')))
+RESTARTS = REGISTRY.register(Counter(
+    'aeroo_office_restarts_total', 'Office instance restarts.', ('instance',)))
+RECYCLES = REGISTRY.register(Counter(
+    'aeroo_office_recycles_total', 'Office processes recycled past a limit, by instance and limit.',
+    ('instance', 'reason')))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'aeroo_request_seconds', 'Whole request time by RPC method and output filter.', ('method', 'filter')))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'aeroo_stage_seconds', 'Time of each stage of a conversion or join.', ('method', 'stage')))
+OFFICE_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'aeroo_office_wait_seconds', 'Time waiting to lease an office instance.', ('lane',)))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'aeroo_queue_depth', 'Requests waiting for an office instance or a job worker.', ('queue',)))
+OFFICE_BUSY = REGISTRY.register(Gauge(
+    'aeroo_office_busy', 'Office instances leased by lane.', ('lane',)))
+CACHE = REGISTRY.register(Gauge(
+    'aeroo_cache', 'Conversion cache counters and sizes.', ('stat',)))
+OFFICE_PROCESS = REGISTRY.register(Gauge(
+    'aeroo_office_process', 'Conversions, resident bytes, CPU seconds and uptime of the office processes.',
+    ('instance', 'stat')))
+HTTP_INFLIGHT = REGISTRY.register(Gauge(
+    'aeroo_http_inflight', 'Requests admitted by the HTTP front end and not answered yet.'))
+HTTP_REJECTED = REGISTRY.register(Counter(
+    'aeroo_http_rejected_total', 'Requests turned away by the HTTP front end, by status.', ('status',)))
+
+
+def metrics_app(environ, start_response):
+    """ WSGI application serving the registry in the Prometheus text format. """
+    body = REGISTRY.render().encode('utf-8')
+    start_response('200 OK', [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'),
+                              ('Content-Length', str(len(body)))])
+    return [body]
@@ -0,0 +1,233 @@
+import logging
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from time import time
+from typing import Optional
+
+from FairScheduler import FairScheduler
+from Metrics import OFFICE_WAIT_SECONDS
+from OfficeSupervisor import PROFILES_DIRECTORY, OfficeSupervisor
+from StarOfficeClient import DEFAULT_OPENOFFICE_PORT, PIPESTR, SOCKETSTR, StarOfficeClient
+
+
+class OfficeInstance():
+    """ One headless LibreOffice process, with its own port/pipe and UserInstallation profile.
+
+    The UNO connection to the instance is kept in `star_office_client` and reused
+    by every request that leases it. `process` names the soffice behind the
+    instance (its pipe, profile and port offset); it changes when a standby
+    process takes over, the instance leased by the requests stays the same.
+    """
+
+    star_office_client: Optional[StarOfficeClient] = None
+
+    def __init__(self, index: int, host: str = 'localhost', port: int = DEFAULT_OPENOFFICE_PORT,
+                 transport: str = 'socket'):
+        """
+        Parameters
+        ----------
+        index : int
+            Position of the instance in the pool, also the first process it runs on
+        host : str, optional
+            Host where the office is listening (default is 'localhost')
+        port : int, optional
+            Port of the UNO acceptor of this instance (default is 2002)
+        transport : str, optional
+            'socket' or 'pipe', a named pipe skips the loopback TCP stack (default is 'socket')
+        """
+        if transport not in ('socket', 'pipe'):
+            raise ValueError('Unknown office transport %s' % transport)
+        self.index = index
+        self.process = index
+        self.host = host
+        self.port = port
+        self.transport = transport
+
+    @property
+    def profile(self) -> str:
+        return '%s/%s' % (PROFILES_DIRECTORY, self.process)
+
+    @property
+    def pipe_name(self) -> str:
+        return 'aeroo-office-%s' % self.process
+
+    @property
+    def connection(self) -> str:
+        """ UNO connection string used both to accept and to resolve the office. """
+        if self.transport == 'pipe':
+            return PIPESTR % self.pipe_name
+        return SOCKETSTR % (self.host, self.port)
+
+    def swap(self, other: 'OfficeInstance'):
+        """ Exchange the processes, and their connections, of two instances. """
+        self.process, other.process = other.process, self.process
+        self.port, other.port = other.port, self.port
+        self.star_office_client, other.star_office_client = other.star_office_client, self.star_office_client
+
+    def __repr__(self):
+        if self.process != self.index:
+            return '<OfficeInstance %s (process %s) %s>' % (self.index, self.process, self.connection)
+        return '<OfficeInstance %s %s>' % (self.index, self.connection)
+
+
+class OfficePool():
+    """ Pool of LibreOffice instances leased one per request.
+
+    A conversion only holds the instance it was given, so a slow or hung
+    document blocks its own office and the other ones keep working. Waiting
+    requests are served by weighted fair queueing on their client_id.
+
+    The instances can be split in a "fast" and a "heavy" lane, each with its
+    own queue, so cheap documents never wait behind expensive ones.
+
+    Standby processes are started next to the leased ones, an instance whose
+    process hangs or dies takes a ready standby at once and its old process is
+    restarted in the background to become the next standby.
+    """
+
+    def __init__(self, size: int = 1, host: str = 'localhost', base_port: int = DEFAULT_OPENOFFICE_PORT,
+                 supervisor: Optional[OfficeSupervisor] = None, transport: str = 'socket',
+                 weights: Optional[dict[str, float]] = None, heavy_size: int = 0, heavy_cost: float = 100.0,
+                 standby: int = 0):
+        """
+        Parameters
+        ----------
+        size : int, optional
+            Number of office instances (default is 1)
+        host : str, optional
+            Host where the instances are listening (default is 'localhost')
+        base_port : int, optional
+            Port of the first instance, the next ones use consecutive ports (default is 2002)
+        supervisor : OfficeSupervisor, optional
+            Starts and kills the office processes, without it they are managed outside the service
+        transport : str, optional
+            UNO transport of the instances, 'socket' or 'pipe' (default is 'socket')
+        weights : dict, optional
+            Fair queueing weight by client_id, the other clients weight 1
+        heavy_size : int, optional
+            Instances reserved to the heavy lane, 0 puts every request in one lane (default is 0)
+        heavy_cost : float, optional
+            Preflight cost from which a request goes to the heavy lane (default is 100)
+        standby : int, optional
+            Processes kept started and connected to replace a failed one, on the ports after the
+            instances (default is 0)
+        """
+        if size < 1:
+            raise ValueError('The office pool needs at least one instance')
+        if heavy_size < 0 or (heavy_size and heavy_size >= size):
+            raise ValueError('The heavy lane needs between 1 and %s instances' % (size - 1))
+        if standby < 0:
+            raise ValueError('The standby processes can not be negative')
+        self.instances = [OfficeInstance(index, host, base_port + index, transport)
+                          for index in range(size)]
+        # Holders of the processes not leased, the ready ones are in _standby
+        self.spares = [OfficeInstance(index, host, base_port + index, transport)
+                       for index in range(size, size + standby)]
+        self._standby: list[OfficeInstance] = []
+        self._standby_lock = threading.Lock()
+        self._late: dict[int, Future] = {}  # process: cancelled call still running on it
+        self.supervisor = supervisor
+        self.heavy_cost = heavy_cost
+        self.lanes = {'fast': FairScheduler(self.instances[heavy_size:], weights)}
+        if heavy_size:
+            self.lanes['heavy'] = FairScheduler(self.instances[:heavy_size], weights)
+
+    @property
+    def size(self) -> int:
+        return len(self.instances)
+
+    def lane(self, cost: float) -> str:
+        """ Lane of a request with the given preflight cost. """
+        return 'heavy' if 'heavy' in self.lanes and cost >= self.heavy_cost else 'fast'
+
+    @contextmanager
+    def lease(self, client_id: str = 'Unknown', lane: str = 'fast'):
+        """ Wait for the turn of the client and hold an idle office instance of the lane until the block ends. """
+        logger = logging.getLogger('main')
+        start_time = time()
+        with self.lanes[lane].lease(client_id) as instance:
+            OFFICE_WAIT_SECONDS.observe(time() - start_time, lane=lane)
+            logger.debug('  leased %s to %s on the %s lane', instance, client_id, lane)
+            yield instance
+        logger.debug('  released %s', instance)
+
+    def _scheduler(self, instance: OfficeInstance) -> FairScheduler:
+        return next(scheduler for scheduler in self.lanes.values() if instance in scheduler.resources)
+
+    def quarantine(self, instance: OfficeInstance):
+        """ Keep a leased instance out of its lane once released, until `reinstate`. """
+        self._scheduler(instance).quarantine(instance)
+
+    def reinstate(self, instance: OfficeInstance):
+        """ Give a quarantined instance back to its lane. """
+        self._scheduler(instance).reinstate(instance)
+
+    @property
+    def standby(self) -> int:
+        """ Standby processes ready to take over. """
+        with self._standby_lock:
+            return len(self._standby)
+
+    def add_standby(self, spare: OfficeInstance):
+        """ Make a started and connected spare available to the next failover.
+
+        While a cancelled call still runs on its process, see `hold`, the spare waits for it to end.
+        """
+        with self._standby_lock:
+            late = self._late.get(spare.process)
+            if late is None or late.done():
+                self._standby.append(spare)
+                return
+        late.add_done_callback(lambda _: self.add_standby(spare))
+
+    def hold(self, process: int, future: Future):
+        """ Keep the spare holding a process out of standby until the cancelled call of future ends. """
+        with self._standby_lock:
+            self._late[process] = future
+            ready = [spare for spare in self._standby if spare.process == process]
+            for spare in ready:
+                self._standby.remove(spare)
+        future.add_done_callback(lambda _: self._unhold(process, future, ready))
+
+    def _unhold(self, process: int, future: Future, ready: list):
+        with self._standby_lock:
+            if self._late.get(process) is future:
+                del self._late[process]
+        for spare in ready:
+            self.add_standby(spare)
+
+    def promote(self, instance: OfficeInstance) -> Optional[OfficeInstance]:
+        """ Move a ready standby process to the instance, and return the spare now holding the failed process.
+
+        None when no standby is ready, the instance keeps its process.
+        """
+        with self._standby_lock:
+            if not self._standby:
+                return None
+            spare = self._standby.pop(0)
+        instance.swap(spare)
+        return spare
+
+    def process_stats(self) -> dict:
+        """ Conversions, resident bytes, CPU seconds and uptime of the process of each instance, by its index. """
+        if self.supervisor is None:
+            return {}
+        # String keys, written as they are by every JSON backend
+        return {str(instance.index): self.supervisor.stats(instance) for instance in self.instances}
+
+    def stats(self) -> dict:
+        return {
+            'instances': self.size,
+            'standby': self.standby,
+            'processes': self.process_stats(),
+            'heavy_cost': self.heavy_cost,
+            'lanes': {
+                name: {
+                    'instances': len(scheduler.resources),
+                    'queued': scheduler.queued,
+                    'quarantined': scheduler.quarantined,
+                    'clients': scheduler.stats(),
+                } for name, scheduler in self.lanes.items()
+            },
+        }
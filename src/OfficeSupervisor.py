@@ -0,0 +1,300 @@
+import logging
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import threading
+from time import sleep, time
+from typing import Optional
+
+PROFILES_DIRECTORY = '/tmp/aeroo-office'
+TEMPLATE_PROFILE = PROFILES_DIRECTORY + '/template'
+PIPE_PATH = '/tmp/OSL_PIPE_%s_%s'  # unix socket behind a named UNO pipe
+PROBE_INTERVAL = 0.1  # seconds between two probes of a starting office
+STOP_TIMEOUT = 5  # seconds for a killed process group to be reaped
+RESTART_REQUESTED = 81  # exit code of soffice asking to be started again, after creating its profile
+USAGE_INTERVAL = 5  # seconds a /proc sample of a process is reused
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+
+
+class ProcessUsage():
+    """ Resources used by the process group of an office, read from /proc. """
+
+    def __init__(self, rss: int = 0, cpu: float = 0.0, uptime: float = 0.0):
+        self.rss = rss  # resident bytes
+        self.cpu = cpu  # user and system seconds
+        self.uptime = uptime  # seconds since it was started
+
+    def as_dict(self) -> dict:
+        return {'rss': self.rss, 'cpu': round(self.cpu, 3), 'uptime': round(self.uptime, 3)}
+
+
+class RecyclePolicy():
+    """ Limits past which an office process is recycled, 0 disables a limit. """
+
+    def __init__(self, conversions: int = 0, rss: int = 0, cpu: float = 0.0, age: float = 0.0):
+        """
+        Parameters
+        ----------
+        conversions : int, optional
+            Conversions and joins served by the process
+        rss : int, optional
+            Resident bytes of the process group
+        cpu : float, optional
+            User and system CPU seconds of the process group
+        age : float, optional
+            Seconds since the process was started
+        """
+        self.conversions = conversions
+        self.rss = rss
+        self.cpu = cpu
+        self.age = age
+
+    def reason(self, conversions: int, usage: Optional[ProcessUsage]) -> Optional[str]:
+        """ The first limit reached, None while the process is within all of them. """
+        if self.conversions and conversions >= self.conversions:
+            return 'conversions'
+        if usage is None:
+            return None
+        if self.age and usage.uptime >= self.age:
+            return 'age'
+        if self.rss and usage.rss >= self.rss:
+            return 'rss'
+        if self.cpu and usage.cpu >= self.cpu:
+            return 'cpu'
+        return None
+
+
+class OfficeSupervisor():
+    """ Starts, probes and kills the soffice processes of the office pool.
+
+    Each process runs in its own session, so its group (oosplash and soffice.bin)
+    is killed by its PID without touching the other instances. Its
+    UserInstallation is a fresh copy of a profile built once, which skips the
+    first start initialization, and it is ready as soon as its UNO acceptor
+    takes a connection.
+
+    The conversions, memory, CPU time and uptime of each process are tracked to
+    recycle it, by the recycling policy, before it slows down.
+    """
+
+    def __init__(self, binary: str = 'soffice', template: str = TEMPLATE_PROFILE, start_timeout: float = 60.0,
+                 policy: Optional[RecyclePolicy] = None):
+        """
+        Parameters
+        ----------
+        binary : str, optional
+            soffice launcher of the LibreOffice installation (default is 'soffice')
+        template : str, optional
+            Directory of the profile snapshot, built by the first start when it is missing
+        start_timeout : float, optional
+            Seconds for a started office to accept connections (default is 60)
+        policy : RecyclePolicy, optional
+            Limits past which a process is recycled, none by default
+        """
+        self.binary = binary
+        self.template = template
+        self.start_timeout = start_timeout
+        self.policy = policy or RecyclePolicy()
+        self._processes: dict[int, subprocess.Popen] = {}
+        self._started: dict[int, float] = {}
+        self._conversions: dict[int, int] = {}
+        self._samples: dict[int, tuple[float, ProcessUsage]] = {}
+        self._lock = threading.Lock()
+        self._template_lock = threading.Lock()
+
+    def _command(self, profile: str) -> list[str]:
+        return [self.binary, '-env:UserInstallation=file://%s' % profile, '--invisible', '--norestore',
+                '--headless', '--nologo', '--nofirststartwizard']
+
+    def prepare(self) -> bool:
+        """ Build the profile snapshot once, False when it can not be built and the profiles start empty. """
+        logger = logging.getLogger('main')
+        with self._template_lock:
+            if os.path.isdir(self.template):
+                return True
+            building = self.template + '.building'
+            shutil.rmtree(building, ignore_errors=True)
+            start_time = time()
+            returncode = RESTART_REQUESTED
+            attempt = 0
+            while returncode == RESTART_REQUESTED and attempt < 3:
+                attempt += 1
+                returncode = self._run(self._command(building) + ['--terminate_after_init'])
+            if returncode != 0 or not os.path.isdir(building):
+                logger.warning('Failed to build the office profile snapshot, exit code %s', returncode)
+                shutil.rmtree(building, ignore_errors=True)
+                return False
+            os.rename(building, self.template)
+            logger.info('Office profile snapshot built in %s s', round(time() - start_time, 3))
+            return True
+
+    def _run(self, command: list[str]) -> Optional[int]:
+        """ Exit code of a soffice run, None when it does not end before the start timeout. """
+        logger = logging.getLogger('main')
+        try:
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL, start_new_session=True)
+        except OSError as e:
+            logger.error('Failed to execute %s. OS error: %s', command[0], e)
+            return None
+        try:
+            return process.wait(self.start_timeout)
+        except subprocess.TimeoutExpired:
+            self._kill(process)
+            return None
+
+    def start(self, office) -> Optional[int]:
+        """ (Re)start the process of an office instance on a copy of the profile snapshot, return its PID. """
+        logger = logging.getLogger('main')
+        self.stop(office)
+        shutil.rmtree(office.profile, ignore_errors=True)
+        if self.prepare():
+            shutil.copytree(self.template, office.profile, symlinks=True)
+        command = self._command(office.profile) + ['--accept=%s;urp;StarOffice.ServiceManager' % office.connection]
+        try:
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                       stderr=subprocess.DEVNULL, start_new_session=True)
+        except OSError as e:
+            logger.error('Failed to start office process %s. OS error: %s', office.process, e)
+            return None
+        with self._lock:
+            self._processes[office.process] = process
+            self._started[office.process] = time()
+            self._conversions[office.process] = 0
+            self._samples.pop(office.process, None)
+        logger.info('Started office process %s, pid %s', office.process, process.pid)
+        return process.pid
+
+    def stop(self, office):
+        """ Kill the process group of an office instance and reap it. """
+        with self._lock:
+            process = self._processes.pop(office.process, None)
+        if process is not None:
+            self._kill(process)
+
+    def stop_all(self):
+        with self._lock:
+            processes = list(self._processes.values())
+            self._processes.clear()
+        for process in processes:
+            self._kill(process)
+
+    def _kill(self, process: subprocess.Popen):
+        logger = logging.getLogger('main')
+        try:
+            # A hung office does not answer SIGTERM, its children are in the same group
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        try:
+            process.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            logger.warning('Office process %s not reaped after SIGKILL', process.pid)
+
+    def pid(self, office) -> Optional[int]:
+        """ PID of the running process of an office instance, None when it is not running. """
+        with self._lock:
+            process = self._processes.get(office.process)
+        if process is None or process.poll() is not None:
+            return None
+        return process.pid
+
+    def running(self, office) -> bool:
+        return self.pid(office) is not None
+
+    def wait_exit(self, office, timeout: float) -> bool:
+        """ Wait for the process of an office instance to exit by itself, False after timeout seconds. """
+        with self._lock:
+            process = self._processes.get(office.process)
+        if process is None:
+            return True
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            return False
+        return True
+
+    def record_conversion(self, office):
+        with self._lock:
+            self._conversions[office.process] = self._conversions.get(office.process, 0) + 1
+
+    def usage(self, office) -> Optional[ProcessUsage]:
+        """ Resources used by the process group of an office instance, sampled at most every USAGE_INTERVAL. """
+        pid = self.pid(office)
+        if pid is None:
+            return None
+        now = time()
+        with self._lock:
+            sampled, usage = self._samples.get(office.process, (0.0, None))
+            started = self._started.get(office.process, now)
+        if usage is None or now - sampled >= USAGE_INTERVAL:
+            usage = _groupUsage(pid)
+            with self._lock:
+                self._samples[office.process] = (now, usage)
+        return ProcessUsage(usage.rss, usage.cpu, now - started)
+
+    def recycle_reason(self, office) -> Optional[str]:
+        """ The recycling limit the process of an office instance is past, None while it is within them. """
+        with self._lock:
+            conversions = self._conversions.get(office.process, 0)
+        return self.policy.reason(conversions, self.usage(office))
+
+    def stats(self, office) -> dict:
+        usage = self.usage(office)
+        with self._lock:
+            conversions = self._conversions.get(office.process, 0)
+        return dict(usage.as_dict() if usage else {}, pid=self.pid(office), conversions=conversions)
+
+    def probe(self, office) -> bool:
+        """ True when the UNO acceptor of the office instance takes a connection. """
+        if office.transport == 'pipe':
+            family, address = socket.AF_UNIX, PIPE_PATH % (os.getuid(), office.pipe_name)
+        else:
+            family, address = socket.AF_INET, (office.host, office.port)
+        try:
+            with socket.socket(family, socket.SOCK_STREAM) as probe:
+                probe.settimeout(1)
+                probe.connect(address)
+            return True
+        except OSError:
+            return False
+
+    def wait_ready(self, office, timeout: Optional[float] = None) -> bool:
+        """ Probe the office instance until it accepts connections, False when its process exits or after timeout. """
+        logger = logging.getLogger('main')
+        deadline = time() + (self.start_timeout if timeout is None else timeout)
+        start_time = time()
+        while True:
+            if self.probe(office):
+                logger.debug('Office process %s ready in %s s', office.process, round(time() - start_time, 3))
+                return True
+            if not self.running(office):
+                logger.warning('Office process %s is not running', office.process)
+                return False
+            if time() >= deadline:
+                return False
+            sleep(PROBE_INTERVAL)
+
+
+def _groupUsage(pgid: int) -> ProcessUsage:
+    """ Sum the resident memory and CPU time of the processes of a group, from /proc/<pid>/stat. """
+    usage = ProcessUsage()
+    try:
+        pids = [entry for entry in os.listdir('/proc') if entry.isdigit()]
+    except OSError:
+        return usage
+    for pid in pids:
+        try:
+            with open('/proc/%s/stat' % pid, 'rb') as stat:
+                # The command name is between parentheses and may hold spaces
+                fields = stat.read().rsplit(b')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if int(fields[2]) != pgid:
+            continue
+        usage.cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        usage.rss += int(fields[21]) * PAGE_SIZE
+    return usage
@@ -0,0 +1,67 @@
+from typing import Optional
+
+# FilterData of the PDF export accepted from the clients, with the type of their value
+PDF_FILTER_DATA: dict[str, type] = {
+    'Quality': int,  # JPEG quality of the images, 1 to 100
+    'ReduceImageResolution': bool,
+    'MaxImageResolution': int,  # DPI of the reduced images: 75, 150, 300, 600 or 1200
+    'UseLosslessCompression': bool,
+    'PageRange': str,  # like "1-3;5"
+    'UseTaggedPDF': bool,
+    'SelectPdfVersion': int,  # 0 PDF 1.7, 1 PDF/A-1b, 2 PDF/A-2b, 3 PDF/A-3b
+    'ExportBookmarks': bool,
+    'ExportNotes': bool,
+    'ExportFormFields': bool,
+    'EmbedStandardFonts': bool,
+    'IsSkipEmptyPages': bool,
+}
+
+DEFAULT_PRESETS: dict[str, dict] = {
+    'screen': {'Quality': 75, 'ReduceImageResolution': True, 'MaxImageResolution': 150},
+    'print': {'Quality': 90, 'ReduceImageResolution': True, 'MaxImageResolution': 300},
+    'archive': {'SelectPdfVersion': 2, 'UseTaggedPDF': True},
+}
+
+
+def validate(options: dict) -> dict:
+    """ Check the names and value types of PDF export options, raises ValueError on the first wrong one. """
+    if not isinstance(options, dict):
+        raise ValueError('PDF options must be an object')
+    for name, value in options.items():
+        expected = PDF_FILTER_DATA.get(name)
+        if expected is None:
+            raise ValueError('Unknown PDF option %s' % name)
+        # bool is an int for isinstance, and an int is not a bool
+        if type(value) is not expected:
+            raise ValueError('PDF option %s must be of type %s' % (name, expected.__name__))
+    return options
+
+
+def is_pdf(filter_name: str) -> bool:
+    return filter_name.endswith('_pdf_Export')
+
+
+class PdfPresets():
+    """ Named sets of PDF export FilterData, chosen per request and completed by its own options.
+
+    The server side presets are added to, or replace, the default ones:
+    `screen` and `print` reduce and compress the images, `archive` exports a
+    tagged PDF/A-2b.
+    """
+
+    def __init__(self, presets: Optional[dict[str, dict]] = None):
+        """
+        Parameters
+        ----------
+        presets : dict, optional
+            FilterData by preset name, on top of the default presets
+        """
+        self.presets = {name: validate(options) for name, options in dict(DEFAULT_PRESETS, **(presets or {})).items()}
+
+    def resolve(self, preset: str = '', options: Optional[dict] = None) -> dict:
+        """ FilterData of a request, its options override the ones of its preset. """
+        if preset and preset not in self.presets:
+            raise ValueError('Unknown PDF preset %s' % preset)
+        filter_data = dict(self.presets.get(preset, {}))
+        filter_data.update(validate(options or {}))
+        return filter_data
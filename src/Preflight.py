@@ -0,0 +1,182 @@
+import io
+import re
+import zipfile
+from functools import lru_cache
+from typing import Optional
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.svg', '.tif', '.tiff', '.wmf', '.emf', '.svm')
+SCAN_BLOCK_SIZE = 1024 * 1024  # content.xml is read in blocks, never whole
+MB = 1024 * 1024
+
+# Weights of the cost score, one unit is roughly the work of a plain one-page document
+COST_PER_MB = 1.0  # uncompressed XML and media
+COST_PER_IMAGE = 0.1
+COST_PER_PAGE = 0.5
+COST_PER_TABLE = 0.5
+COST_PER_TABLE_ROW = 0.002
+
+PAGE_COUNT_RE = re.compile(rb'meta:page-count="(\d+)"')
+MARKERS = {
+    'tables': b'<table:table ',
+    'table_rows': b'<table:table-row',
+}
+
+# Elements telling a document needs a pass before export: updateLinks for links,
+# refresh for fields, an update of each index for indexes. Hyperlinks count as
+# links, a false positive only costs the pass that was always done. The
+# `-decls` declarations every text document carries are not fields.
+FEATURE_ELEMENTS = {
+    'links': (b'<text:section-source', b'<office:dde-source', b'<text:dde-connection', b'<table:table-source',
+              b'<table:cell-range-source', b'xlink:href="http', b'xlink:href="ftp', b'xlink:href="file:',
+              b'xlink:href="../', b'xlink:href="/'),
+    'indexes': (b'<text:table-of-content', b'<text:alphabetical-index', b'<text:illustration-index',
+                b'<text:table-index', b'<text:object-index', b'<text:user-index', b'<text:bibliography'),
+    'fields': (b'<text:date', b'<text:time', b'<text:page-count', b'<text:paragraph-count', b'<text:word-count',
+               b'<text:character-count', b'<text:table-count', b'<text:image-count', b'<text:object-count',
+               b'<text:variable-set', b'<text:variable-get', b'<text:variable-input', b'<text:user-field-get',
+               b'<text:user-field-input', b'<text:user-defined', b'<text:sequence ', b'<text:sequence-ref',
+               b'<text:expression', b'<text:table-formula', b'<text:reference-ref', b'<text:bookmark-ref',
+               b'<text:note-ref', b'<text:database-', b'<text:conditional-text', b'<text:hidden-',
+               b'<text:chapter', b'<text:file-name', b'<text:template-name', b'<text:sheet-name',
+               b'<text:author-', b'<text:initial-creator', b'<text:creator', b'<text:creation-',
+               b'<text:modification-', b'<text:print-', b'<text:editing-', b'<text:title', b'<text:subject',
+               b'<text:keywords', b'<text:description', b'<text:sender-', b'<text:placeholder',
+               b'<text:text-input', b'<text:drop-down', b'<text:page-variable-', b'<text:execute-macro'),
+}
+
+
+@lru_cache(maxsize=None)
+def _featureRes(searched: frozenset) -> list:
+    """ One regex per namespace prefix, with a named group per feature, for the features still searched.
+
+    A literal prefix like `<text:` lets the regex engine skip ahead with a plain
+    search, an alternation of elements starting with different text scans every
+    position of the file.
+    """
+    prefixes: dict[bytes, dict[str, list[bytes]]] = {}
+    for feature, elements in FEATURE_ELEMENTS.items():
+        if feature not in searched:
+            continue
+        for element in elements:
+            prefix, colon, rest = element.partition(b':')
+            prefixes.setdefault(prefix + colon, {}).setdefault(feature, []).append(rest)
+    return [re.compile(re.escape(prefix) + b'(?:' + b'|'.join(
+        b'(?P<%s>%s)' % (feature.encode(), b'|'.join(re.escape(rest) for rest in rests))
+        for feature, rests in features.items()) + b')') for prefix, features in prefixes.items()]
+
+
+FEATURE_TAIL = max(len(element) for elements in FEATURE_ELEMENTS.values() for element in elements) - 1
+FEATURE_FILES = ('content.xml', 'styles.xml')  # headers and footers live in styles.xml
+
+
+class DocumentCost():
+    """ Cheap estimate of how expensive a document will be for LibreOffice. """
+
+    def __init__(self):
+        self.compressed = 0
+        self.uncompressed = 0
+        self.entries = 0
+        self.images = 0
+        self.image_bytes = 0
+        self.pages = 0
+        self.tables = 0
+        self.table_rows = 0
+        # Whether the document may have them, True until the preflight rules them out
+        self.links = True
+        self.fields = True
+        self.indexes = True
+
+    @property
+    def score(self) -> float:
+        return round(1
+                     + COST_PER_MB * self.uncompressed / MB
+                     + COST_PER_IMAGE * self.images
+                     + COST_PER_PAGE * self.pages
+                     + COST_PER_TABLE * self.tables
+                     + COST_PER_TABLE_ROW * self.table_rows, 3)
+
+    def __repr__(self):
+        return '<DocumentCost %s: %s entries, %s images, %s pages, %s tables, %s rows, %s bytes%s>' % (
+            self.score, self.entries, self.images, self.pages, self.tables, self.table_rows, self.uncompressed,
+            ''.join(' +%s' % feature for feature in FEATURE_ELEMENTS if getattr(self, feature)))
+
+
+def estimate_cost(b_data: bytes) -> DocumentCost:
+    """ Estimate the cost of an OpenDocument from its zip directory, meta.xml and content.xml markers.
+
+    zipfile only reads the central directory to list the entries, then meta.xml is
+    read whole and content.xml and styles.xml are scanned in blocks. The scan also
+    tells whether the document has links, fields or indexes; when it is not an
+    OpenDocument they are assumed.
+    b_data is the document bytes or the mmap of a spooled file, which is read in place.
+    Raises zipfile.BadZipFile when the data is not a zip package.
+    """
+    cost = DocumentCost()
+    cost.compressed = len(b_data)
+    with zipfile.ZipFile(b_data if hasattr(b_data, 'seek') else io.BytesIO(b_data), "r") as inzip:
+        infolist = inzip.infolist()
+        cost.entries = len(infolist)
+        names = set()
+        for info in infolist:
+            names.add(info.filename)
+            cost.uncompressed += info.file_size
+            if info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                cost.images += 1
+                cost.image_bytes += info.file_size
+        if 'meta.xml' in names:
+            match = PAGE_COUNT_RE.search(inzip.read('meta.xml'))
+            if match:
+                cost.pages = int(match.group(1))
+        if 'content.xml' in names:
+            found = set()
+            for name in FEATURE_FILES:
+                features = set(FEATURE_ELEMENTS) - found
+                markers = MARKERS if name == 'content.xml' else None
+                if name in names and (features or markers):
+                    counts, file_found = _scanFile(inzip, name, features, markers)
+                    found.update(file_found)
+                    if markers:
+                        cost.tables = counts['tables']
+                        cost.table_rows = counts['table_rows']
+            for feature in FEATURE_ELEMENTS:
+                setattr(cost, feature, feature in found)
+    return cost
+
+
+def estimate_join_cost(sizes: list[int]) -> float:
+    """ Rough cost of a join from the sizes of its documents, without opening them. """
+    # ODF packages usually expand about 4 times once uncompressed
+    return round(len(sizes) + COST_PER_MB * 4 * sum(sizes) / MB, 3)
+
+
+def _scanFile(inzip: zipfile.ZipFile, name: str, features: set, markers: Optional[dict[str, bytes]] = None):
+    """ Count the markers and find the features of a file in a single pass over its blocks.
+
+    Each feature is searched until found, the scan ends as soon as every feature
+    was found and there is nothing to count. Only the few bytes around the end of
+    a block are joined to the next one, for an element cut in two, the blocks
+    themselves are searched in place.
+    Returns the count of each marker and the features found.
+    """
+    markers = markers or {}
+    counts = {key: 0 for key in markers}
+    found: set = set()
+    searching = set(features)
+    tail = b''
+    overlap = max([FEATURE_TAIL] + [len(marker) - 1 for marker in markers.values()])
+    with inzip.open(name) as content:
+        for block in iter(lambda: content.read(SCAN_BLOCK_SIZE), b''):
+            # The elements cut in two by the end of the previous block
+            boundary = tail + block[:overlap]
+            for key, marker in markers.items():
+                counts[key] += block.count(marker) + (tail[-(len(marker) - 1):] + block[:len(marker) - 1]).count(marker)
+            for chunk in (boundary, block):
+                # Rebuilt without the features found, they are not searched again
+                for feature_re in _featureRes(frozenset(searching)):
+                    for match in feature_re.finditer(chunk):
+                        searching.discard(match.lastgroup)
+                        found.add(match.lastgroup)
+            if not searching and not markers:
+                break
+            tail = block[-overlap:]
+    return counts, found
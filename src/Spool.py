@@ -0,0 +1,284 @@
+import base64
+import json
+import mmap
+import os
+import struct
+import threading
+import uuid
+from contextlib import contextmanager
+from hashlib import md5, sha256
+from os import makedirs, path, rename, unlink
+from time import time
+from typing import Optional
+
+from Cleaner import META_SUFFIX, PARTIAL_PREFIX, SHARD_LENGTH, Cleaner
+
+UPLOAD_PREFIX = ''
+RESULT_PREFIX = 'r'
+
+
+class SpoolBuffer(mmap.mmap):
+    """ Read-only map of a spool file, usable as a file by zipfile. """
+
+    def seekable(self):
+        # mmap only has it from Python 3.13
+        return True
+
+
+class Spool():
+    """ Decoded documents and results on disk, for `upload`, `join` and `download`.
+
+    Each file is named after the md5 of its identifier and lives in the subdirectory of
+    the first two hex digits, so no directory grows to tens of thousands of
+    entries. Next to it, a `.meta` JSON sidecar holds its size, sha256 and mime.
+    Uploads arrive in base64 chunks and are decoded as they are appended; a chunk
+    cut in the middle of a base64 quantum leaves its last characters in the
+    sidecar of the partial file until the next chunk. Chunks sent with an offset
+    are written in place instead, in any order, and the ranges received so far
+    are kept in the sidecar until they cover the whole file. Reads map the file
+    instead of copying it.
+    """
+
+    def __init__(self, directory: str, cleaner: Optional[Cleaner] = None):
+        """
+        Parameters
+        ----------
+        directory : str
+            Root of the spool, the directory the Cleaner watches
+        cleaner : Cleaner, optional
+            Cleaner told about every file written, renamed or removed
+        """
+        self.directory = directory
+        self.cleaner = cleaner
+        self._locks: dict[str, list] = {}  # name: [lock, users]
+        self._locks_lock = threading.Lock()
+
+    def name(self, identifier: str, prefix: str = UPLOAD_PREFIX, partial: bool = False) -> str:
+        """ Path of an identifier relative to the spool directory. """
+        # NOTE:md5 conversion on file operations to prevent path injection attack
+        digest = md5(str(identifier).encode()).hexdigest()
+        return '%s/%s%s%s' % (digest[:SHARD_LENGTH], PARTIAL_PREFIX if partial else '', prefix, digest)
+
+    def path(self, name: str) -> str:
+        return '%s/%s' % (self.directory, name)
+
+    def exists(self, name: str) -> bool:
+        return path.isfile(self.path(name))
+
+    def size(self, name: str) -> int:
+        meta = self.meta(name)
+        return meta['size'] if 'size' in meta else path.getsize(self.path(name))
+
+    def meta(self, name: str) -> dict:
+        try:
+            with open(self.path(name) + META_SUFFIX) as meta_file:
+                return json.load(meta_file)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    @contextmanager
+    def lock(self, name: str):
+        """ Serialize the writers of one file, the other files are written in parallel. """
+        with self._locks_lock:
+            entry = self._locks.setdefault(name, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[name]
+
+    def reserve(self, name: str) -> bool:
+        """ Create an empty partial file, False when it already exists. """
+        makedirs(path.dirname(self.path(name)), exist_ok=True)
+        try:
+            open(self.path(name), 'xb').close()
+        except FileExistsError:
+            return False
+        if self.cleaner is not None:
+            self.cleaner.register(name)
+        return True
+
+    def write_chunk(self, name: str, offset: int, data: bytes, is_last: bool = False) -> bool:
+        """ Write decoded data at offset of a partial file, True once all of it was received.
+
+        is_last tells the chunk ends the file, it may arrive before the others.
+        Called with the lock of the file held.
+        """
+        meta = self.meta(name)
+        # Before the write: a sparse write past the end grows the file over bytes not received yet
+        ranges = self._ranges(name, meta)
+        fd = os.open(self.path(name), os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+        meta['ranges'] = merge_ranges(ranges + [[offset, offset + len(data)]])
+        if is_last:
+            meta['total'] = offset + len(data)
+        self._write_meta(name, meta)
+        if self.cleaner is not None:
+            self.cleaner.register(name)
+        return 'total' in meta and not missing_ranges(meta['ranges'], meta['total'])
+
+    def status(self, partial_name: str, name: str) -> Optional[dict]:
+        """ Ranges received and missing of an upload, None when it does not exist. """
+        if self.exists(name):
+            size = self.size(name)
+            return {'complete': True, 'size': size, 'received': size, 'ranges': [[0, size]], 'missing': []}
+        if not self.exists(partial_name):
+            return None
+        meta = self.meta(partial_name)
+        ranges = self._ranges(partial_name, meta)
+        total = meta.get('total')
+        return {
+            'complete': False,
+            'size': total,
+            'received': sum(end - start for start, end in ranges),
+            'ranges': ranges,
+            # Without the last chunk the end of the file is unknown, only the gaps are
+            'missing': missing_ranges(ranges, total if total is not None else ranges[-1][1] if ranges else 0),
+        }
+
+    def _ranges(self, name: str, meta: dict) -> list[list[int]]:
+        if 'ranges' in meta:
+            return meta['ranges']
+        # Appended in order, all of it is there
+        try:
+            size = path.getsize(self.path(name))
+        except FileNotFoundError:
+            size = 0
+        return [[0, size]] if size else []
+
+    def append_base64(self, name: str, data: str):
+        """ Decode a base64 chunk and append it to a partial file. """
+        meta = self.meta(name)
+        if any(char in data for char in '\n\r\t '):
+            # base64 wrapped in lines
+            data = ''.join(data.split())
+        data = meta.pop('tail', '') + data
+        cut = len(data) - len(data) % 4
+        self._append(name, base64.b64decode(data[:cut]))
+        if cut < len(data):
+            meta['tail'] = data[cut:]
+        self._write_meta(name, meta)
+
+    def publish(self, partial_name: str, name: str, digest: bool = True):
+        """ Rename a complete partial file to its final name and write its sidecar. """
+        tail = self.meta(partial_name).get('tail', '')
+        if tail:
+            # A last chunk without its padding
+            self._append(partial_name, base64.b64decode(tail + '=' * (-len(tail) % 4)))
+        makedirs(path.dirname(self.path(name)), exist_ok=True)
+        rename(self.path(partial_name), self.path(name))
+        self._remove_meta(partial_name)
+        meta = {'size': path.getsize(self.path(name)), 'created': time()}
+        with self.open_buffer(name) as buffer:
+            meta['mime'] = sniff_mime(buffer)
+            if digest:
+                meta['sha256'] = sha256(buffer).hexdigest()
+        self._write_meta(name, meta)
+        if self.cleaner is not None:
+            self.cleaner.discard(partial_name)
+            self.cleaner.register(name)
+
+    @contextmanager
+    def open_buffer(self, name: str):
+        """ Yield the whole file as a read-only mmap, valid until the block ends. """
+        with open(self.path(name), 'rb') as spool_file:
+            if not path.getsize(self.path(name)):
+                # Empty files cannot be mapped
+                yield b''
+                return
+            buffer = SpoolBuffer(spool_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield buffer
+            finally:
+                buffer.close()
+
+    def read(self, name: str) -> bytes:
+        with open(self.path(name), 'rb') as spool_file:
+            return spool_file.read()
+
+    def open(self, name: str):
+        return open(self.path(name), 'rb')
+
+    @contextmanager
+    def result(self):
+        """ Yield a new result identifier and the file to write it, published once it is complete. """
+        identifier = uuid.uuid4().hex
+        partial_name = self.name(identifier, RESULT_PREFIX, partial=True)
+        makedirs(path.dirname(self.path(partial_name)), exist_ok=True)
+        try:
+            with open(self.path(partial_name), 'wb') as result_file:
+                yield identifier, result_file
+        except BaseException:
+            unlink(self.path(partial_name))
+            raise
+        self.publish(partial_name, self.name(identifier, RESULT_PREFIX), digest=False)
+
+    def _append(self, name: str, data: bytes):
+        try:
+            spool_file = open(self.path(name), 'ab')
+        except FileNotFoundError:
+            makedirs(path.dirname(self.path(name)), exist_ok=True)
+            spool_file = open(self.path(name), 'ab')
+        with spool_file:
+            spool_file.write(data)
+        if self.cleaner is not None:
+            self.cleaner.register(name)
+
+    def _write_meta(self, name: str, meta: dict):
+        if not meta:
+            self._remove_meta(name)
+            return
+        with open(self.path(name) + META_SUFFIX, 'w') as meta_file:
+            json.dump(meta, meta_file)
+
+    def _remove_meta(self, name: str):
+        try:
+            unlink(self.path(name) + META_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+
+def merge_ranges(ranges: list) -> list[list[int]]:
+    """ Sort [start, end) ranges and merge the ones that overlap or touch. """
+    merged: list[list[int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        elif end > start:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(ranges: list, total: int) -> list[list[int]]:
+    """ The gaps of merged ranges in [0, total). """
+    missing = []
+    position = 0
+    for start, end in ranges:
+        if start > position:
+            missing.append([position, min(start, total)])
+        position = max(position, end)
+    if position < total:
+        missing.append([position, total])
+    return [gap for gap in missing if gap[1] > gap[0]]
+
+
+def sniff_mime(buffer) -> str:
+    """ Mime type from the first bytes: the `mimetype` entry of an OpenDocument, or zip, pdf. """
+    head = bytes(buffer[:128])
+    if head.startswith(b'PK\x03\x04') and len(head) >= 30:
+        compressed_size, name_length, extra_length = struct.unpack('<I4xHH', head[18:30])
+        start = 30 + name_length + extra_length
+        if head[30:30 + name_length] == b'mimetype' and start + compressed_size <= len(head):
+            return head[start:start + compressed_size].decode('ascii', 'replace')
+        return 'application/zip'
+    if head.startswith(b'%PDF'):
+        return 'application/pdf'
+    return 'application/octet-stream'
+
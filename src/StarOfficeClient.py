@@ -14,25 +14,28 @@ import uno
 from com.sun.star.text import ControlCharacter
 from com.sun.star.document import MacroExecMode
 from com.sun.star.document import UpdateDocMode
-from com.sun.star.io import XOutputStream
+from com.sun.star.io import XInputStream, XOutputStream, XSeekable
 from com.sun.star.lang import IllegalArgumentException, DisposedException
 from com.sun.star.beans import UnknownPropertyException
 from com.sun.star.connection import NoConnectException, ConnectionSetupException
 from com.sun.star.beans import PropertyValue
+from com.sun.star.uno import RuntimeException
 
 import unohelper
 from io import BytesIO
 import logging
-import subprocess
 import time
 import traceback
 import sys
 from os.path import abspath
+from typing import Optional
 
-from CallWithTimeout import ExecutorWithTimeout, TimeoutExeption
+from CallWithTimeout import TimeoutExeption
 
 DEFAULT_OPENOFFICE_PORT = 2002
-RESOLVESTR = "uno:socket,host=%s,port=%s;urp;StarOffice.ComponentContext"
+RESOLVESTR = "uno:%s;urp;StarOffice.ComponentContext"
+SOCKETSTR = "socket,host=%s,port=%s"
+PIPESTR = "pipe,name=%s"
 
 ################## For CSV documents #######################
 # Field Separator (1), Text Delimiter (2), Character Set (3), Number of First Line (4)
@@ -63,11 +66,15 @@ class StarOfficeClientException(Exception):
 
 
 class OutputStreamWrapper(unohelper.Base, XOutputStream):
-    """ Minimal Implementation of XOutputStream """
+    """ Minimal Implementation of XOutputStream
 
-    def __init__(self, debug=True):
+    Writes to output when it is given (an open binary file), otherwise to memory.
+    """
+
+    def __init__(self, debug=True, output=None):
         self.debug = debug
-        self.data = BytesIO()
+        self._owned = output is None
+        self.data = BytesIO() if output is None else output
         self.position = 0
         if self.debug:
             sys.stderr.write("__init__ OutputStreamWrapper.\n")
@@ -82,7 +89,8 @@ class OutputStreamWrapper(unohelper.Base, XOutputStream):
         if self.debug:
             sys.stderr.write(
                 "Closing output. %i bytes written.\n" % self.position)
-        self.data.close()
+        if self._owned:
+            self.data.close()
 
     def flush(self):
         if self.debug:
@@ -95,13 +103,64 @@ class OutputStreamWrapper(unohelper.Base, XOutputStream):
         pass
 
 
+class InputStreamWrapper(unohelper.Base, XInputStream, XSeekable):
+    """ Minimal Implementation of XInputStream and XSeekable over a buffer
+
+    LibreOffice reads the document in pieces straight from the buffer, like the
+    mmap of a spooled file, instead of from a ByteSequence copy of all of it.
+    """
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.position = 0
+
+    def readBytes(self, data, length):
+        chunk = self.buffer[self.position:self.position + length]
+        self.position += len(chunk)
+        return len(chunk), uno.ByteSequence(chunk)
+
+    def readSomeBytes(self, data, length):
+        return self.readBytes(data, length)
+
+    def skipBytes(self, length):
+        self.position = min(self.position + length, len(self.buffer))
+
+    def available(self):
+        return len(self.buffer) - self.position
+
+    def closeInput(self):
+        # The buffer may be closed right after, nothing must read it anymore
+        self.buffer = b''
+        self.position = 0
+
+    def seek(self, location):
+        if location < 0 or location > len(self.buffer):
+            raise IllegalArgumentException('Position %s out of the stream' % location, self, 0)
+        self.position = location
+
+    def getPosition(self):
+        return self.position
+
+    def getLength(self):
+        return len(self.buffer)
+
+
 class StarOfficeClient:
 
-    def __init__(self, host='localhost', port=DEFAULT_OPENOFFICE_PORT, ooo_restart_cmd=None):
+    dead = False  # the office process was replaced, see markDead
+
+    def __init__(self, host='localhost', port=DEFAULT_OPENOFFICE_PORT, ooo_restart=None, connection=None):
+        """
+        connection is an UNO connection string, like "pipe,name=aeroo-office-0",
+        when it is not given the office is reached by socket on host and port.
+        ooo_restart is called to restart the office, it returns once the office
+        accepts connections again.
+        """
         self._host = host
         self._port = port
+        self._connection = connection or SOCKETSTR % (host, port)
         self.logger = logging.getLogger('main')
-        self._ooo_restart_cmd = ooo_restart_cmd
+        self._ooo_restart = ooo_restart
         self.localContext = uno.getComponentContext()
         self.serviceManager = self.localContext.ServiceManager  # type: ignore
         resolvervector = "com.sun.star.bridge.UnoUrlResolver"
@@ -119,10 +178,10 @@ class StarOfficeClient:
                     self._connectOffice()
                 except NoConnectException as exception:
                     raise StarOfficeClientException(
-                        "Failed to connect to OpenOffice.org on host %s, port %s. %s" % (host, port, exception))
+                        "Failed to connect to OpenOffice.org on %s. %s" % (self._connection, exception))
             else:
                 raise StarOfficeClientException(
-                    "Failed to connect to OpenOffice.org on host %s, port %s. %s" % (host, port, exception))
+                    "Failed to connect to OpenOffice.org on %s. %s" % (self._connection, exception))
 
         except ConnectionSetupException as exception:
             raise StarOfficeClientException(
@@ -173,6 +232,8 @@ class StarOfficeClient:
             # nothing about it, that is why we need to create new desktop or
             # even try to completely reconnect to new office socket. Then give
             # it another try.
+            if self.dead:
+                raise StarOfficeClientException('The office on %s was replaced' % self._connection)
             time.sleep(15)
             self._createDesktop()
             self.putDocument(data, filter_name=filter_name,
@@ -201,25 +262,35 @@ class StarOfficeClient:
                 except DisposedException:
                     pass
 
-    def saveByStream(self, filter_name: str):
+    def saveByStream(self, filter_name: str, output=None, links: bool = True, fields: bool = True,
+                     indexes: bool = True, filter_data: Optional[dict] = None):
         """
         Downloads document from office service
+        When output (an open binary file) is given the document is written there
+        and the number of bytes written is returned, instead of the document bytes
+        links, fields and indexes tell which updates the document needs before the export
+        filter_data holds the options of the export filter, like the image quality of a PDF
         """
-        self._updateDocument()
-        outputStream = OutputStreamWrapper(False)
+        self._updateDocument(links, fields, indexes)
+        outputStream = OutputStreamWrapper(False, output)
         properties: dict[str, str | OutputStreamWrapper] = {"OutputStream": outputStream}
         properties.update({"FilterName": filter_name})
         if filter_name == 'Text - txt - csv (StarCalc)':
             properties.update({"FilterOptions": CSVFilterOptions})
+        if filter_data:
+            properties.update({"FilterData": uno.Any("[]com.sun.star.beans.PropertyValue",
+                                                     self._toProperties(**filter_data))})
         props = self._toProperties(**properties)
         try:
             self.document.storeToURL('private:stream', props)
         except DisposedException:
             raise Exception('Office not available')
-        except Exception as exception:
-            exceptionType, exceptionValue, exceptionTraceback = sys.exc_info()
-            traceback.print_exception(exceptionType, exceptionValue,
-                                      exceptionTraceback, limit=2, file=sys.stdout)
+        except Exception:
+            # A half written result must not pass for a complete document
+            self.logger.exception('Export with %s failed' % filter_name)
+            raise
+        if output is not None:
+            return outputStream.position
         openDocumentBytes = outputStream.data.getvalue()
         outputStream.close()
         return openDocumentBytes
@@ -284,7 +355,7 @@ class StarOfficeClient:
                 print("Error inserting file %s bytes on the OpenOffice document: %s" % (
                     len(doc), e))
                 raise e
-        self._updateDocument()
+        # saveByStream updates the whole document once, after the last append
 
     def testConnection(self) -> bool:
         try:
@@ -307,9 +378,45 @@ class StarOfficeClient:
             self.logger.warning(e)
             return False
 
+    def isAlive(self) -> bool:
+        """
+        Cheap check of the UNO bridge, it does not load any document
+        """
+        if self.dead:
+            return False
+        try:
+            if getattr(self, 'desktop', None) is None:
+                self._createDesktop()
+            self.desktop.getCurrentComponent()
+            return True
+        except (DisposedException, RuntimeException, UnknownPropertyException, NoConnectException) as e:
+            self.logger.debug('Office connection %s lost: %s', self._connection, e)
+            return False
+
+    def markDead(self):
+        """
+        The office process was replaced: the calls still running on this client
+        raise instead of reconnecting to whatever listens next on its connection
+        """
+        self.dead = True
+
+    def terminate(self):
+        """
+        Ask the office to exit, the bridge is gone afterwards
+        """
+        try:
+            if getattr(self, 'desktop', None) is None:
+                self._createDesktop()
+            self.desktop.terminate()
+        except (DisposedException, RuntimeException, UnknownPropertyException, NoConnectException) as e:
+            # The bridge can be disposed while the office exits
+            self.logger.debug('Office connection %s closed while terminating: %s', self._connection, e)
+
     def _connectOffice(self):
+        if self.dead:
+            raise StarOfficeClientException('The office on %s was replaced' % self._connection)
         self._context = self._resolver.resolve(
-            RESOLVESTR % (self._host, self._port))
+            RESOLVESTR % self._connection)
 
     def _createDesktop(self):
         try:
@@ -320,23 +427,32 @@ class StarOfficeClient:
             self._connectOffice()
             self._createDesktop()
 
-    def _updateDocument(self):
-        try:
-            self.document.updateLinks()
-        except AttributeError:
-            # if document doesn't support XLinkUpdate interface
-            pass
-        try:
-            self.document.refresh()
-            indexes = self.document.getDocumentIndexes()
-        except AttributeError:
-            # ods document does not support refresh
-            pass
-        else:
-            for inc in range(0, indexes.getCount()):
-                indexes.getByIndex(inc).update()
+    def _updateDocument(self, links: bool = True, fields: bool = True, indexes: bool = True):
+        if links:
+            try:
+                self.document.updateLinks()
+            except AttributeError:
+                # if document doesn't support XLinkUpdate interface
+                pass
+        if fields:
+            try:
+                self.document.refresh()
+            except AttributeError:
+                # ods document does not support refresh
+                pass
+        if indexes:
+            try:
+                document_indexes = self.document.getDocumentIndexes()
+            except AttributeError:
+                pass
+            else:
+                for inc in range(0, document_indexes.getCount()):
+                    document_indexes.getByIndex(inc).update()
 
     def _initStream(self, data):
+        if not isinstance(data, bytes):
+            # Spooled documents are mapped files, let LibreOffice read them in pieces
+            return InputStreamWrapper(data)
         streamvector = "com.sun.star.io.SequenceInputStream"
         subStream = self.serviceManager.createInstanceWithContext(
             streamvector, self.localContext)
@@ -356,21 +472,13 @@ class StarOfficeClient:
         return tuple(props)
 
     def _restart_ooo(self):
-        if not self._ooo_restart_cmd:
+        if self._ooo_restart is None:
             self.logger.warning(
-                'No LibreOffice/OpenOffice restart script configured')
+                'No LibreOffice/OpenOffice restart configured')
             return False
         self.logger.info(
             'Restarting LibreOffice/OpenOffice background process')
-        try:
-            self.logger.info('Executing restart script "%s"' %
-                             self._ooo_restart_cmd)
-            subprocess.Popen(self._ooo_restart_cmd, start_new_session=True)
-            time.sleep(4)  # Let some time for LibO/OOO to be fully started
-        except OSError as e:
-            self.logger.error(
-                'Failed to execute the restart script. OS error: %s' % e)
-        return True
+        return self._ooo_restart()
 
     # def convertByPath(self, inputFile, outputFile):
     #     inputUrl = self._toFileUrl(inputFile)
@@ -28,18 +28,41 @@
 #
 ################################################################################
 
+import atexit
+import json
 from pathlib import Path
 from socketserver import ThreadingMixIn
-from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+from wsgiref.simple_server import WSGIServer, make_server
 import logging
 import sys
-from os import environ
+from os import cpu_count, environ
 
 from AerooServices import AerooServices
+from AsyncServer import AsyncServer
+from BinaryApplication import BinaryApplication
 from Cleaner import Cleaner
-from ExtendedJsonRpcApplication import ExtendedJsonRpcApplication
+from ConversionCache import ConversionCache
+from ExtendedJsonRpcApplication import JSON_BACKEND, ExtendedJsonRpcApplication
+from HealthApplication import Canary, HealthApplication
+from JobQueue import JobQueue
+from KeepAliveHandler import KeepAliveRequestHandler
+from Metrics import CACHE, OFFICE_BUSY, OFFICE_PROCESS, QUEUE_DEPTH, metrics_app
+from OfficePool import OfficePool
+from OfficeSupervisor import OfficeSupervisor, RecyclePolicy
+from PdfPresets import PdfPresets
 
 SPOOL_DIRECTORY = '/tmp/aeroo-docs'
+OFFICE_BINARY = '/opt/libreoffice%s/program/soffice' % environ.get('OO_VERSION', '')
+
+
+def parseWeights(value: str) -> dict[str, float]:
+    """ Parse "client_a=4,client_b=0.5" into a dict of fair queueing weights. """
+    weights = {}
+    for item in value.split(','):
+        if '=' in item:
+            client_id, weight = item.rsplit('=', 1)
+            weights[client_id.strip()] = float(weight)
+    return weights
 
 
 def changeLogLevel(verbose: bool, client_id: str):
@@ -49,7 +72,10 @@ def changeLogLevel(verbose: bool, client_id: str):
 
 
 class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
-    pass
+    daemon_threads = True  # kept open connections must not hold the process
+    idle_timeout = 15
+    max_requests = 1000
+    max_body_bytes = 256 * 1024 * 1024
 
 
 def main():
@@ -57,16 +83,37 @@ def main():
     logger.addHandler(logging.StreamHandler())
     logger.setLevel(logging.DEBUG)
 
-    if environ.get('ENABLE_SPOOL_DIRECTORY', 'false') == 'true':
-        Path.mkdir(Path(SPOOL_DIRECTORY), parents=True, exist_ok=True)
-        # Cleaner
-        cleaner = Cleaner()
-        cleaner.daemon = True
-        cleaner.start()
+    # Uploads, spooled and job results always live in the spool, the Cleaner expires them
+    Path.mkdir(Path(SPOOL_DIRECTORY), parents=True, exist_ok=True)
+    cleaner = Cleaner(spool_directory=SPOOL_DIRECTORY, quota=int(environ.get('SPOOL_QUOTA_BYTES', 0)))
+    cleaner.daemon = True
+    cleaner.start()
 
     try:
-        aerooServices = AerooServices(spool_directory=SPOOL_DIRECTORY,
-                                      soffice_restart_cmd="/usr/local/bin/officeLauncher.sh")
+        supervisor = OfficeSupervisor(binary=environ.get('OFFICE_BINARY', OFFICE_BINARY),
+                                      start_timeout=float(environ.get('OFFICE_START_TIMEOUT', 60)),
+                                      policy=RecyclePolicy(conversions=int(environ.get('RECYCLE_CONVERSIONS', 500)),
+                                                           rss=int(environ.get('RECYCLE_RSS_BYTES', 1024 ** 3)),
+                                                           cpu=float(environ.get('RECYCLE_CPU_SECONDS', 0)),
+                                                           age=float(environ.get('RECYCLE_AGE_SECONDS', 86400))))
+        atexit.register(supervisor.stop_all)
+        office_pool = OfficePool(size=int(environ.get('OFFICE_INSTANCES', cpu_count() or 1)),
+                                 base_port=int(environ.get('OFFICE_BASE_PORT', 2002)),
+                                 supervisor=supervisor,
+                                 transport=environ.get('OFFICE_TRANSPORT', 'socket'),
+                                 weights=parseWeights(environ.get('CLIENT_WEIGHTS', '')),
+                                 heavy_size=int(environ.get('OFFICE_HEAVY_INSTANCES', 0)),
+                                 heavy_cost=float(environ.get('HEAVY_COST', 100)),
+                                 standby=int(environ.get('OFFICE_STANDBY', 1)))
+        logger.info('Office pool with %s instances and %s standby' % (office_pool.size, len(office_pool.spares)))
+        cache = ConversionCache(memory_bytes=int(environ.get('CACHE_MEMORY_BYTES', 0)),
+                                disk_bytes=int(environ.get('CACHE_DISK_BYTES', 0)),
+                                directory=SPOOL_DIRECTORY + '/cache')
+        aerooServices = AerooServices(spool_directory=SPOOL_DIRECTORY, office_pool=office_pool, cache=cache,
+                                      cleaner=cleaner,
+                                      pdf_presets=PdfPresets(json.loads(environ.get('PDF_PRESETS') or '{}')))
+        jobs = JobQueue(aerooServices, workers=int(environ.get('JOB_WORKERS', office_pool.size)),
+                        max_queued=int(environ.get('JOB_QUEUE_SIZE', 1000)))
     except Exception as e:
         logger.error('failed to create the ApplicationServices ')
         logger.error(str(e))
@@ -75,24 +122,70 @@ def main():
     interfaces = {
         'convert': aerooServices.convert,
         'upload': aerooServices.upload,
+        'upload_status': aerooServices.upload_status,
         'join': aerooServices.join,
+        'download': aerooServices.download,
+        'submit_convert': jobs.submit_convert,
+        'submit_join': jobs.submit_join,
+        'job_status': jobs.job_status,
+        'job_result': jobs.job_result,
         'test': aerooServices.test,
+        'cache_stats': aerooServices.cache_stats,
+        'queue_stats': aerooServices.queue_stats,
         'log': changeLogLevel
     }
 
     app = ExtendedJsonRpcApplication(rpcs=interfaces)
-
-    # WSGI requires the app to return bytes, so wrap if necessary
+    logger.info('JSON-RPC with the %s backend', JSON_BACKEND)
+
+    # Raw document endpoints next to the JSON-RPC application
+    binary_app = BinaryApplication(aerooServices)
+    routes = {path: binary_app for path in binary_app.paths}
+    routes['/metrics'] = metrics_app
+
+    # Probes read cached state, the test conversion runs on its own timer
+    canary = None
+    canary_delay = int(environ.get('HEALTH_CANARY_INTERVAL', 300))
+    if canary_delay > 0:
+        canary = Canary(aerooServices, delay=canary_delay)
+        canary.start()
+    health_app = HealthApplication(aerooServices, canary, jobs)
+    routes.update({path: health_app for path in health_app.paths})
+
+    # Gauges read at scrape time
+    lanes = office_pool.lanes
+    QUEUE_DEPTH.collect = lambda: [({'queue': lane}, scheduler.queued) for lane, scheduler in lanes.items()] \
+        + [({'queue': 'jobs'}, jobs.queued)]
+    OFFICE_BUSY.collect = lambda: [({'lane': lane}, scheduler.busy) for lane, scheduler in lanes.items()]
+    OFFICE_PROCESS.collect = lambda: [({'instance': index, 'stat': stat}, value)
+                                      for index, stats in office_pool.process_stats().items()
+                                      for stat, value in stats.items() if stat != 'pid' and value is not None]
+    CACHE.collect = lambda: [({'stat': stat}, value) for stat, value in cache.stats().items()]
+
+    # Every application returns bytes, the result is handed over as it is so
+    # the server sees a single block and can set its length
     def wsgi_app(environ, start_response):
-        result = app(environ, start_response)
-        for item in result:
-            if isinstance(item, str):
-                yield item.encode('utf-8')
-            else:
-                yield item
+        return routes.get(environ.get('PATH_INFO', '/'), app)(environ, start_response)
 
     try:
-        httpd = make_server("0.0.0.0", 8989, wsgi_app, ThreadingWSGIServer, WSGIRequestHandler)
+        idle_timeout = int(environ.get('HTTP_IDLE_TIMEOUT', 15))
+        max_requests = int(environ.get('HTTP_MAX_REQUESTS', 1000))
+        max_body_bytes = int(environ.get('HTTP_MAX_BODY_BYTES', 256 * 1024 * 1024))
+        if environ.get('HTTP_SERVER', 'asyncio') == 'threading':
+            httpd = make_server("0.0.0.0", 8989, wsgi_app, ThreadingWSGIServer, KeepAliveRequestHandler)
+            httpd.idle_timeout = idle_timeout
+            httpd.max_requests = max_requests
+            httpd.max_body_bytes = max_body_bytes
+        else:
+            httpd = AsyncServer(wsgi_app, "0.0.0.0", 8989,
+                                workers=int(environ.get('HTTP_WORKERS', office_pool.size * 2 + 4)),
+                                queue_size=int(environ.get('HTTP_QUEUE_SIZE', 64)),
+                                per_client=int(environ.get('HTTP_CLIENT_LIMIT', 0)),
+                                retry_after=int(environ.get('HTTP_RETRY_AFTER', 1)),
+                                idle_timeout=idle_timeout,
+                                max_requests=max_requests,
+                                max_body_bytes=max_body_bytes,
+                                inline_paths=('/metrics', *health_app.paths))
     except OSError as e:
         logger.error('failed to create the server ')
         if e.errno == 98:
@@ -0,0 +1,34 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'src'), os.path.join(ROOT, 'bench')]
+
+import fakeoffice  # noqa: E402
+
+# StarOfficeClient imports uno, the fake office answers in its place
+fakeoffice.install()
+
+TEST_DOCUMENT = os.path.join(ROOT, 'src', 'test.odt')
+
+
+@pytest.fixture
+def document() -> bytes:
+    with open(TEST_DOCUMENT, 'rb') as test_file:
+        return test_file.read()
+
+
+@pytest.fixture
+def fake_settings():
+    """ Delays of the fake office, back to none after the test. """
+    yield fakeoffice.settings
+    fakeoffice.settings.load_delay = fakeoffice.settings.export_delay = fakeoffice.settings.delay_per_mb = 0.0
+
+
+@pytest.fixture
+def services(tmp_path):
+    from AerooServices import AerooServices
+    from OfficePool import OfficePool
+    return AerooServices(spool_directory=str(tmp_path), office_pool=OfficePool(size=2))
@@ -0,0 +1,100 @@
+import http.client
+import threading
+import time
+
+import pytest
+
+from AsyncServer import AsyncServer
+
+
+class App():
+    """ Echoes the body, blocks /slow requests until released. """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+
+    def __call__(self, environ, start_response):
+        if environ['PATH_INFO'] == '/slow':
+            self.started.release()
+            self.release.wait(5)
+        body = environ['wsgi.input'].read()
+        start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', str(len(body) + 3))])
+        return [b'ok:', body]
+
+
+def serve(app, **kwargs) -> AsyncServer:
+    server = AsyncServer(app, host='127.0.0.1', port=0, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start(app, **kwargs) -> int:
+    return serve(app, **kwargs).socket.getsockname()[1]
+
+
+def wait_idle(server: AsyncServer):
+    # The slot of a request is released once its answer is written, the client may read it before
+    deadline = time.time() + 5
+    while server.inflight:
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def request(port: int, path: str = '/', body: bytes = b'') -> http.client.HTTPResponse:
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    connection.request('POST', path, body=body)
+    return connection.getresponse()
+
+
+@pytest.fixture
+def app():
+    app = App()
+    yield app
+    app.release.set()
+
+
+def test_runs_the_application(app):
+    port = start(app)
+    response = request(port, body=b'x' * 200000)
+    assert response.status == 200 and response.read() == b'ok:' + b'x' * 200000
+
+
+def test_busy_server_answers_503(app):
+    server = serve(app, workers=1, queue_size=0, retry_after=7, inline_paths=('/inline',))
+    port = server.socket.getsockname()[1]
+    slow = threading.Thread(target=lambda: request(port, '/slow').read())
+    slow.start()
+    assert app.started.acquire(timeout=5)
+    response = request(port, body=b'turned away')
+    assert response.status == 503 and response.getheader('Retry-After') == '7'
+    # Cheap paths are never turned away
+    assert request(port, '/inline').status == 200
+    app.release.set()
+    slow.join(5)
+    wait_idle(server)
+    assert request(port).status == 200
+
+
+def test_client_limit_answers_429(app):
+    port = start(app, workers=4, per_client=1)
+    slow = threading.Thread(target=lambda: request(port, '/slow').read())
+    slow.start()
+    assert app.started.acquire(timeout=5)
+    assert request(port).status == 429
+    app.release.set()
+    slow.join(5)
+
+
+def test_body_over_the_limit_answers_413(app):
+    port = start(app, max_body_bytes=1000)
+    assert request(port, body=b'x' * 1000).status == 200
+    response = request(port, body=b'x' * 1001)
+    assert response.status == 413 and response.getheader('Connection') == 'close'
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+    connection.putrequest('POST', '/')
+    connection.putheader('Transfer-Encoding', 'chunked')
+    connection.endheaders()
+    connection.send(b'200\r\n' + b'x' * 0x200 + b'\r\n' + b'200\r\n' + b'x' * 0x200 + b'\r\n')
+    response = connection.getresponse()
+    assert response.status == 413 and response.getheader('Connection') == 'close'
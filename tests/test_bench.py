@@ -0,0 +1,19 @@
+from argparse import Namespace
+
+import pytest
+
+import bench_hotpaths
+
+
+@pytest.mark.parametrize('name', sorted(bench_hotpaths.benchmarks))
+def test_benchmark_runs(name):
+    options = Namespace(size_mb=1, images=2, parts=2, files=10, repeat=1)
+    result = bench_hotpaths.measure(name, options)
+    assert result['name'] == name
+    assert 'skipped' in result or result['min'] <= result['max']
+
+
+def test_make_document_is_a_package():
+    from Preflight import estimate_cost
+    cost = estimate_cost(bench_hotpaths.make_document(64 * 1024, images=3))
+    assert cost.images == 3 and cost.table_rows > 0
@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+from BinaryApplication import BinaryApplication
+
+
+def call(app, method: str = 'POST', body: bytes = b'', query: str = '', content_type: str = 'application/octet-stream'):
+    environ = {'REQUEST_METHOD': method, 'PATH_INFO': '/convert', 'QUERY_STRING': query,
+               'CONTENT_TYPE': content_type, 'CONTENT_LENGTH': str(len(body)), 'REMOTE_ADDR': '127.0.0.1',
+               'wsgi.input': io.BytesIO(body)}
+    response = {}
+
+    def start_response(status, headers):
+        response['status'] = status
+        response['headers'] = dict(headers)
+    response['body'] = b''.join(app(environ, start_response))
+    return response
+
+
+@pytest.fixture
+def app(services):
+    return BinaryApplication(services)
+
+
+def test_convert_raw_body(app, document):
+    response = call(app, body=document, query='in=odt&out=pdf')
+    assert response['status'] == '200 OK'
+    assert response['headers']['Content-Type'] == 'application/pdf'
+    assert response['body'].startswith(b'%PDF')
+    assert int(response['headers']['Content-Length']) == len(response['body'])
+
+
+def test_convert_multipart_body(app, document):
+    boundary = 'aeroo-boundary'
+    body = (b'--%s\r\nContent-Disposition: form-data; name="out"\r\n\r\ndoc\r\n'
+            b'--%s\r\nContent-Disposition: form-data; name="file"; filename="test.odt"\r\n'
+            b'Content-Type: application/vnd.oasis.opendocument.text\r\n\r\n' % (boundary.encode(), boundary.encode())
+            + document + b'\r\n--%s--\r\n' % boundary.encode())
+    response = call(app, body=body, content_type='multipart/form-data; boundary=%s' % boundary)
+    assert response['status'] == '200 OK'
+    assert response['headers']['Content-Type'] == 'application/msword'
+    assert response['body'].endswith(document)
+
+
+def test_errors(app):
+    assert call(app, method='GET')['status'] == '405 Method Not Allowed'
+    assert call(app)['status'] == '411 Length Required'
+    assert call(app, body=b'not a zip')['status'] == '500 Internal Server Error'
+
+
+def test_missing_client_id_is_unknown(app, document, monkeypatch):
+    client_ids = []
+
+    def convert_bytes(body, in_mime, out_mime, client_id, pdf_preset=''):
+        client_ids.append(client_id)
+        return body
+    monkeypatch.setattr(app.services, 'convert_bytes', convert_bytes)
+    call(app, body=document)
+    call(app, body=document, query='client_id=erp')
+    assert client_ids == ['unknown', 'erp']
+
+
+def test_pdf_preset(app, document):
+    response = call(app, body=document, query='preset=screen')
+    assert response['status'] == '200 OK' and response['body'].startswith(b'%PDF')
+    response = call(app, body=document, query='preset=poster')
+    assert response['status'] == '400 Bad Request' and b'Unknown PDF preset' in response['body']
@@ -0,0 +1,83 @@
+import os
+from time import time
+
+from Cleaner import Cleaner
+
+
+def _file(directory, name: str, age: float = 0) -> str:
+    path = os.path.join(directory, name)
+    with open(path, 'w') as spool_file:
+        spool_file.write('x')
+    os.utime(path, (time() - age, time() - age))
+    return path
+
+
+def test_clean_removes_expired_files(tmp_path):
+    expired = _file(tmp_path, 'expired', age=100)
+    fresh = _file(tmp_path, 'fresh')
+    os.mkdir(tmp_path / 'cache')
+    cleaner = Cleaner(expire=60, spool_directory=str(tmp_path))
+    cleaner.resync()
+    cleaner.clean()
+    assert not os.path.exists(expired)
+    assert os.path.exists(fresh) and os.path.isdir(tmp_path / 'cache')
+
+
+def _indexed(directory, names: list, quota: int) -> Cleaner:
+    for age, name in enumerate(reversed(names)):
+        _file(directory, name, age=10 + age)
+    cleaner = Cleaner(spool_directory=str(directory), quota=quota)
+    cleaner.resync()
+    return cleaner
+
+
+def test_quota_evicts_the_oldest_files(tmp_path):
+    cleaner = _indexed(tmp_path, ['oldest', 'older', 'newest'], quota=1)
+    cleaner.clean()
+    assert sorted(os.listdir(tmp_path)) == ['newest']
+
+
+def test_quota_skips_partial_and_downloaded_files(tmp_path):
+    cleaner = _indexed(tmp_path, ['_upload', '_rresult', 'rdownloading', 'rdone', 'newest'], quota=1)
+    cleaner.hold('rdownloading')
+    cleaner.clean()
+    assert sorted(os.listdir(tmp_path)) == ['_rresult', '_upload', 'rdownloading']
+    # Released and still over the quota, it goes on the next pass
+    cleaner.release('rdownloading')
+    cleaner.clean()
+    assert sorted(os.listdir(tmp_path)) == ['_rresult', '_upload']
+
+
+def test_expired_files_are_deleted_even_when_held(tmp_path):
+    cleaner = _indexed(tmp_path, ['rdropped'], quota=0)
+    cleaner.expire = 1
+    cleaner.hold('rdropped')
+    cleaner.clean()
+    assert os.listdir(tmp_path) == [] and not cleaner._held
+
+
+def test_services_register_their_files(tmp_path, document):
+    import base64
+
+    from AerooServices import AerooServices
+    from OfficePool import OfficePool
+    cleaner = Cleaner(spool_directory=str(tmp_path))
+    services = AerooServices(spool_directory=str(tmp_path), office_pool=OfficePool(size=1), cleaner=cleaner)
+    identifier = services.convert(base64.b64encode(document).decode(), spool=True)['identifier']
+    result_file = services.open_result(identifier)
+    spooled = {os.path.relpath(os.path.join(root, name), tmp_path)
+               for root, _, names in os.walk(tmp_path) for name in names if not name.endswith('.meta')}
+    assert set(cleaner._entries) == spooled and cleaner._held
+    result_file.close()
+    services.release_result(identifier)
+    assert not cleaner._held
+
+
+def test_quota_skips_partial_files_in_shards(tmp_path):
+    os.mkdir(tmp_path / 'ab')
+    _file(tmp_path / 'ab', '_rpartial', age=20)
+    _file(tmp_path / 'ab', 'rdone', age=10)
+    cleaner = Cleaner(spool_directory=str(tmp_path), quota=1)
+    cleaner.resync()
+    cleaner.clean()
+    assert os.listdir(tmp_path / 'ab') == ['_rpartial']
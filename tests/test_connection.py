@@ -0,0 +1,45 @@
+import base64
+
+import pytest
+from com.sun.star.lang import DisposedException
+
+import fakeoffice
+from AerooServices import AerooServices
+from OfficePool import OfficeInstance, OfficePool
+
+
+@pytest.fixture
+def office_services(tmp_path):
+    office_pool = OfficePool(size=1, supervisor=fakeoffice.FakeSupervisor())
+    return AerooServices(spool_directory=str(tmp_path), office_pool=office_pool)
+
+
+def test_connection_strings():
+    assert OfficeInstance(0, port=2002).connection == 'socket,host=localhost,port=2002'
+    assert OfficeInstance(3, transport='pipe').connection == 'pipe,name=aeroo-office-3'
+    with pytest.raises(ValueError):
+        OfficeInstance(0, transport='tcp')
+
+
+def test_connection_reused(office_services, document):
+    data = base64.b64encode(document).decode()
+    office = office_services.office_pool.instances[0]
+    office_services.convert(data)
+    star_office_client = office.star_office_client
+    assert star_office_client is not None
+    office_services.convert(data)
+    assert office.star_office_client is star_office_client
+
+
+def test_lost_connection_replaced(office_services, document, monkeypatch):
+    office_services.convert(base64.b64encode(document).decode())
+    office = office_services.office_pool.instances[0]
+    lost = office.star_office_client
+
+    def disposed():
+        raise DisposedException('gone')
+    monkeypatch.setattr(lost.desktop, 'getCurrentComponent', disposed)
+    assert not lost.isAlive()
+    # The process behind a lost bridge is started again
+    assert office_services._conn_healthy(office) is not lost
+    assert office.star_office_client is not lost
@@ -0,0 +1,51 @@
+import base64
+
+import fakeoffice
+from AerooServices import AerooServices
+from ConversionCache import ConversionCache
+from OfficePool import OfficePool
+
+
+def test_memory_lru():
+    cache = ConversionCache(memory_bytes=10)
+    cache.put('a', b'12345')
+    cache.put('b', b'12345')
+    assert cache.get('a') == b'12345'
+    # b is now the least recently used
+    cache.put('c', b'12345')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'12345' and cache.get('c') == b'12345'
+    stats = cache.stats()
+    assert (stats['hits_memory'], stats['misses'], stats['evictions']) == (3, 1, 1)
+
+
+def test_key_depends_on_options():
+    cache = ConversionCache(memory_bytes=10)
+    assert cache.key(b'data', 'writer8', 'writer_pdf_Export') == cache.key(b'data', 'writer8', 'writer_pdf_Export')
+    assert cache.key(b'data', 'writer8', 'writer_pdf_Export') != cache.key(b'data', 'writer8', 'MS Word 97')
+
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    cache = ConversionCache(disk_bytes=100, directory=str(tmp_path))
+    cache.put('a', b'x' * 60)
+    cache.put('b', b'y' * 60)
+    assert cache.stats()['disk_entries'] == 1
+    reloaded = ConversionCache(memory_bytes=100, disk_bytes=100, directory=str(tmp_path))
+    assert reloaded.get('b') == b'y' * 60
+    assert reloaded.get('a') is None
+    assert reloaded.stats()['hits_disk'] == 1
+
+
+def test_convert_answered_from_the_cache(tmp_path, document, monkeypatch):
+    services = AerooServices(spool_directory=str(tmp_path), office_pool=OfficePool(size=1),
+                             cache=ConversionCache(memory_bytes=10 ** 7))
+    loads = []
+    load = fakeoffice._Desktop.loadComponentFromURL
+    monkeypatch.setattr(fakeoffice._Desktop, 'loadComponentFromURL',
+                        lambda desktop, *args: loads.append(1) or load(desktop, *args))
+    data = base64.b64encode(document).decode()
+    first = services.convert(data)
+    assert services.convert(data) == first
+    # Another filter is another conversion
+    services.convert(data, out_mime='doc')
+    assert len(loads) == 2
@@ -0,0 +1,73 @@
+import base64
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import AerooServices as services_module
+import CallWithTimeout
+import fakeoffice
+from AerooServices import AerooServices
+from OfficePool import OfficePool
+from StarOfficeClient import StarOfficeClient, StarOfficeClientException
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_promote_swaps_the_processes():
+    pool = OfficePool(size=1, standby=1)
+    office, spare = pool.instances[0], pool.spares[0]
+    assert pool.promote(office) is None
+    pool.add_standby(spare)
+    assert pool.promote(office) is spare
+    assert (office.process, spare.process) == (1, 0) and pool.standby == 0
+
+
+def test_held_process_waits_for_its_call():
+    pool = OfficePool(size=1, standby=2)
+    first, second = pool.spares
+    late = Future()
+    late.set_running_or_notify_cancel()
+    pool.add_standby(first)
+    pool.hold(first.process, late)
+    pool.hold(second.process, late)
+    # Taken back out of standby, or kept out when ready later
+    pool.add_standby(second)
+    assert pool.standby == 0
+    late.set_result(None)
+    assert pool.standby == 2
+
+
+def test_dead_client_does_not_reconnect():
+    client = StarOfficeClient(host='localhost', port=8100)
+    assert client.isAlive()
+    client.markDead()
+    assert not client.isAlive()
+    with pytest.raises(StarOfficeClientException, match='replaced'):
+        client._connectOffice()
+
+
+def test_hung_conversion_holds_the_replaced_process(tmp_path, document, fake_settings, monkeypatch):
+    monkeypatch.setattr(services_module, 'CONVERT_TIMEOUT', 0.1)
+    monkeypatch.setattr(CallWithTimeout, 'UNWIND_GRACE', 0.05)
+    services = AerooServices(spool_directory=str(tmp_path),
+                             office_pool=OfficePool(size=1, standby=1, supervisor=fakeoffice.FakeSupervisor()))
+    office = services.office_pool.instances[0]
+    wait_for(lambda: services.office_pool.standby == 1)
+    services.convert(base64.b64encode(document).decode())
+    hung_client = office.star_office_client
+    fake_settings.export_delay = 0.5
+    with pytest.raises(Exception, match='cannot be processed'):
+        services.convert(base64.b64encode(document).decode())
+    fake_settings.export_delay = 0.0
+    assert hung_client.dead and office.process == 1
+    # The office runs the standby process and stays in the pool, the hung process waits for its call
+    assert services.queue_stats()['lanes']['fast']['quarantined'] == 0
+    assert services.convert(base64.b64encode(document).decode())
+    assert services.office_pool.standby == 0
+    wait_for(lambda: services.office_pool.standby == 1)
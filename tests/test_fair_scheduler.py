@@ -0,0 +1,34 @@
+from FairScheduler import FairScheduler
+
+
+def _serve(scheduler, tickets) -> list:
+    """ Release the only instance again and again, the order the tickets are served in. """
+    served = []
+    while len(served) < len(tickets):
+        ticket = next(ticket for ticket in tickets if ticket.ready.is_set() and ticket not in served)
+        served.append(ticket)
+        scheduler._release(ticket.instance)
+    return [ticket.client_id for ticket in served]
+
+
+def test_batch_does_not_starve_other_clients():
+    scheduler = FairScheduler(['office'])
+    with scheduler.lease('bulk'):
+        tickets = [scheduler._enqueue('bulk') for _ in range(4)] + [scheduler._enqueue('interactive')]
+        assert scheduler.queued == 5
+    assert _serve(scheduler, tickets) == ['bulk', 'interactive', 'bulk', 'bulk', 'bulk']
+
+
+def test_weights_share_the_instances():
+    scheduler = FairScheduler(['office'], weights={'interactive': 2})
+    with scheduler.lease('bulk'):
+        tickets = [scheduler._enqueue('interactive') for _ in range(4)] + [scheduler._enqueue('bulk') for _ in range(2)]
+    assert _serve(scheduler, tickets) == ['interactive', 'interactive', 'bulk', 'interactive', 'interactive', 'bulk']
+
+
+def test_stats():
+    scheduler = FairScheduler(['office'], weights={'erp': 3})
+    with scheduler.lease('erp'):
+        pass
+    stats = scheduler.stats()
+    assert stats['erp']['weight'] == 3 and stats['erp']['served'] == 1 and stats['erp']['queued'] == 0
@@ -0,0 +1,67 @@
+import base64
+import json
+import time
+
+import pytest
+
+import fakeoffice
+from AerooServices import AerooServices
+from HealthApplication import Canary, HealthApplication
+from OfficePool import OfficePool
+
+
+def get(app, path: str) -> tuple[str, dict]:
+    response = {}
+
+    def start_response(status, headers):
+        response['status'] = status
+    data = b''.join(app({'REQUEST_METHOD': 'GET', 'PATH_INFO': path}, start_response))
+    return response['status'], json.loads(data)
+
+
+def test_healthz_and_unknown_path(services):
+    app = HealthApplication(services)
+    status, body = get(app, '/healthz')
+    assert status == '200 OK' and body['status'] == 'ok'
+    assert get(app, '/missing')[0] == '404 Not Found'
+
+
+def test_ready_once_an_office_is_connected(services, document):
+    app = HealthApplication(services)
+    status, body = get(app, '/readyz')
+    assert status == '503 Service Unavailable' and body['last_success_age'] is None
+    services.convert(base64.b64encode(document).decode())
+    status, body = get(app, '/readyz')
+    assert status == '200 OK' and body['status'] == 'ready'
+    assert body['last_success'] > 0 and body['queued'] == {'fast': 0}
+
+
+def test_ready_while_a_process_runs(tmp_path):
+    office_pool = OfficePool(size=1, supervisor=fakeoffice.FakeSupervisor())
+    services = AerooServices(spool_directory=str(tmp_path), office_pool=office_pool)
+    status, body = get(HealthApplication(services), '/readyz')
+    assert status == '200 OK' and body['instances']['0'] == {'process': 0, 'connected': False, 'running': True}
+
+
+def test_failed_canary_is_not_ready(services, document, monkeypatch):
+    services.convert(base64.b64encode(document).decode())
+
+    def broken(client_id):
+        raise Exception('Convertion failed')
+    monkeypatch.setattr(services, 'test', broken)
+    canary = Canary(services, delay=3600)
+    canary.start()
+    deadline = time.time() + 5
+    while not canary.last_run:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    status, body = get(HealthApplication(services, canary), '/readyz')
+    assert status == '503 Service Unavailable'
+    assert body['canary']['error'] == 'Convertion failed' and not body['canary']['healthy']
+
+
+@pytest.mark.parametrize('path', ['/healthz', '/readyz'])
+def test_probes_take_no_lease(services, path):
+    with services.office_pool.lease() as office, services.office_pool.lease():
+        office.star_office_client = object()
+        assert get(HealthApplication(services), path)[0] == '200 OK'
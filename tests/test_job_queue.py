@@ -0,0 +1,75 @@
+import base64
+import time
+
+import pytest
+
+from AerooServices import NoidentException
+from JobQueue import JobQueue
+
+
+def _wait(jobs, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = jobs.job_status(job_id)
+        if status['state'] in ('done', 'failed'):
+            return status
+        time.sleep(0.01)
+    raise AssertionError('job %s did not finish' % job_id)
+
+
+def test_convert_job_result(services, document):
+    jobs = JobQueue(services)
+    job = jobs.submit_convert(data=base64.b64encode(document).decode('utf8'))
+    assert _wait(jobs, job['job_id'])['state'] == 'done'
+    chunk = jobs.job_result(job['job_id'], length=1 << 20)
+    assert base64.b64decode(chunk['data']) == b'%PDF-1.4\n' + document and chunk['is_last']
+
+
+def test_queued_job_holds_no_document(services, document, fake_settings):
+    fake_settings.export_delay = 0.2
+    jobs = JobQueue(services)
+    data = base64.b64encode(document).decode('utf8')
+    first = jobs.submit_convert(data=data)
+    while jobs.job_status(first['job_id'])['state'] == 'queued':
+        time.sleep(0.01)
+    second = jobs.submit_convert(data=data)
+    queued = jobs._get(second['job_id'])
+    assert queued.state == 'queued' and 'data' not in queued.kwargs and queued.kwargs['identifier']
+    assert jobs.job_status(second['job_id'])['position'] == 1
+    for job in (first, second):
+        assert _wait(jobs, job['job_id'])['state'] == 'done'
+
+
+def test_full_queue_refuses_jobs(services, document, fake_settings):
+    fake_settings.export_delay = 0.2
+    jobs = JobQueue(services, max_queued=1)
+    data = base64.b64encode(document).decode('utf8')
+    running = jobs.submit_convert(data=data)
+    while jobs.job_status(running['job_id'])['state'] == 'queued':
+        time.sleep(0.01)
+    jobs.submit_convert(data=data)
+    with pytest.raises(Exception, match='full'):
+        jobs.submit_convert(data=data)
+
+
+def test_failed_and_unknown_jobs(services):
+    jobs = JobQueue(services)
+    job = jobs.submit_convert(identifier='missing')
+    assert _wait(jobs, job['job_id'])['state'] == 'failed'
+    with pytest.raises(Exception, match='failed'):
+        jobs.job_result(job['job_id'])
+    with pytest.raises(NoidentException):
+        jobs.job_status('missing')
+
+
+def test_bad_pdf_options_refused_at_submit(services, document, tmp_path):
+    jobs = JobQueue(services)
+    data = base64.b64encode(document).decode('utf8')
+    with pytest.raises(ValueError, match='Unknown PDF preset'):
+        jobs.submit_convert(data=data, pdf_preset='poster')
+    with pytest.raises(ValueError, match='Unknown PDF option'):
+        jobs.submit_join(['missing'], pdf_options={'Macro': 'x'})
+    # Nothing spooled nor queued
+    assert not jobs._jobs and not [path for path in tmp_path.rglob('*') if path.is_file()]
+    job = jobs.submit_convert(data=data, pdf_preset='archive', pdf_options={'Quality': 80})
+    assert _wait(jobs, job['job_id'])['state'] == 'done'
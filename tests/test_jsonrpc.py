@@ -0,0 +1,66 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip('jsonrpc2')
+
+import ExtendedJsonRpcApplication as rpc_module  # noqa: E402
+from ExtendedJsonRpcApplication import (ExtendedJsonRpcApplication, dumps_response, json_backend,  # noqa: E402
+                                        loads_request)
+
+BACKENDS = [name for name in ('orjson', 'ujson', 'json') if name == 'json' or getattr(rpc_module, name) is not None]
+
+
+def call(app, method: str, params: dict) -> tuple[str, dict]:
+    body = json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': method, 'params': params}).encode()
+    environ = {'REQUEST_METHOD': 'POST', 'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(body)),
+               'REMOTE_ADDR': '127.0.0.1', 'wsgi.input': io.BytesIO(body)}
+    response = {}
+
+    def start_response(status, headers):
+        response['status'] = status
+    data = b''.join(app(environ, start_response))
+    return response['status'], json.loads(data)
+
+
+def test_missing_client_id_is_unknown():
+    app = ExtendedJsonRpcApplication(rpcs={'echo': lambda client_id: client_id})
+    assert call(app, 'echo', {})[1]['result'] == 'unknown'
+    assert call(app, 'echo', {'client_id': 'erp'})[1]['result'] == 'erp'
+
+
+def test_large_data_param_is_sliced_out():
+    data = 'QUJD' * 20000
+    body = json.dumps({'jsonrpc': '2.0', 'id': 1, 'method': 'convert',
+                       'params': {'data': data, 'out_mime': 'pdf'}}).encode()
+    request = loads_request(body)
+    assert request['params'] == {'data': data, 'out_mime': 'pdf'}
+    # An escaped payload is parsed whole
+    escaped = body.replace(b'QUJD', b'\\/', 1)
+    assert loads_request(escaped)['params']['data'] == '/' + data[4:]
+
+
+def test_large_result_is_copied_between_pieces():
+    payload = 'QUJD' * 20000
+    for result in (payload, {'data': payload, 'mime': 'pdf'}):
+        pieces = dumps_response({'jsonrpc': '2.0', 'id': 1, 'result': result})
+        assert len(pieces) == 5 and pieces[2] == payload.encode()
+        assert json.loads(b''.join(pieces))['result'] == result
+    # Small or escaped strings go through the encoder
+    for result in ('small', 'a"b' * 30000):
+        pieces = dumps_response({'jsonrpc': '2.0', 'id': 1, 'result': result})
+        assert len(pieces) == 1 and json.loads(pieces[0])['result'] == result
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_queue_stats(services, monkeypatch, backend):
+    json_loads, json_dumps = json_backend(backend)
+    monkeypatch.setattr(rpc_module, 'json_loads', json_loads)
+    monkeypatch.setattr(rpc_module, 'json_dumps', json_dumps)
+    app = ExtendedJsonRpcApplication(rpcs={'queue_stats': services.queue_stats})
+    status, response = call(app, 'queue_stats', {})
+    assert status == '200 OK'
+    assert response['result']['instances'] == 2
+    # Integer keys are written as strings by every backend
+    assert json_loads(json_dumps({1: 'a'})) == {'1': 'a'}
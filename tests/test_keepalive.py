@@ -0,0 +1,104 @@
+import io
+import socket
+import threading
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, make_server
+
+import pytest
+
+from BinaryApplication import BinaryApplication
+from KeepAliveHandler import BodyTooLarge, KeepAliveRequestHandler, read_chunked
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    idle_timeout = 5
+    max_body_bytes = 1000
+
+
+def echo(environ, start_response):
+    body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+    start_response('200 OK', [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))])
+    return [body]
+
+
+def serve(app):
+    httpd = make_server('127.0.0.1', 0, app, ThreadingWSGIServer, KeepAliveRequestHandler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    return httpd
+
+
+@pytest.fixture
+def server(services):
+    httpd = serve(BinaryApplication(services))
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def echo_server():
+    httpd = serve(echo)
+    yield httpd.server_address
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def read_response(reader) -> tuple[str, dict, bytes]:
+    status = reader.readline().decode().strip()
+    headers = {}
+    for line in iter(reader.readline, b'\r\n'):
+        name, value = line.decode().split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    return status, headers, reader.read(int(headers['content-length']))
+
+
+def test_read_chunked():
+    body = b'4\r\nabcd\r\n2;ext=1\r\nef\r\n0\r\nTrailer: x\r\n\r\n'
+    assert read_chunked(io.BytesIO(body)) == b'abcdef'
+    with pytest.raises(BodyTooLarge):
+        read_chunked(io.BytesIO(body), limit=5)
+    with pytest.raises(ValueError):
+        read_chunked(io.BytesIO(b'4\r\nab'))
+
+
+def test_error_responses_on_one_connection(server):
+    with socket.create_connection(server, timeout=5) as client, client.makefile('rb') as reader:
+        client.sendall(b'GET /convert HTTP/1.1\r\nHost: test\r\n\r\n'
+                       b'GET /missing HTTP/1.1\r\nHost: test\r\n\r\n')
+        status, headers, body = read_response(reader)
+        assert status.endswith('405 Method Not Allowed')
+        assert body == b'Only POST is allowed'
+        status, headers, body = read_response(reader)
+        assert status.endswith('404 Not Found')
+        assert body == b'Not found'
+
+
+def test_chunked_body_then_next_request(echo_server):
+    with socket.create_connection(echo_server, timeout=5) as client, client.makefile('rb') as reader:
+        client.sendall(b'POST / HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n'
+                       b'3\r\nabc\r\n0\r\n\r\n'
+                       b'POST / HTTP/1.1\r\nHost: test\r\nContent-Length: 2\r\n\r\nde')
+        assert read_response(reader)[2] == b'abc'
+        assert read_response(reader)[2] == b'de'
+
+
+def test_chunked_body_over_the_limit_closes(echo_server):
+    with socket.create_connection(echo_server, timeout=5) as client, client.makefile('rb') as reader:
+        client.sendall(b'POST / HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n'
+                       b'200\r\n' + b'x' * 0x200 + b'\r\n'
+                       b'200\r\n' + b'x' * 0x200 + b'\r\n')
+        status, headers, body = read_response(reader)
+        assert status.endswith('413 Request Entity Too Large')
+        assert headers['connection'] == 'close'
+        assert reader.read() == b''
+
+
+def test_content_length_over_the_limit_closes(echo_server):
+    with socket.create_connection(echo_server, timeout=5) as client, client.makefile('rb') as reader:
+        client.sendall(b'POST / HTTP/1.1\r\nHost: test\r\nContent-Length: 1001\r\n\r\n')
+        status, headers, body = read_response(reader)
+        assert status.endswith('413 Request Entity Too Large')
+        assert headers['connection'] == 'close'
+        assert reader.read() == b''
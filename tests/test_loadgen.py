@@ -0,0 +1,35 @@
+import json
+from argparse import Namespace
+
+from AerooServices import filters
+from loadgen import DEFAULT_MIMES, percentile, read_trace, synthetic
+
+
+def test_default_mimes_are_known_filters():
+    for pair in DEFAULT_MIMES.split(','):
+        in_mime, out_mime = pair.split(':')
+        # The generated documents are text documents
+        assert in_mime == 'odt' and out_mime in filters
+
+
+def test_synthetic_requests():
+    options = Namespace(seed=1, mix='convert=1,join=1', mimes=DEFAULT_MIMES, requests=50, duration=0, rate=10.0,
+                        size_kb=10.0, size_sigma=1.0, max_size_kb=100.0, max_parts=3, clients=2)
+    requests = synthetic(options)
+    assert len(requests) == 50
+    assert {request.method for request in requests} == {'convert', 'join'}
+    assert all(request.size <= 100 * 1024 and 2 <= request.parts <= 3 for request in requests)
+    assert [request.t for request in requests] == sorted(request.t for request in requests)
+
+
+def test_read_trace(tmp_path):
+    trace = tmp_path / 'trace.jsonl'
+    trace.write_text(json.dumps({'t': 2, 'method': 'join', 'parts': 3}) + '\n\n' + json.dumps({'t': 1}) + '\n')
+    requests = read_trace(str(trace))
+    assert [(request.t, request.method) for request in requests] == [(1, 'convert'), (2, 'join')]
+
+
+def test_percentile():
+    values = [0.1 * index for index in range(1, 11)]
+    assert percentile(values, 0.5) == values[4] and percentile(values, 0.99) == values[-1]
+    assert percentile([], 0.5) == 0.0
@@ -0,0 +1,50 @@
+import base64
+
+import pytest
+
+from Metrics import ERRORS, REQUESTS, STAGE_SECONDS, Counter, Gauge, Histogram, metrics_app
+
+
+def test_counter_and_gauge_render():
+    counter = Counter('test_total', 'Test counter.', ('client_id',))
+    counter.inc(client_id='a"b')
+    counter.inc(2, client_id='a"b')
+    assert counter.render() == ['# HELP test_total Test counter.', '# TYPE test_total counter',
+                                'test_total{client_id="a\\"b"} 3']
+    gauge = Gauge('test_depth', 'Test gauge.', ('queue',), collect=lambda: [({'queue': 'fast'}, 4)])
+    assert gauge.render()[-1] == 'test_depth{queue="fast"} 4'
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('test_seconds', 'Test histogram.', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, stage='load')
+    assert histogram.render()[2:] == [
+        'test_seconds_bucket{stage="load",le="0.1"} 1',
+        'test_seconds_bucket{stage="load",le="1.0"} 3',
+        'test_seconds_bucket{stage="load",le="+Inf"} 4',
+        'test_seconds_count{stage="load"} 4',
+        'test_seconds_sum{stage="load"} 6.05',
+    ]
+
+
+def test_conversions_are_measured(services, document):
+    key = REQUESTS._key({'method': 'convert', 'filter': 'pdf', 'client_id': 'metrics'})
+    before = REQUESTS._values.get(key, 0)
+    services.convert(base64.b64encode(document).decode(), client_id='metrics')
+    with pytest.raises(Exception):
+        services.convert(base64.b64encode(b'not a zip').decode(), client_id='metrics')
+    assert REQUESTS._values[key] == before + 2
+    assert ERRORS._values[key] >= 1
+    assert {('convert', 'load'), ('convert', 'export')} <= set(STAGE_SECONDS._values)
+
+
+def test_metrics_app():
+    response = {}
+
+    def start_response(status, headers):
+        response['status'] = status
+        response['headers'] = dict(headers)
+    body = b''.join(metrics_app({}, start_response)).decode()
+    assert response['status'] == '200 OK' and response['headers']['Content-Type'].startswith('text/plain')
+    assert '# TYPE aeroo_requests_total counter' in body
@@ -0,0 +1,63 @@
+import base64
+import time
+
+import pytest
+
+import fakeoffice
+from AerooServices import AerooServices
+from ConversionCache import ConversionCache
+from JobQueue import JobQueue
+from OfficePool import OfficePool
+
+
+@pytest.fixture
+def loads(monkeypatch) -> list:
+    """ Documents loaded by the fake office. """
+    loaded = []
+    load = fakeoffice._Desktop.loadComponentFromURL
+
+    def loadComponentFromURL(desktop, url, frame, flags, props):
+        loaded.append(url)
+        return load(desktop, url, frame, flags, props)
+    monkeypatch.setattr(fakeoffice._Desktop, 'loadComponentFromURL', loadComponentFromURL)
+    return loaded
+
+
+def test_one_load_for_every_output(services, document, loads):
+    result = services.convert(base64.b64encode(document).decode(), out_mime=['pdf', 'odt', 'pdf'])
+    assert list(result) == ['pdf', 'odt'] and len(loads) == 1
+    assert all(base64.b64decode(data) == b'%PDF-1.4\n' + document for data in result.values())
+    # A single out_mime keeps its former answer
+    assert isinstance(services.convert(base64.b64encode(document).decode(), out_mime='pdf'), str)
+
+
+def test_spooled_outputs(services, document):
+    result = services.convert(base64.b64encode(document).decode(), out_mime=['pdf', 'doc'], spool=True)
+    for output in result.values():
+        chunk = services.download(output['identifier'], 0, output['size'])
+        assert base64.b64decode(chunk['data']) == b'%PDF-1.4\n' + document
+
+
+def test_only_the_missing_outputs_are_exported(tmp_path, document, loads):
+    services = AerooServices(spool_directory=str(tmp_path), office_pool=OfficePool(size=1),
+                             cache=ConversionCache(memory_bytes=10 ** 7))
+    data = base64.b64encode(document).decode()
+    services.convert(data, out_mime='pdf')
+    services.convert(data, out_mime=['pdf', 'odt'])
+    services.convert(data, out_mime=['odt', 'pdf'])
+    # The second call only exports odt, the third one is answered from the cache
+    assert len(loads) == 2
+    assert services.cache.stats()['hits_memory'] == 3
+
+
+def test_job_result_by_out_mime(services, document):
+    jobs = JobQueue(services)
+    job = jobs.submit_convert(data=base64.b64encode(document).decode(), out_mime=['pdf', 'odt'])
+    deadline = time.time() + 5
+    while jobs.job_status(job['job_id'])['state'] not in ('done', 'failed'):
+        assert time.time() < deadline
+        time.sleep(0.01)
+    chunk = jobs.job_result(job['job_id'], out_mime='odt', length=1 << 20)
+    assert base64.b64decode(chunk['data']) == b'%PDF-1.4\n' + document
+    with pytest.raises(Exception, match='has no doc output'):
+        jobs.job_result(job['job_id'], out_mime='doc')
@@ -0,0 +1,68 @@
+import base64
+import threading
+from time import time
+
+import pytest
+
+from OfficePool import OfficePool
+
+
+def test_lease_distinct_instances():
+    pool = OfficePool(size=2, base_port=3000)
+    with pool.lease() as first, pool.lease() as second:
+        assert first is not second
+        assert {first.port, second.port} == {3000, 3001}
+
+
+def test_lease_waits_for_a_release():
+    pool = OfficePool(size=1)
+    leased = []
+
+    def lease():
+        with pool.lease():
+            leased.append(True)
+    with pool.lease():
+        waiting = threading.Thread(target=lease)
+        waiting.start()
+        waiting.join(0.2)
+        assert not leased
+    waiting.join(1)
+    assert leased
+
+
+def test_needs_one_instance():
+    with pytest.raises(ValueError):
+        OfficePool(size=0)
+
+
+def test_conversions_run_in_parallel(services, document, fake_settings):
+    fake_settings.export_delay = 0.3
+    data = base64.b64encode(document).decode()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(services.convert(data))) for _ in range(2)]
+    start_time = time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # One office each, not one after the other
+    assert time() - start_time < 0.55
+    assert len(results) == 2 and all(base64.b64decode(result).startswith(b'%PDF') for result in results)
+
+
+def test_heavy_lane():
+    pool = OfficePool(size=3, heavy_size=1, heavy_cost=10)
+    assert (pool.lane(9.9), pool.lane(10)) == ('fast', 'heavy')
+    with pool.lease(lane='heavy') as heavy:
+        assert heavy is pool.instances[0]
+        with pool.lease() as first, pool.lease() as second:
+            assert {first, second} == set(pool.instances[1:])
+    stats = pool.stats()['lanes']
+    assert (stats['fast']['instances'], stats['heavy']['instances']) == (2, 1)
+
+
+def test_one_lane_without_heavy_instances():
+    pool = OfficePool(size=2, heavy_cost=10)
+    assert pool.lane(1000) == 'fast'
+    with pytest.raises(ValueError):
+        OfficePool(size=2, heavy_size=2)
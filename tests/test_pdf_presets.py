@@ -0,0 +1,48 @@
+import base64
+
+import pytest
+
+import fakeoffice
+from PdfPresets import PdfPresets, validate
+
+
+def test_validate_names_and_types():
+    assert validate({'Quality': 80, 'UseTaggedPDF': True}) == {'Quality': 80, 'UseTaggedPDF': True}
+    with pytest.raises(ValueError, match='Unknown PDF option'):
+        validate({'Macro': 'x'})
+    with pytest.raises(ValueError, match='must be of type int'):
+        validate({'Quality': True})
+    with pytest.raises(ValueError, match='must be of type bool'):
+        validate({'UseTaggedPDF': 1})
+    with pytest.raises(ValueError):
+        validate(['Quality'])
+
+
+def test_options_override_their_preset():
+    presets = PdfPresets({'screen': {'Quality': 50}, 'draft': {'MaxImageResolution': 75}})
+    assert presets.resolve('screen') == {'Quality': 50}
+    assert presets.resolve('draft', {'Quality': 30}) == {'MaxImageResolution': 75, 'Quality': 30}
+    assert presets.resolve('print', {'Quality': 95})['Quality'] == 95
+    assert presets.resolve() == {}
+    with pytest.raises(ValueError, match='Unknown PDF preset'):
+        presets.resolve('poster')
+    with pytest.raises(ValueError):
+        PdfPresets({'bad': {'Quality': 'high'}})
+
+
+def test_filter_data_reaches_the_export(services, document, monkeypatch):
+    exported = []
+    store = fakeoffice._Document.storeToURL
+
+    def storeToURL(document, url, props):
+        exported.append(fakeoffice._properties(fakeoffice._properties(props).get('FilterData', ())))
+        return store(document, url, props)
+    monkeypatch.setattr(fakeoffice._Document, 'storeToURL', storeToURL)
+    data = base64.b64encode(document).decode()
+    services.convert(data, pdf_preset='screen', pdf_options={'Quality': 60})
+    assert exported[-1] == {'Quality': 60, 'ReduceImageResolution': True, 'MaxImageResolution': 150}
+    # Other exports ignore the PDF options
+    services.convert(data, out_mime='odt', pdf_preset='poster')
+    assert exported[-1] == {}
+    with pytest.raises(ValueError):
+        services.convert(data, pdf_preset='poster')
@@ -0,0 +1,77 @@
+import io
+import zipfile
+
+import pytest
+
+import Preflight
+from Preflight import estimate_cost, estimate_join_cost
+
+
+def _package(content: bytes, pages: int = 0, images: int = 0, styles: bytes = b'<office:document-styles/>') -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as package:
+        package.writestr('content.xml', content)
+        package.writestr('styles.xml', styles)
+        package.writestr('meta.xml', b'<meta:document-statistic meta:page-count="%d"/>' % pages)
+        for index in range(images):
+            package.writestr('Pictures/%s.png' % index, b'png')
+    return buffer.getvalue()
+
+
+def test_cost_of_the_test_document(document):
+    cost = estimate_cost(document)
+    assert cost.entries > 0 and cost.compressed == len(document)
+    assert cost.score >= 1
+
+
+def test_counts_markers_cut_between_blocks(monkeypatch):
+    # Blocks longer than the markers, shorter than the content
+    monkeypatch.setattr(Preflight, 'SCAN_BLOCK_SIZE', 40)
+    content = b'<table:table >' + b'<table:table-row/>' * 5 + b'<table:table >'
+    cost = estimate_cost(_package(content, pages=3, images=2))
+    assert (cost.tables, cost.table_rows, cost.pages, cost.images) == (2, 5, 3, 2)
+
+
+def test_not_a_package():
+    with pytest.raises(zipfile.BadZipFile):
+        estimate_cost(b'not a zip')
+
+
+def test_join_cost_grows_with_parts():
+    assert estimate_join_cost([1024]) < estimate_join_cost([1024, 1024]) < estimate_join_cost([1024, 1024 * 1024])
+
+
+def test_test_document_needs_no_update(document):
+    # It declares the sequences of a text document, without any field
+    cost = estimate_cost(document)
+    assert not (cost.links or cost.fields or cost.indexes)
+
+
+def test_sequence_fields_but_not_their_declarations():
+    declarations = b'<text:sequence-decls><text:sequence-decl text:name="Table"/></text:sequence-decls>'
+    assert not estimate_cost(_package(declarations)).fields
+    assert estimate_cost(_package(declarations + b'<text:sequence text:name="Table">1</text:sequence>')).fields
+    assert estimate_cost(_package(b'<text:sequence-ref text:ref-name="refTable0"/>')).fields
+
+
+def test_plain_document():
+    cost = estimate_cost(_package(b'<office:text><table:table ><table:table-row/></table:table></office:text>'))
+    assert (cost.tables, cost.table_rows) == (1, 1)
+    assert not (cost.links or cost.fields or cost.indexes)
+
+
+def test_elements_across_blocks():
+    # Both the table marker and the field are cut in two by the end of the first block
+    filler = b' ' * (Preflight.SCAN_BLOCK_SIZE - 5)
+    content = filler + b'<table:table ><table:table-row/>' + b' ' * (Preflight.SCAN_BLOCK_SIZE - 32) + b'<text:date/>'
+    cost = estimate_cost(_package(content))
+    assert (cost.tables, cost.table_rows) == (1, 1)
+    assert cost.fields
+    assert not (cost.links or cost.indexes)
+
+
+def test_features_of_styles():
+    styles = b'<style:footer><text:page-count/></style:footer>'
+    cost = estimate_cost(_package(b'<text:table-of-content/>', styles=styles))
+    assert cost.indexes and cost.fields
+    assert not cost.links
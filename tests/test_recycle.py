@@ -0,0 +1,63 @@
+import base64
+import threading
+import time
+
+import fakeoffice
+from AerooServices import AerooServices
+from documents import make_document
+from OfficePool import OfficePool
+from OfficeSupervisor import ProcessUsage, RecyclePolicy
+
+
+def test_recycle_after_the_response(tmp_path):
+    supervisor = fakeoffice.FakeSupervisor(policy=RecyclePolicy(conversions=1))
+    exited = threading.Event()
+    wait_exit = supervisor.wait_exit
+    # The office takes its time to exit
+    supervisor.wait_exit = lambda office, timeout: exited.wait(timeout) and wait_exit(office, timeout)
+    office_pool = OfficePool(supervisor=supervisor)
+    services = AerooServices(spool_directory=str(tmp_path), office_pool=office_pool)
+    data = base64.b64encode(make_document(2000)).decode()
+
+    assert services.convert(data, out_mime='odt')
+    assert office_pool.lanes['fast'].quarantined == 1
+
+    results = []
+    waiting = threading.Thread(target=lambda: results.append(services.convert(data, out_mime='doc')))
+    waiting.start()
+    waiting.join(0.5)
+    # Served by the new process only
+    assert not results
+
+    exited.set()
+    waiting.join(5)
+    assert results
+
+
+def test_policy_reasons():
+    policy = RecyclePolicy(conversions=10, rss=1000, cpu=5, age=60)
+    assert policy.reason(9, None) is None
+    assert policy.reason(10, None) == 'conversions'
+    assert policy.reason(0, ProcessUsage(rss=999, cpu=4.9, uptime=59)) is None
+    assert policy.reason(0, ProcessUsage(rss=1000)) == 'rss'
+    assert policy.reason(0, ProcessUsage(cpu=5)) == 'cpu'
+    assert policy.reason(0, ProcessUsage(uptime=60)) == 'age'
+    assert RecyclePolicy().reason(10 ** 6, ProcessUsage(rss=10 ** 12, cpu=10 ** 6, uptime=10 ** 6)) is None
+
+
+def test_standby_takes_over_a_recycled_process(tmp_path):
+    supervisor = fakeoffice.FakeSupervisor(policy=RecyclePolicy(conversions=2))
+    office_pool = OfficePool(standby=1, supervisor=supervisor)
+    services = AerooServices(spool_directory=str(tmp_path), office_pool=office_pool)
+    office = office_pool.instances[0]
+    deadline = time.time() + 5
+    while not office_pool.standby:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    data = base64.b64encode(make_document(2000)).decode()
+    services.convert(data, out_mime='odt')
+    assert office.process == 0
+    services.convert(data, out_mime='odt')
+    # Swapped at once, the instance never leaves its lane
+    assert office.process == 1 and office_pool.lanes['fast'].quarantined == 0
+    assert office_pool.process_stats() == {'0': {'pid': None, 'conversions': 0}}
@@ -0,0 +1,56 @@
+import base64
+import os
+
+import fakeoffice
+import pytest
+
+
+def _download_all(services, identifier, length):
+    data, offset = b'', 0
+    while True:
+        chunk = services.download(identifier=identifier, offset=offset, length=length)
+        data += base64.b64decode(chunk['data'])
+        offset += length
+        if chunk['is_last']:
+            return data, chunk['size']
+
+
+def _files(directory) -> set:
+    return {os.path.join(root, name) for root, _, names in os.walk(directory) for name in names}
+
+
+def _upload(services, data):
+    return services.upload(data=base64.b64encode(data).decode('utf8'), is_last=True)['identifier']
+
+
+def test_spooled_convert_downloads_in_chunks(services, document):
+    result = services.convert(data=base64.b64encode(document).decode('utf8'), spool=True)
+    data, size = _download_all(services, result['identifier'], 4096)
+    assert data == b'%PDF-1.4\n' + document
+    assert size == result['size'] == len(data)
+
+
+def test_spooled_join_streams_to_the_spool(services, document):
+    result = services.join([_upload(services, document), _upload(services, document)], spool=True)
+    data, size = _download_all(services, result['identifier'], 1000)
+    assert data.startswith(b'%PDF-1.4\n') and size == len(data)
+
+
+def test_failed_export_leaves_no_result(services, document, tmp_path, monkeypatch):
+    idents = [_upload(services, document)]
+    files = _files(tmp_path)
+
+    def fail(self, url, props):
+        fakeoffice._properties(props)['OutputStream'].writeBytes(fakeoffice.ByteSequence(b'%PDF'))
+        raise fakeoffice._UnoException('disk full')
+    monkeypatch.setattr(fakeoffice._Document, 'storeToURL', fail)
+
+    with pytest.raises(Exception, match='disk full'):
+        services.join(idents, spool=True)
+    assert _files(tmp_path) == files
+
+
+def test_download_unknown_identifier(services):
+    from AerooServices import NoidentException
+    with pytest.raises(NoidentException):
+        services.download(identifier='missing')
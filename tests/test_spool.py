@@ -0,0 +1,62 @@
+import base64
+import hashlib
+
+import pytest
+
+from Cleaner import Cleaner
+from Spool import RESULT_PREFIX, Spool, sniff_mime
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return Spool(str(tmp_path), Cleaner(spool_directory=str(tmp_path)))
+
+
+def test_names_are_sharded(spool):
+    name = spool.name('42')
+    digest = hashlib.md5(b'42').hexdigest()
+    assert name == '%s/%s' % (digest[:2], digest)
+    assert spool.name('42', RESULT_PREFIX, partial=True) == '%s/_r%s' % (digest[:2], digest)
+
+
+def test_chunks_cut_inside_a_base64_quantum(spool, document):
+    encoded = base64.b64encode(document).decode()
+    partial, name = spool.name('1', partial=True), spool.name('1')
+    for position in range(0, len(encoded), 1001):
+        spool.append_base64(partial, encoded[position:position + 1001])
+    spool.publish(partial, name)
+    assert spool.read(name) == document
+    meta = spool.meta(name)
+    assert meta['size'] == len(document) and meta['sha256'] == hashlib.sha256(document).hexdigest()
+    assert meta['mime'] == 'application/vnd.oasis.opendocument.text'
+    assert name in spool.cleaner._entries and partial not in spool.cleaner._entries
+
+
+def test_last_chunk_without_padding(spool):
+    partial, name = spool.name('2', partial=True), spool.name('2')
+    spool.append_base64(partial, base64.b64encode(b'abcd').decode().rstrip('='))
+    spool.publish(partial, name)
+    assert spool.read(name) == b'abcd'
+
+
+def test_open_buffer_maps_the_file(spool, document):
+    partial, name = spool.name('3', partial=True), spool.name('3')
+    spool.append_base64(partial, base64.b64encode(document).decode())
+    spool.publish(partial, name)
+    with spool.open_buffer(name) as buffer:
+        assert buffer[:] == document and buffer.seekable()
+
+
+def test_result_is_removed_when_writing_fails(spool, tmp_path):
+    with pytest.raises(OSError):
+        with spool.result() as (identifier, result_file):
+            result_file.write(b'%PDF')
+            raise OSError('disk full')
+    assert not spool.exists(spool.name(identifier, RESULT_PREFIX, partial=True))
+    assert not spool.exists(spool.name(identifier, RESULT_PREFIX))
+
+
+def test_sniff_mime():
+    assert sniff_mime(b'%PDF-1.4') == 'application/pdf'
+    assert sniff_mime(b'PK\x03\x04' + b'\0' * 40) == 'application/zip'
+    assert sniff_mime(b'plain') == 'application/octet-stream'
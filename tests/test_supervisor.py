@@ -0,0 +1,63 @@
+import socket
+import sys
+
+import pytest
+
+import OfficePool as pool_module
+from OfficePool import OfficeInstance
+from OfficeSupervisor import OfficeSupervisor
+
+# Builds a profile with --terminate_after_init, else listens on the port of --accept until killed
+FAKE_SOFFICE = '''#!%s
+import os, re, socket, sys, time
+args = sys.argv[1:]
+profile = [arg for arg in args if arg.startswith('-env:UserInstallation=file://')][0].split('file://', 1)[1]
+if '--terminate_after_init' in args:
+    os.makedirs(profile + '/user')
+    sys.exit(0)
+if os.environ.get('FAKE_SOFFICE_CRASH'):
+    sys.exit(1)
+port = int(re.search(r'port=(\\d+)', [arg for arg in args if arg.startswith('--accept=')][0]).group(1))
+server = socket.create_server(('127.0.0.1', port))
+while True:
+    time.sleep(1)
+''' % sys.executable
+
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+@pytest.fixture
+def supervisor(tmp_path, monkeypatch):
+    monkeypatch.setattr(pool_module, 'PROFILES_DIRECTORY', str(tmp_path))
+    binary = tmp_path / 'soffice'
+    binary.write_text(FAKE_SOFFICE)
+    binary.chmod(0o755)
+    supervisor = OfficeSupervisor(binary=str(binary), template=str(tmp_path / 'template'), start_timeout=10)
+    yield supervisor
+    supervisor.stop_all()
+
+
+def test_start_probe_and_stop(supervisor, tmp_path):
+    office = OfficeInstance(0, host='127.0.0.1', port=free_port())
+    assert not supervisor.running(office) and not supervisor.probe(office)
+    pid = supervisor.start(office)
+    assert pid and supervisor.pid(office) == pid
+    assert supervisor.wait_ready(office)
+    # The profile is a copy of the snapshot built by the first start
+    assert (tmp_path / 'template' / 'user').is_dir() and (tmp_path / '0' / 'user').is_dir()
+    # A restart replaces the process
+    assert supervisor.start(office) != pid and supervisor.wait_ready(office)
+    supervisor.stop(office)
+    assert not supervisor.running(office) and not supervisor.probe(office)
+
+
+def test_process_that_exits_is_not_ready(supervisor, monkeypatch):
+    monkeypatch.setenv('FAKE_SOFFICE_CRASH', '1')
+    office = OfficeInstance(0, host='127.0.0.1', port=free_port())
+    assert supervisor.start(office)
+    assert not supervisor.wait_ready(office)
+    assert not supervisor.running(office)
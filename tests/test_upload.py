@@ -0,0 +1,41 @@
+import base64
+import os
+
+
+def encode(data: bytes) -> str:
+    return base64.b64encode(data).decode()
+
+
+def test_offset_chunks_out_of_order(services):
+    content = os.urandom(10000)
+    result = services.upload(encode(content[7000:]), is_last=True, offset=7000)
+    identifier = result['identifier']
+    assert not result['complete']
+    status = services.upload_status(identifier)
+    assert status['ranges'] == [[7000, 10000]]
+    assert status['missing'] == [[0, 7000]]
+
+    result = services.upload(encode(content[3000:7000]), identifier=identifier, offset=3000)
+    assert not result['complete']
+    assert services.upload_status(identifier)['missing'] == [[0, 3000]]
+
+    result = services.upload(encode(content[:3000]), identifier=identifier, offset=0)
+    assert result['complete']
+    assert services.spool.read(services.spool.name(identifier)) == content
+
+
+def test_offset_chunk_sent_again(services):
+    content = os.urandom(5000)
+    identifier = services.upload(encode(content[:2500]), offset=0)['identifier']
+    services.upload(encode(content[:2500]), identifier=identifier, offset=0)
+    assert services.upload_status(identifier)['ranges'] == [[0, 2500]]
+    assert services.upload(encode(content[2500:]), identifier=identifier, offset=2500, is_last=True)['complete']
+    assert services.spool.read(services.spool.name(identifier)) == content
+
+
+def test_appended_chunks(services):
+    content = os.urandom(6000)
+    identifier = services.upload(encode(content[:3000]))['identifier']
+    assert services.upload_status(identifier)['ranges'] == [[0, 3000]]
+    assert services.upload(encode(content[3000:]), identifier=identifier, is_last=True)['complete']
+    assert services.spool.read(services.spool.name(identifier)) == content
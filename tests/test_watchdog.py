@@ -0,0 +1,64 @@
+import base64
+import threading
+import time
+
+import pytest
+
+import AerooServices as services_module
+import CallWithTimeout
+from CallWithTimeout import TimeoutExeption, Watchdog
+from FairScheduler import FairScheduler
+
+
+def test_result_and_exception():
+    watchdog = Watchdog(workers=1)
+    assert watchdog.callWithTimeout(1, lambda a, b: a + b, (1, 2)) == 3
+    with pytest.raises(ZeroDivisionError):
+        watchdog.callWithTimeout(1, lambda: 1 / 0, ())
+
+
+def test_call_not_started_is_cancelled():
+    watchdog = Watchdog(workers=1)
+    release = threading.Event()
+    blocker = watchdog._executor.submit(release.wait)
+    on_timeout = []
+    with pytest.raises(TimeoutExeption):
+        watchdog.callWithTimeout(0.05, time.sleep, (0,), on_timeout=lambda: on_timeout.append(True))
+    # Nothing ran, there is nothing to kill
+    assert not on_timeout
+    release.set()
+    blocker.result()
+
+
+def test_running_call_is_killed_then_handed_to_on_late(monkeypatch):
+    monkeypatch.setattr(CallWithTimeout, 'UNWIND_GRACE', 0.05)
+    watchdog = Watchdog(workers=1)
+    release = threading.Event()
+    late = []
+    with pytest.raises(TimeoutExeption):
+        watchdog.callWithTimeout(0.05, release.wait, (), on_timeout=lambda: None, on_late=late.append)
+    assert len(late) == 1 and not late[0].done()
+    release.set()
+    late[0].result(1)
+
+
+def test_quarantined_instance_waits_for_reinstate():
+    scheduler = FairScheduler(['office'])
+    with scheduler.lease('a') as instance:
+        scheduler.quarantine(instance)
+    assert scheduler.quarantined == 1
+    ticket = scheduler._enqueue('b')
+    assert not ticket.ready.is_set()
+    scheduler.reinstate(instance)
+    assert ticket.ready.is_set() and scheduler.quarantined == 0
+
+
+def test_hung_conversion_keeps_its_office_out_of_the_pool(services, document, fake_settings, monkeypatch):
+    monkeypatch.setattr(services_module, 'CONVERT_TIMEOUT', 0.1)
+    monkeypatch.setattr(CallWithTimeout, 'UNWIND_GRACE', 0.05)
+    fake_settings.export_delay = 0.5
+    with pytest.raises(Exception, match='cannot be processed'):
+        services.convert(base64.b64encode(document).decode())
+    assert services.queue_stats()['lanes']['fast']['quarantined'] == 1
+    time.sleep(0.6)
+    assert services.queue_stats()['lanes']['fast']['quarantined'] == 0